@@ -6,6 +6,7 @@ import urllib.parse
 import traceback
 import asyncio
 import hmac
+import time
 from pathlib import Path
 from typing import Any, Optional, List, Dict, Union
 from datetime import datetime, timezone, timedelta
@@ -14,7 +15,7 @@ import httpx
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request, Header, HTTPException, Query, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import PlainTextResponse, JSONResponse, StreamingResponse
+from fastapi.responses import PlainTextResponse, JSONResponse, Response, StreamingResponse
 
 
 def _load_env() -> Path:
@@ -37,6 +38,7 @@ ALLOW_ORIGIN = (os.getenv("ALLOW_ORIGIN") or "").strip()
 PANEL_API_KEY = (os.getenv("PANEL_API_KEY") or "").strip()
 MUGO_INTELLIGENCE_WEBHOOK_SECRET = (os.getenv("MUGO_INTELLIGENCE_WEBHOOK_SECRET") or "").strip()
 MUGO_WELCOME_WEBHOOK_SECRET = (os.getenv("MUGO_WELCOME_WEBHOOK_SECRET") or "").strip()
+METRICS_TOKEN = (os.getenv("METRICS_TOKEN") or "").strip()
 
 SUPABASE_URL = (os.getenv("SUPABASE_URL") or "").strip().rstrip("/")
 SUPABASE_SERVICE_ROLE_KEY = (os.getenv("SUPABASE_SERVICE_ROLE_KEY") or "").strip()
@@ -302,6 +304,8 @@ JULIA_HANDOFF_REPLY = build_handoff_lead_reply()
 JULIA_LINK_REPLY = f"Claro. A Julia já recebeu seu contexto. Para falar direto com ela, clique:\n{JULIA_DIRECT_LINK}"
 HANDOFF_FOLLOWUP_MESSAGE = "Oi, passando só para confirmar se você conseguiu falar com a Julia. Se quiser, posso reenviar o link por aqui."
 DEBUG_WEBHOOK = (os.getenv("DEBUG_WEBHOOK") or "").strip().lower() in ("1", "true", "yes")
+# orçamento total do turno de vendas (Supabase + OpenAI); o que sobrar limita a chamada ao modelo
+SALES_TURN_BUDGET_SECONDS = float((os.getenv("SALES_TURN_BUDGET_SECONDS") or "10").strip() or 10)
 
 WA_USERS_TABLE = SUPABASE_TABLE_USERS
 WA_MESSAGES_TABLE = SUPABASE_TABLE_MESSAGES
@@ -333,7 +337,14 @@ from services.state import (
     mark_first_message_sent,
     log_message,
     list_conversations,
+    get_conversation_owner,
+    list_dashboard_rows,
+    list_message_events,
+    get_conversation_snapshot,
+    invalidate_conversation_snapshot,
+    patch_conversation_snapshot,
     get_recent_messages,
+    archive_old_messages,
     get_flow,
     merge_flow_data,
     set_handoff_pending,
@@ -349,11 +360,22 @@ from services.state import (
     normalize_wa_id,
 )
 from services.whatsapp import meta_env_status, send_message, send_message_detailed
-from services.openai_client import generate_reply
+from services.openai_client import close_openai_client, fold_memory_summary, generate_reply, openai_health
 from services.mugo_flow import apply_service_choice, handle_mugo_flow, is_service_choice, service_choice_context
 from services import sales_brain
+from services import sales_router
+from services import reply_cache
+from services import dashboard
+from services import call_budget
+from services import tracing
+from services import log
+from services import loop_watchdog
+from services import profiler
+from services.message_archive import archive_stats
 from services.followup import process_followups
 from services.workspace import build_default_workspace, ensure_default_workspace, resolve_workspace_id
+from services.coalesce import coalesce_stats, forget_results
+from services.auth import SUPABASE_JWT_SECRET, get_user_from_token
 from services.central_attendance import (
     INTELLIGENCE_COMPLETION_HISTORY_EVENT,
     WELCOME_MESSAGE,
@@ -384,6 +406,8 @@ from services.profiles import (
     update_profile,
 )
 
+call_budget.install()
+
 app = FastAPI(title="MugôZap API")
 
 
@@ -397,6 +421,11 @@ async def unhandled_exception_handler(request: Request, exc: Exception):
     return JSONResponse(status_code=500, content={"detail": "Internal Server Error"})
 
 
+@app.on_event("startup")
+async def start_loop_watchdog():
+    loop_watchdog.start()
+
+
 @app.on_event("startup")
 async def startup_check():
     print("BOOT ENV CHECK:")
@@ -404,6 +433,7 @@ async def startup_check():
     print("SUPABASE_URL:", (SUPABASE_URL[:45] + "...") if SUPABASE_URL else "MISSING")
     print("SUPABASE_API_KEY:", (SUPABASE_API_KEY[:10] + "...") if SUPABASE_API_KEY else "MISSING")
     print("PANEL_API_KEY:", PANEL_API_KEY if PANEL_API_KEY else "MISSING")
+    print("SUPABASE_JWT_SECRET:", "present" if SUPABASE_JWT_SECRET else "missing (JWKS ou /auth/v1/user)")
     print("INTERNAL_ALLOWED_DOMAINS:", INTERNAL_ALLOWED_DOMAINS)
     print("DEFAULT_ASSIGNEE:", DEFAULT_ASSIGNEE)
     print("HUMAN_NUMBER:", HUMAN_NUMBER)
@@ -431,6 +461,12 @@ async def startup_check():
     print("DEFAULT_WORKSPACE_READY:", workspace)
 
 
+@app.on_event("shutdown")
+async def shutdown_clients():
+    loop_watchdog.stop()
+    await close_openai_client()
+
+
 ALLOW_ORIGINS: List[str] = [
     "http://localhost:5173",
     "http://127.0.0.1:5173",
@@ -444,6 +480,7 @@ if ALLOW_ORIGIN:
 _seen = set()
 ALLOW_ORIGINS = [o for o in ALLOW_ORIGINS if not (o in _seen or _seen.add(o))]
 
+app.add_middleware(profiler.asgi_middleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=ALLOW_ORIGINS,
@@ -454,30 +491,7 @@ app.add_middleware(
 
 
 async def _supabase_get_user(access_token: str) -> dict:
-    if not SUPABASE_URL or not SUPABASE_API_KEY:
-        raise HTTPException(status_code=500, detail="Supabase env not configured")
-
-    access_token = (access_token or "").strip()
-    if not access_token:
-        raise HTTPException(status_code=401, detail="Missing token")
-
-    try:
-        async with httpx.AsyncClient(timeout=12) as client:
-            resp = await client.get(
-                f"{SUPABASE_URL}/auth/v1/user",
-                headers={
-                    "Authorization": f"Bearer {access_token}",
-                    "apikey": SUPABASE_API_KEY,
-                },
-            )
-    except httpx.HTTPError as e:
-        print("SUPABASE AUTH ERROR:", repr(e))
-        raise HTTPException(status_code=503, detail="Auth service temporarily unavailable")
-
-    if resp.status_code != 200:
-        raise HTTPException(status_code=401, detail="Invalid token")
-
-    return resp.json()
+    return await get_user_from_token(access_token)
 
 
 def _is_allowed_internal_user(user: dict) -> bool:
@@ -616,6 +630,7 @@ def _tag_from_service(value: Any) -> str:
     return f"servico-{slug}" if slug else ""
 
 
+@tracing.traced("conversation_lookup")
 def _find_conversation_by_phone(phone: str, workspace_id: str = "") -> Dict[str, Any] | None:
     target = _normalize_integration_phone(phone)
     if not target:
@@ -690,6 +705,14 @@ def _supabase_upsert_service_row(
 
         if resp.status_code in (200, 201):
             rows = resp.json() or []
+            if table == SUPABASE_TABLE_USERS:
+                patch_conversation_snapshot(str(row_payload.get("workspace_id") or ""), rows[0] if rows else row_payload)
+                dashboard.observe_conversation(
+                    str(row_payload.get("workspace_id") or resolve_workspace_id()),
+                    rows[0] if rows else row_payload,
+                )
+            else:
+                invalidate_conversation_snapshot(str(row_payload.get("workspace_id") or ""))
             return rows[0] if rows else row_payload
 
         last_error = f"{resp.status_code}: {resp.text}"
@@ -962,17 +985,44 @@ def _filter_visible_conversations(items: List[Dict[str, Any]], user: Dict[str, A
     return [item for item in (items or []) if _can_access_conversation(user, item)]
 
 
+def _workspace_conversation_snapshot(workspace_id: str = "") -> Dict[str, Any]:
+    return get_conversation_snapshot(
+        workspace_id,
+        enrich=_enrich_conversation_item,
+        owner_of=_conversation_owner,
+    )
+
+
+def _visible_snapshot_conversations(snapshot: Dict[str, Any], user: Dict[str, Any], limit: int = 0) -> List[Dict[str, Any]]:
+    items = snapshot.get("items") or []
+    if can_manage_all_conversations(user):
+        return items[:limit] if limit else list(items)
+
+    # listagem pode ficar até CONVERSATION_SNAPSHOT_TTL_SECONDS atrás de outro worker; leitura/escrita de uma
+    # conversa passa por _require_conversation_access, que confere o dono no banco
+    owners = snapshot.get("owners") or {}
+    positions = set(snapshot.get("unowned") or [])
+    for name in _actor_names(user):
+        positions.update(owners.get(name) or [])
+    return [items[index] for index in sorted(positions) if not limit or index < limit]
+
+
 def _get_conversation_or_404(wa_id: str, workspace_id: str = "") -> Dict[str, Any]:
     normalized = normalize_wa_id(wa_id)
-    items = list_conversations(limit=500, workspace_id=workspace_id) or []
-    for item in items:
-        if normalize_wa_id(item.get("wa_id")) == normalized:
-            return item
+    item = (_workspace_conversation_snapshot(workspace_id).get("by_wa_id") or {}).get(normalized)
+    if item:
+        return item
     raise HTTPException(status_code=404, detail="Conversation not found")
 
 
 def _require_conversation_access(user: Dict[str, Any], wa_id: str) -> Dict[str, Any]:
     conv = _get_conversation_or_404(wa_id, workspace_id=user.get("workspace_id"))
+    if not can_manage_all_conversations(user):
+        # o snapshot vive alguns segundos por worker; dono atual vem do banco antes de liberar/negar
+        fresh = get_conversation_owner(wa_id, workspace_id=user.get("workspace_id"))
+        if fresh is not None and _conversation_owner(fresh) != _conversation_owner(conv):
+            invalidate_conversation_snapshot(user.get("workspace_id") or "")
+            conv = {**conv, **{key: fresh.get(key) or "" for key in ("assigned_to", "human_owner", "owner")}}
     if not _can_access_conversation(user, conv):
         raise HTTPException(status_code=403, detail="Conversation not available for this user")
     return conv
@@ -1350,7 +1400,8 @@ def _infer_fields_from_text(user_text: str, ai_state: dict | None, result: dict
     state_fields = ((ai_state or {}).get("lead_fields") or {})
     result_fields = ((result or {}).get("lead_fields") or {})
     brain_state = sales_brain.merge_state(sales_brain.flatten_state(ai_state or {}), result_fields)
-    brain_updates = sales_brain.extract_signal_from_message(user_text, brain_state)
+    with tracing.span("signal_extraction"):
+        brain_updates = sales_brain.extract_signal_from_message(user_text, brain_state)
     service_interest = result_fields.get("service_interest") or state_fields.get("service_interest") or (ai_state or {}).get("selected_service")
     last_question_category = (
         result_fields.get("last_question_category")
@@ -1683,8 +1734,8 @@ def _postprocess_ai_result(
     result["lead_fields"] = merged_fields
     result["intent"] = result.get("intent") or brain_state.get("intent") or merged_fields.get("intent") or "outro"
 
-    print(f"AI_CONTEXT_FIELDS_BEFORE cid={cid} wa_id={wa_id} fields={json.dumps(before_fields, ensure_ascii=False)[:900]}")
-    print(f"AI_CONTEXT_FIELDS_AFTER cid={cid} wa_id={wa_id} fields={json.dumps(merged_fields, ensure_ascii=False)[:900]}")
+    log.debug("AI_CONTEXT_FIELDS_BEFORE", cid=cid, wa_id=wa_id, fields=before_fields)
+    log.debug("AI_CONTEXT_FIELDS_AFTER", cid=cid, wa_id=wa_id, fields=merged_fields)
 
     last_question = (
         merged_fields.get("last_question_asked")
@@ -1741,7 +1792,8 @@ def _postprocess_ai_result(
         result["reply"] = reply
         result["next_action"] = "ask_question"
 
-    validation = sales_brain.validate_reply(result.get("reply") or "", brain_state)
+    with tracing.span("validation"):
+        validation = sales_brain.validate_reply(result.get("reply") or "", brain_state)
     if validation.get("blocked"):
         if validation.get("reason") == "forbidden_generic_reply":
             print(f"AI_FORBIDDEN_REPLY_BLOCKED cid={cid} wa_id={wa_id} reply={(result.get('reply') or '')[:240]!r}")
@@ -1950,7 +2002,7 @@ async def _save_ai_result_state(
         "last_user_goal": result.get("memory_goal") or user_text[:180],
         "last_question_asked": (lead_fields.get("last_question_asked") or state.get("last_question_asked") or ""),
         "last_question_category": (lead_fields.get("last_question_category") or state.get("last_question_category") or ""),
-        "memory_summary": result.get("memory_summary") or user_text[:220],
+        "memory_summary": result.get("memory_summary") or fold_memory_summary(state.get("memory_summary"), [user_text[:220]]),
         "memory_theme": result.get("memory_theme") or result.get("lead_theme") or "",
         "memory_goal": result.get("memory_goal") or user_text[:180],
         "memory_notes": (memory_notes + [memory_entry])[-8:],
@@ -1985,6 +2037,7 @@ async def _save_ai_result_state(
         "follow_up": result.get("follow_up") or state.get("follow_up") or {},
         "suggested_tags": result.get("suggested_tags") or state.get("suggested_tags") or [],
         "lead_temperature": result.get("lead_temperature") or state.get("lead_temperature") or "",
+        "conversation_facts": result.get("conversation_facts") or state.get("conversation_facts") or {},
     }
     return await upsert_ai_state(wa_id, merged, workspace_id=workspace_id)
 
@@ -1998,7 +2051,8 @@ async def _prepare_sales_brain_state(
     cid: str = "",
 ) -> dict:
     state = sales_brain.flatten_state(ai_state or {})
-    updates = sales_brain.extract_signal_from_message(user_text, state)
+    with tracing.span("signal_extraction"):
+        updates = sales_brain.extract_signal_from_message(user_text, state)
     state = sales_brain.merge_state(state, updates)
     next_q = sales_brain.get_next_question(state)
     if next_q.get("question"):
@@ -2065,6 +2119,7 @@ def _sales_pipeline_result_from_state(
         "lead_fields": lead_fields,
         "briefing": fields.get("briefing") or {},
         "follow_up": fields.get("follow_up") or {"needed": False, "when": None, "message": None},
+        "conversation_facts": fields.get("conversation_facts") or {},
     }
     if sales_brain.should_offer_meeting(fields):
         result["lead_temperature"] = "hot" if fields.get("urgency") == "alta" or fields.get("handoff") else "warm"
@@ -2115,6 +2170,7 @@ def _force_handoff_lead_reply(result: dict | None) -> dict:
     return result
 
 
+@tracing.traced("sales_pipeline")
 async def process_inbound_sales_message(
     wa_id: str,
     text: str | None = None,
@@ -2128,13 +2184,15 @@ async def process_inbound_sales_message(
     cid: str = "",
 ) -> dict:
     cid = cid or uuid.uuid4().hex[:10]
+    turn_started = time.monotonic()
+    turn_deadline = turn_started + SALES_TURN_BUDGET_SECONDS
     wa_id = normalize_wa_id(wa_id)
     user_text = (text or button_title or list_title or list_description or button_id or list_id or "").strip()
-    print(f"SALES_PIPELINE_START cid={cid} wa_id={wa_id} source={source} text_len={len(user_text)}")
+    log.info("SALES_PIPELINE_START", cid=cid, wa_id=wa_id, source=source, text_len=len(user_text))
 
     raw_state = await get_ai_state(wa_id, workspace_id=workspace_id) or {}
     state_before = sales_brain.flatten_state(raw_state)
-    print(f"SALES_STATE_BEFORE cid={cid} wa_id={wa_id} state={json.dumps(state_before, ensure_ascii=False)[:1400]}")
+    log.debug("SALES_STATE_BEFORE", cid=cid, wa_id=wa_id, state=state_before)
 
     normalized_choice = sales_brain.normalize_inbound_choice(
         text=user_text,
@@ -2145,7 +2203,7 @@ async def process_inbound_sales_message(
         list_description=list_description or "",
         current_state=state_before,
     )
-    print(f"SALES_NORMALIZED_CHOICE cid={cid} wa_id={wa_id} choice={json.dumps(normalized_choice, ensure_ascii=False)[:900]}")
+    log.debug("SALES_NORMALIZED_CHOICE", cid=cid, wa_id=wa_id, choice=normalized_choice)
 
     extracted_signals: dict = {}
     state_after = state_before
@@ -2159,14 +2217,17 @@ async def process_inbound_sales_message(
         )
         state_after = sales_brain.flatten_state(state_after)
         next_question = sales_brain.get_next_question(state_after)
-        print(
-            "BUTTON_FLOW_VALIDATED "
-            f"cid={cid} wa_id={wa_id} choice_id={normalized_choice.get('choice_id') or '-'} "
-            f"service={state_after.get('service_interest') or '-'} "
-            f"category={next_question.get('category') or '-'}"
+        log.info(
+            "BUTTON_FLOW_VALIDATED",
+            cid=cid,
+            wa_id=wa_id,
+            choice_id=normalized_choice.get("choice_id"),
+            service=state_after.get("service_interest"),
+            category=next_question.get("category"),
         )
         reply = (next_question.get("question") or "").strip()
-        validation = sales_brain.validate_final_reply(reply, state_after)
+        with tracing.span("validation"):
+            validation = sales_brain.validate_final_reply(reply, state_after)
         blocked_reason = validation.get("reason") or ""
         if validation.get("blocked"):
             reply = validation.get("reply") or reply
@@ -2209,10 +2270,10 @@ async def process_inbound_sales_message(
             user_text=user_text,
             workspace_id=workspace_id,
         )
-        print(f"SALES_NEXT_QUESTION cid={cid} wa_id={wa_id} next={json.dumps(next_question, ensure_ascii=False)[:700]}")
-        print(f"SALES_REPLY_BEFORE_VALIDATION cid={cid} wa_id={wa_id} reply={reply[:240]!r}")
-        print(f"SALES_REPLY_AFTER_VALIDATION cid={cid} wa_id={wa_id} reply={(result.get('reply') or '')[:240]!r}")
-        print(f"SALES_STATE_SAVED cid={cid} wa_id={wa_id} state={json.dumps(sales_brain.flatten_state(saved_state), ensure_ascii=False)[:1400]}")
+        log.debug("SALES_NEXT_QUESTION", cid=cid, wa_id=wa_id, next=next_question)
+        log.debug("SALES_REPLY_BEFORE_VALIDATION", cid=cid, wa_id=wa_id, reply=reply[:240])
+        log.info("SALES_REPLY_AFTER_VALIDATION", cid=cid, wa_id=wa_id, reply=(result.get("reply") or "")[:240])
+        log.debug("SALES_STATE_SAVED", cid=cid, wa_id=wa_id, state=lambda: sales_brain.flatten_state(saved_state))
         return {
             "ok": True,
             "wa_id": wa_id,
@@ -2227,10 +2288,12 @@ async def process_inbound_sales_message(
             "blocked_reason": blocked_reason,
         }
 
-    extracted_signals = sales_brain.extract_signal_from_message(user_text, state_before)
-    print(f"SALES_EXTRACTED_SIGNALS cid={cid} wa_id={wa_id} signals={json.dumps(extracted_signals, ensure_ascii=False)[:900]}")
+    with tracing.span("signal_extraction"):
+        extracted_signals = sales_brain.extract_signal_from_message(user_text, state_before)
+    log.debug("SALES_EXTRACTED_SIGNALS", cid=cid, wa_id=wa_id, signals=extracted_signals)
     state_after = sales_brain.merge_state(state_before, extracted_signals)
-    print(f"SALES_STATE_AFTER_MERGE cid={cid} wa_id={wa_id} state={json.dumps(state_after, ensure_ascii=False)[:1400]}")
+    # o estado completo já saiu em SALES_STATE_BEFORE; aqui só o que o turno mudou
+    log.debug("SALES_STATE_AFTER_MERGE", cid=cid, wa_id=wa_id, changed=lambda: sales_brain.state_delta(state_before, state_after))
 
     wants_human_handoff = sales_brain.should_handoff(state_after, user_text)
     has_enough_for_handoff = sales_brain.should_handoff_now(state_after, [{"direction": "in", "text": user_text}])
@@ -2252,6 +2315,25 @@ async def process_inbound_sales_message(
     if state_after.get("handoff"):
         deterministic_reply = build_handoff_lead_reply(state_after)
 
+    route = sales_router.decide_route(
+        user_text=user_text,
+        category=state_before.get("last_question_category") or "",
+        interpretation=sales_brain.interpret_user_message(user_text, state_before),
+        extracted_signals=extracted_signals,
+        deterministic_reply=deterministic_reply,
+        state_after=state_after,
+    )
+    log.info(
+        "SALES_ROUTE",
+        cid=cid,
+        wa_id=wa_id,
+        route=route["route"],
+        reason=route["reason"],
+        category=route["category"],
+        confidence=route["confidence"],
+        threshold=route["threshold"],
+    )
+
     ai_result = {}
     used_openai = False
     openai_available = bool((os.getenv("OPENAI_API_KEY") or os.getenv("OPENAI_KEY") or "").strip())
@@ -2272,21 +2354,37 @@ async def process_inbound_sales_message(
             ],
         },
     )
+    reply_cache_key = reply_cache.cache_key(user_text, state_after, next_question) if route["route"] == sales_router.ROUTE_LLM else ""
+    cached_result = reply_cache.get(reply_cache_key)
+    if cached_result:
+        ai_result = cached_result
+        route = {**route, "route": sales_router.ROUTE_CACHE, "reason": "reply_cache"}
+        log.info("SALES_REPLY_CACHE_HIT", cid=cid, wa_id=wa_id, key=reply_cache_key[:60])
+
     try:
-        recent_messages = get_recent_messages(wa_id, limit=12, workspace_id=workspace_id) or []
-        ai_result = await generate_reply(
-            wa_id=wa_id,
-            user_message=user_text,
-            first_message_sent=True,
-            recent_messages=recent_messages,
-            lead_context=ai_context,
-        )
-        used_openai = openai_available and not bool(ai_result.get("fallback"))
-        if ai_result.get("fallback"):
-            print(f"SALES_PIPELINE_OPENAI_FALLBACK cid={cid} wa_id={wa_id} using=deterministic_reply")
-            print(f"OPENAI_TIMEOUT_SAFE_FALLBACK cid={cid} wa_id={wa_id} category={next_question.get('category') or '-'}")
+        if route["route"] == sales_router.ROUTE_LLM:
+            recent_messages = get_recent_messages(wa_id, limit=12, workspace_id=workspace_id) or []
+            ai_result = await generate_reply(
+                wa_id=wa_id,
+                user_message=user_text,
+                first_message_sent=True,
+                recent_messages=recent_messages,
+                lead_context=ai_context,
+                deadline=turn_deadline,
+                workspace_id=workspace_id,
+            )
+            used_openai = openai_available and not bool(ai_result.get("fallback"))
+            if used_openai and reply_cache_key:
+                reply_cache.put(
+                    reply_cache_key,
+                    ai_result,
+                    personal_terms=[state_after.get("name") or "", state_after.get("business_name") or "", wa_id],
+                )
+            if ai_result.get("fallback"):
+                log.warning("SALES_PIPELINE_OPENAI_FALLBACK", cid=cid, wa_id=wa_id, using="deterministic_reply")
+                log.warning("OPENAI_TIMEOUT_SAFE_FALLBACK", cid=cid, wa_id=wa_id, category=next_question.get("category"))
     except Exception as e:
-        print(f"SALES_PIPELINE_OPENAI_ERROR cid={cid} wa_id={wa_id} error={repr(e)}")
+        log.error("SALES_PIPELINE_OPENAI_ERROR", cid=cid, wa_id=wa_id, error=repr(e))
         ai_result = {}
         used_openai = False
 
@@ -2330,9 +2428,10 @@ async def process_inbound_sales_message(
     else:
         reply = ((None if ai_result.get("fallback") else ai_result.get("reply")) or deterministic_reply or next_question.get("question") or "").strip()
 
-    validation = sales_brain.validate_final_reply(reply, state_after)
+    with tracing.span("validation"):
+        validation = sales_brain.validate_final_reply(reply, state_after)
     blocked_reason = validation.get("reason") or ""
-    print(f"SALES_REPLY_BEFORE_VALIDATION cid={cid} wa_id={wa_id} reply={reply[:240]!r}")
+    log.debug("SALES_REPLY_BEFORE_VALIDATION", cid=cid, wa_id=wa_id, reply=reply[:240])
     if validation.get("blocked"):
         replacement_next = {
             "category": validation.get("category") or next_question.get("category"),
@@ -2380,6 +2479,7 @@ async def process_inbound_sales_message(
             key: ai_result.get(key)
             for key in ["suggested_tags", "follow_up", "memory_summary", "memory_theme", "memory_goal", "lead_theme", "lead_score"]
             if ai_result.get(key) not in (None, "", [], {})
+            and not (key == "memory_summary" and ai_result.get("fallback"))
         }
     )
     result["reply"] = reply
@@ -2425,9 +2525,12 @@ async def process_inbound_sales_message(
         user_text=user_text,
         workspace_id=workspace_id,
     )
-    print(f"SALES_NEXT_QUESTION cid={cid} wa_id={wa_id} next={json.dumps(next_question, ensure_ascii=False)[:700]}")
-    print(f"SALES_REPLY_AFTER_VALIDATION cid={cid} wa_id={wa_id} reply={(result.get('reply') or '')[:240]!r}")
-    print(f"SALES_STATE_SAVED cid={cid} wa_id={wa_id} state={json.dumps(sales_brain.flatten_state(saved_state), ensure_ascii=False)[:1400]}")
+    log.debug("SALES_NEXT_QUESTION", cid=cid, wa_id=wa_id, next=next_question)
+    log.info("SALES_REPLY_AFTER_VALIDATION", cid=cid, wa_id=wa_id, reply=(result.get("reply") or "")[:240])
+    log.debug("SALES_STATE_SAVED", cid=cid, wa_id=wa_id, state=lambda: sales_brain.flatten_state(saved_state))
+    turn_ms = (time.monotonic() - turn_started) * 1000
+    sales_router.record_route(route, turn_ms)
+    log.info("SALES_ROUTE_DONE", cid=cid, wa_id=wa_id, route=route["route"], used_openai=used_openai, ms=int(turn_ms))
     return {
         "ok": True,
         "wa_id": wa_id,
@@ -2439,6 +2542,7 @@ async def process_inbound_sales_message(
         "next_question": next_question,
         "result": result,
         "used_openai": used_openai,
+        "route": route,
         "blocked_reason": blocked_reason,
     }
 
@@ -2652,38 +2756,7 @@ def _infer_attendance_mode(source: str, campaign: str) -> str:
 
 
 def _resolve_operation_status(user: dict | None) -> str:
-    user = user or {}
-
-    flow_data = user.get("flow_data") or {}
-    if isinstance(flow_data, str):
-        try:
-            flow_data = json.loads(flow_data)
-        except Exception:
-            flow_data = {}
-
-    flow_status = str((flow_data or {}).get("bot_status") or "").strip().lower()
-    attendance_mode = ((user.get("attendance_mode") or "")).strip().lower()
-    automation_paused = bool(user.get("automation_paused"))
-    bot_enabled = bool(user.get("bot_enabled", True))
-    handoff_active = bool(user.get("handoff_active"))
-    handoff_at = (user.get("handoff_at") or "").strip()
-
-    if flow_status in {"bot_active", "ai_active", "human_active", "handoff_pending", "handoff_active", "paused", "followup_scheduled", "resume_ready", "closed"}:
-        return flow_status
-
-    if handoff_active or handoff_at:
-        return "handoff"
-
-    if attendance_mode == "human":
-        return "human_active"
-
-    if automation_paused:
-        return "automation_paused"
-
-    if bot_enabled:
-        return "bot_active"
-
-    return "manual"
+    return dashboard.operation_status(user)
 
 
 def _enrich_conversation_item(item: dict | None) -> dict:
@@ -2696,6 +2769,7 @@ def _enrich_conversation_items(items: List[dict]) -> List[dict]:
     return [_enrich_conversation_item(item) for item in (items or [])]
 
 
+@tracing.traced("dedupe")
 async def _dedupe_incoming(wa_id: str, message_id: str, cid: str, workspace_id: str = "") -> bool:
     if not wa_id or not message_id:
         return False
@@ -3001,6 +3075,9 @@ async def delete_conversation_bundle(wa_id: str, deleted_by: str = "", workspace
         except Exception as e:
             errors[label] = str(e)
 
+    invalidate_conversation_snapshot(workspace_id)
+    forget_results()
+    dashboard.forget_conversation(workspace_id, wa_id)
     return {
         "wa_id": wa_id,
         "workspace_id": workspace_id,
@@ -3021,6 +3098,28 @@ def health():
     }
 
 
+@app.get("/metrics")
+def metrics(authorization: str = Header(None)):
+    # formato texto do Prometheus; métricas são por processo (cada worker expõe as suas)
+    # sem METRICS_TOKEN o endpoint fica desligado: nada de expor contadores internos sem autenticação
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(str(authorization or ""), f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    body = tracing.render_prometheus() + tracing.render_counter(
+        "mugo_outbound_http_requests_total",
+        "Chamadas HTTP de saída por destino.",
+        "target",
+        call_budget.call_budget_stats(0)["totals"],
+    ) + loop_watchdog.render_prometheus() + tracing.render_counter(
+        "mugo_log_events_total",
+        "Eventos de log emitidos, abaixo do nível, amostrados fora e descartados.",
+        "outcome",
+        {key: value for key, value in log.log_stats().items() if key in {"emitted", "below_level", "sampled_out", "dropped"}},
+    )
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+
 @app.get("/api/me")
 async def api_me(
     authorization: str = Header(None),
@@ -3144,6 +3243,183 @@ async def api_debug_meta_env(
     }
 
 
+@app.get("/api/debug/coalescing")
+async def api_debug_coalescing(
+    authorization: str = Header(None),
+    x_panel_key: str = Header(None, alias="X-Panel-Key"),
+    x_workspace_id: str = Header(None, alias="X-Workspace-Id"),
+):
+    user = await get_current_user(
+        authorization=authorization,
+        x_panel_key=x_panel_key,
+        x_workspace_id=x_workspace_id,
+    )
+    _require_role(user, {ROLE_ADMIN})
+    return {"ok": True, "coalescing": coalesce_stats()}
+
+
+@app.get("/api/debug/call-budget")
+async def api_debug_call_budget(
+    limit: int = Query(20, ge=0, le=200),
+    authorization: str = Header(None),
+    x_panel_key: str = Header(None, alias="X-Panel-Key"),
+    x_workspace_id: str = Header(None, alias="X-Workspace-Id"),
+):
+    user = await get_current_user(
+        authorization=authorization,
+        x_panel_key=x_panel_key,
+        x_workspace_id=x_workspace_id,
+    )
+    _require_role(user, {ROLE_ADMIN})
+    return {"ok": True, "call_budget": call_budget.call_budget_stats(limit)}
+
+
+@app.get("/api/debug/loop-stalls")
+async def api_debug_loop_stalls(
+    limit: int = Query(20, ge=0, le=100),
+    authorization: str = Header(None),
+    x_panel_key: str = Header(None, alias="X-Panel-Key"),
+    x_workspace_id: str = Header(None, alias="X-Workspace-Id"),
+):
+    user = await get_current_user(
+        authorization=authorization,
+        x_panel_key=x_panel_key,
+        x_workspace_id=x_workspace_id,
+    )
+    _require_role(user, {ROLE_ADMIN})
+    return {"ok": True, "loop_watchdog": loop_watchdog.loop_watchdog_stats(limit)}
+
+
+@app.get("/api/debug/profile")
+async def api_debug_profile(
+    seconds: float = Query(10, gt=0, le=profiler.PROFILE_MAX_SECONDS),
+    interval_ms: int = Query(5, ge=1, le=1000),
+    include_idle: bool = Query(False),
+    authorization: str = Header(None),
+    x_panel_key: str = Header(None, alias="X-Panel-Key"),
+    x_workspace_id: str = Header(None, alias="X-Workspace-Id"),
+):
+    user = await get_current_user(
+        authorization=authorization,
+        x_panel_key=x_panel_key,
+        x_workspace_id=x_workspace_id,
+    )
+    _require_role(user, {ROLE_ADMIN})
+    # amostra este worker; a espera fica numa thread para o loop continuar atendendo o tráfego real
+    try:
+        result = await asyncio.to_thread(profiler.sample_stacks, seconds, interval_ms, include_idle)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    filename = f"profile-{os.getpid()}-{int(time.time())}.collapsed"
+    return PlainTextResponse(
+        result["collapsed"],
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Profile-Samples": str(result["samples"]),
+            "X-Profile-Idle-Skipped": str(result["idle_skipped"]),
+        },
+    )
+
+
+@app.get("/api/debug/profile/requests")
+async def api_debug_profile_sessions(
+    authorization: str = Header(None),
+    x_panel_key: str = Header(None, alias="X-Panel-Key"),
+    x_workspace_id: str = Header(None, alias="X-Workspace-Id"),
+):
+    user = await get_current_user(
+        authorization=authorization,
+        x_panel_key=x_panel_key,
+        x_workspace_id=x_workspace_id,
+    )
+    _require_role(user, {ROLE_ADMIN})
+    return {"ok": True, "profiler": profiler.profiler_stats()}
+
+
+@app.post("/api/debug/profile/requests")
+async def api_debug_profile_arm(
+    count: int = Query(20, ge=1, le=500),
+    path: str = Query(""),
+    ttl_seconds: int = Query(600, ge=10, le=3600),
+    authorization: str = Header(None),
+    x_panel_key: str = Header(None, alias="X-Panel-Key"),
+    x_workspace_id: str = Header(None, alias="X-Workspace-Id"),
+):
+    user = await get_current_user(
+        authorization=authorization,
+        x_panel_key=x_panel_key,
+        x_workspace_id=x_workspace_id,
+    )
+    _require_role(user, {ROLE_ADMIN})
+    try:
+        session = profiler.arm_session(count=count, path=path, ttl_seconds=ttl_seconds)
+    except RuntimeError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    return {"ok": True, "session": session}
+
+
+@app.get("/api/debug/profile/requests/{token}")
+async def api_debug_profile_result(
+    token: str,
+    format: str = Query("pstats", pattern="^(pstats|text)$"),
+    limit: int = Query(60, ge=1, le=500),
+    sort: str = Query("cumulative", pattern="^(cumulative|tottime|calls|ncalls)$"),
+    authorization: str = Header(None),
+    x_panel_key: str = Header(None, alias="X-Panel-Key"),
+    x_workspace_id: str = Header(None, alias="X-Workspace-Id"),
+):
+    user = await get_current_user(
+        authorization=authorization,
+        x_panel_key=x_panel_key,
+        x_workspace_id=x_workspace_id,
+    )
+    _require_role(user, {ROLE_ADMIN})
+    result = profiler.session_result(token, fmt=format, limit=limit, sort=sort)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Profile session not found")
+    headers = {"X-Profile-Requests": str(result["profiled"]), "X-Profile-Remaining": str(result["remaining"])}
+    if format == "text":
+        return PlainTextResponse(result["body"], headers=headers)
+    headers["Content-Disposition"] = f'attachment; filename="profile-{os.getpid()}-{token[:8]}.pstats"'
+    return Response(result["body"], media_type="application/octet-stream", headers=headers)
+
+
+@app.delete("/api/debug/profile/requests/{token}")
+async def api_debug_profile_close(
+    token: str,
+    authorization: str = Header(None),
+    x_panel_key: str = Header(None, alias="X-Panel-Key"),
+    x_workspace_id: str = Header(None, alias="X-Workspace-Id"),
+):
+    user = await get_current_user(
+        authorization=authorization,
+        x_panel_key=x_panel_key,
+        x_workspace_id=x_workspace_id,
+    )
+    _require_role(user, {ROLE_ADMIN})
+    return {"ok": profiler.close_session(token)}
+
+
+@app.get("/api/debug/openai")
+async def api_debug_openai(
+    authorization: str = Header(None),
+    x_panel_key: str = Header(None, alias="X-Panel-Key"),
+    x_workspace_id: str = Header(None, alias="X-Workspace-Id"),
+):
+    user = await get_current_user(
+        authorization=authorization,
+        x_panel_key=x_panel_key,
+        x_workspace_id=x_workspace_id,
+    )
+    _require_role(user, {ROLE_ADMIN})
+    return {
+        "ok": True,
+        "openai": openai_health(),
+        "routing": sales_router.route_stats(),
+        "reply_cache": reply_cache.reply_cache_stats(),
+    }
+
+
 @app.post("/api/debug/send-test-whatsapp/{wa_id}")
 async def api_debug_send_test_whatsapp(
     wa_id: str,
@@ -3177,6 +3453,28 @@ async def api_debug_send_test_whatsapp(
         }
 
 
+@app.post("/api/jobs/archive-messages")
+async def api_jobs_archive_messages(
+    older_than_days: int = Query(0),
+    authorization: str = Header(None),
+    x_panel_key: str = Header(None, alias="X-Panel-Key"),
+    x_workspace_id: str = Header(None, alias="X-Workspace-Id"),
+):
+    user = await get_current_user(
+        authorization=authorization,
+        x_panel_key=x_panel_key,
+        x_workspace_id=x_workspace_id,
+    )
+    _require_role(user, {ROLE_ADMIN})
+    workspace_id = user.get("workspace_id") or resolve_workspace_id()
+    result = await asyncio.to_thread(
+        archive_old_messages,
+        workspace_id,
+        older_than_days or None,
+    )
+    return {"ok": not result.get("errors"), **result, "archive": archive_stats(workspace_id)}
+
+
 @app.post("/api/jobs/run-followups")
 async def api_jobs_run_followups(
     authorization: str = Header(None),
@@ -3253,8 +3551,7 @@ async def api_debug_lead_state(
     ai_state = await get_ai_state(wa_id, workspace_id=workspace_id)
     flat_state = sales_brain.flatten_state(ai_state)
     messages = get_recent_messages(wa_id, limit=20, workspace_id=workspace_id) or []
-    conversations = list_conversations(limit=500, workspace_id=workspace_id) or []
-    lead_row = next((item for item in conversations if str(item.get("wa_id") or "") == str(wa_id)), {})
+    lead_row = (_workspace_conversation_snapshot(workspace_id).get("by_wa_id") or {}).get(wa_id) or {}
 
     return {
         "ok": True,
@@ -3482,8 +3779,8 @@ async def api_conversations(
         x_panel_key=x_panel_key,
         x_workspace_id=x_workspace_id,
     )
-    items = list_conversations(limit=200, workspace_id=user.get("workspace_id")) or []
-    enriched = _filter_visible_conversations(_enrich_conversation_items(items), user)
+    snapshot = await asyncio.to_thread(_workspace_conversation_snapshot, user.get("workspace_id"))
+    enriched = _visible_snapshot_conversations(snapshot, user, limit=200)
     return {"ok": True, "items": enriched}
 
 
@@ -3519,6 +3816,7 @@ async def api_delete_conversation(
 async def api_messages(
     wa_id: str = Query(...),
     limit: int = Query(40),
+    before: str = Query(""),
     authorization: str = Header(None),
     x_panel_key: str = Header(None, alias="X-Panel-Key"),
     x_workspace_id: str = Header(None, alias="X-Workspace-Id"),
@@ -3529,7 +3827,7 @@ async def api_messages(
         x_workspace_id=x_workspace_id,
     )
     _require_conversation_access(user, wa_id)
-    msgs = get_recent_messages(wa_id, limit=int(limit), workspace_id=user.get("workspace_id")) or []
+    msgs = get_recent_messages(wa_id, limit=int(limit), workspace_id=user.get("workspace_id"), before=before) or []
     print(
         "API_MESSAGES:",
         json.dumps(
@@ -3537,6 +3835,7 @@ async def api_messages(
                 "wa_id": wa_id,
                 "workspace_id": user.get("workspace_id"),
                 "limit": int(limit),
+                "before": before or None,
                 "count": len(msgs),
                 "last_created_at": (msgs[-1].get("created_at") if msgs else None),
             },
@@ -4424,6 +4723,15 @@ async def api_send_collection_reminder(
     return {"ok": ok, "message": message}
 
 
+def _seed_dashboard_counters(workspace_id: str) -> None:
+    dashboard.seed_workspace(
+        workspace_id,
+        lambda limit: list_dashboard_rows(limit=limit, workspace_id=workspace_id),
+        lambda limit: list_tasks(status="open", limit=limit, workspace_id=workspace_id) or [],
+        lambda since, limit: list_message_events(since, limit=limit, workspace_id=workspace_id),
+    )
+
+
 @app.get("/api/dashboard/summary")
 async def api_dashboard_summary(
     authorization: str = Header(None),
@@ -4435,68 +4743,18 @@ async def api_dashboard_summary(
         x_panel_key=x_panel_key,
         x_workspace_id=x_workspace_id,
     )
-    workspace_id = user.get("workspace_id")
-
-    items = _filter_visible_conversations(
-        _enrich_conversation_items(list_conversations(limit=500, workspace_id=workspace_id) or []),
-        user,
-    )
-    tasks = list_tasks(status="open", limit=500, workspace_id=workspace_id) or []
-
-    now_iso = datetime.now(timezone.utc).isoformat()
+    workspace_id = resolve_workspace_id(explicit_workspace_id=user.get("workspace_id"))
 
-    leads_by_source: Dict[str, int] = {}
-    leads_by_entry_type: Dict[str, int] = {}
-    leads_by_status: Dict[str, int] = {}
-    handoffs_pending = 0
-    conversations_open = 0
-    waiting_human = 0
-    bot_active = 0
-    paused_automation = 0
-    urgent_tasks = 0
-
-    for item in items:
-        row = item or {}
-        source = ((row.get("source") or row.get("last_source") or "sem_origem")).strip() or "sem_origem"
-        entry_type = ((row.get("entry_type") or row.get("inbound_type") or "unknown")).strip() or "unknown"
-        status = (row.get("operation_status") or "manual").strip()
-
-        leads_by_source[source] = leads_by_source.get(source, 0) + 1
-        leads_by_entry_type[entry_type] = leads_by_entry_type.get(entry_type, 0) + 1
-        leads_by_status[status] = leads_by_status.get(status, 0) + 1
-
-        if status in {"handoff", "handoff_pending", "handoff_active"}:
-            handoffs_pending += 1
-
-        if status == "human_active":
-            waiting_human += 1
-
-        if status in {"bot_active", "ai_active", "resume_ready"}:
-            bot_active += 1
-
-        if status in {"automation_paused", "paused"}:
-            paused_automation += 1
-
-        conversations_open += 1
-
-    for task in tasks:
-        due_at = (task.get("due_at") or "").strip()
-        if due_at and due_at <= now_iso:
-            urgent_tasks += 1
+    if dashboard.needs_seed(workspace_id):
+        await asyncio.to_thread(_seed_dashboard_counters, workspace_id)
+    elif dashboard.is_stale(workspace_id):
+        asyncio.get_running_loop().run_in_executor(None, _seed_dashboard_counters, workspace_id)
 
+    owners = None if can_manage_all_conversations(user) else _actor_names(user)
     return {
         "ok": True,
-        "summary": {
-            "conversations_open": conversations_open,
-            "handoffs_pending": handoffs_pending,
-            "waiting_human": waiting_human,
-            "bot_active": bot_active,
-            "paused_automation": paused_automation,
-            "urgent_tasks": urgent_tasks,
-            "leads_by_source": leads_by_source,
-            "leads_by_entry_type": leads_by_entry_type,
-            "leads_by_status": leads_by_status,
-        },
+        "summary": dashboard.summary(workspace_id, owners=owners),
+        "trends": dashboard.trends(workspace_id),
     }
 
 
@@ -4541,8 +4799,8 @@ async def sse_events(token: str = Query(""), workspace_id: str = Query("")):
 
         while True:
             try:
-                items = list_conversations(limit=200, workspace_id=resolved_workspace_id) or []
-                enriched = _filter_visible_conversations(_enrich_conversation_items(items), internal_user)
+                snapshot = await asyncio.to_thread(_workspace_conversation_snapshot, resolved_workspace_id)
+                enriched = _visible_snapshot_conversations(snapshot, internal_user, limit=200)
                 payload = json.dumps({"type": "conversations", "items": enriched}, ensure_ascii=False)
                 yield f"event: conversations\ndata: {payload}\n\n"
             except Exception as e:
@@ -4825,6 +5083,11 @@ async def receive_webhook(request: Request, background_tasks: BackgroundTasks):
 
 
 async def _process_webhook_payload(data: dict, cid: str):
+    with call_budget.track(cid, source="webhook"), tracing.trace(cid), log.context(cid=cid):
+        await _process_webhook_message(data, cid)
+
+
+async def _process_webhook_message(data: dict, cid: str):
     if DEBUG_WEBHOOK:
         print(f"[{cid}] INCOMING RAW:", _j(data)[:3000])
 
@@ -4847,6 +5110,8 @@ async def _process_webhook_payload(data: dict, cid: str):
             return
 
         workspace_id = resolve_workspace_id()
+        tracing.set_workspace(workspace_id)
+        log.bind(workspace_id=workspace_id)
         msg = messages[0] or {}
         contacts = value.get("contacts", [{}]) or [{}]
         inbound_wa_id_raw, wa_id = _extract_inbound_wa_id(msg, contacts)
@@ -4854,6 +5119,7 @@ async def _process_webhook_payload(data: dict, cid: str):
         print(f"INBOUND_WA_ID_NORMALIZED: {wa_id}")
         if not wa_id:
             return
+        log.bind(wa_id=wa_id)
 
         message_id = (msg.get("id") or "").strip()
 
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import sys
+import time
+import argparse
+import contextlib
+import io
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from services import keyword_matcher, sales_brain  # noqa: E402
+
+SAMPLE_MESSAGES = [
+    "oi",
+    "quero um site novo para minha empresa",
+    "preciso melhorar a landing page que já existe, está lenta e não converte",
+    "meu atendimento no whatsapp está uma bagunça, quero automatizar",
+    "a gente recebe lead pelo instagram e pelo site, mas perde muita coisa",
+    "queremos usar ia no negócio para atender clientes e organizar processos",
+    "hoje anunciamos no meta ads mas o custo por lead subiu muito",
+    "quero reposicionar a marca e cuidar da identidade visual",
+    "é urgente, precisamos disso essa semana",
+    "não tenho muito orçamento agora, é caro?",
+    "quero falar com a julia",
+    "2",
+    "pelos 3",
+    "vendo cursos online e quero vender mais",
+    "temos um e-commerce de roupas femininas e o site está desatualizado",
+]
+
+
+def legacy_has_any(text: str, terms: list[str]) -> bool:
+    return any(term in text for term in terms)
+
+
+def run(messages: list[str], rounds: int) -> float:
+    state = sales_brain.default_lead_state()
+    # os logs SALES_BRAIN_* iriam dominar a medição
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            for message in messages:
+                sales_brain.extract_signal_from_message(message, state)
+        return (time.perf_counter() - started) / (rounds * len(messages))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compara o matcher compilado com a varredura _has_any antiga.")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    compiled_has_any = sales_brain._has_any
+    messages = [sales_brain.normalize_text(message) for message in SAMPLE_MESSAGES] + SAMPLE_MESSAGES
+
+    vocabularies = [list(terms) for terms in keyword_matcher._LISTS]
+    unregistered = sum(1 for terms in vocabularies if not keyword_matcher.is_registered(terms))
+    mismatches = 0
+    for text in messages:
+        for terms in vocabularies:
+            mismatches += int(keyword_matcher.has_any(text, terms) != legacy_has_any(text, terms))
+
+    checks = len(messages) * len(vocabularies) * args.rounds
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        for text in messages:
+            for terms in vocabularies:
+                legacy_has_any(text, terms)
+    legacy_check = (time.perf_counter() - started) / checks
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        for text in messages:
+            for terms in vocabularies:
+                keyword_matcher.has_any(text, terms)
+    compiled_check = (time.perf_counter() - started) / checks
+
+    run(messages, 5)
+    compiled = run(messages, args.rounds)
+    sales_brain._has_any = legacy_has_any
+    try:
+        run(messages, 5)
+        legacy = run(messages, args.rounds)
+    finally:
+        sales_brain._has_any = compiled_has_any
+
+    print(f"messages={len(messages)} rounds={args.rounds} vocabulary={keyword_matcher.stats()}")
+    print(f"extract_signal_from_message legacy_us={legacy * 1e6:.1f} compiled_us={compiled * 1e6:.1f} speedup={legacy / compiled:.2f}x")
+    print(f"keyword_check legacy_ns={legacy_check * 1e9:.0f} compiled_ns={compiled_check * 1e9:.0f} speedup={legacy_check / compiled_check:.2f}x")
+    print(f"equivalence_mismatches={mismatches} unregistered_lists={unregistered}")
+    return 1 if mismatches or unregistered else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,264 @@
+from __future__ import annotations
+
+import io
+import sys
+import json
+import time
+import asyncio
+import argparse
+import contextlib
+import functools
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from services import sales_brain  # noqa: E402
+from scripts import validate_sales_flow  # noqa: E402
+
+DEFAULT_BASELINE = ROOT / "data" / "bench_sales_baseline.json"
+
+# estágios medidos (tempo inclusivo: chamadas aninhadas contam também no estágio de fora)
+STAGES = [
+    "normalize_inbound_choice",
+    "extract_signal_from_message",
+    "interpret_user_message",
+    "merge_state",
+    "flatten_state",
+    "get_next_question",
+    "validate_final_reply",
+    "should_handoff_now",
+    "build_internal_briefing",
+]
+
+# conversa longa sintética: cada lead percorre o roteiro inteiro
+LONG_CONVERSATION = [
+    "oi",
+    "2",
+    "pelo whatsapp e instagram",
+    "hoje é tudo manual, a equipe responde no celular",
+    "quero vender mais e parar de perder lead",
+    "chegam uns 80 leads por semana",
+    "o maior gargalo é a demora pra responder",
+    "não usamos crm, fica tudo no whatsapp",
+    "temos uma loja de roupas femininas e vendemos pelo site também",
+    "o site está lento e não converte",
+    "queria resolver isso esse mês",
+    "tenho verba para investir",
+    "quero falar com a julia",
+]
+
+
+def _timed(name: str, fn, stats: dict):
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            entry = stats.setdefault(name, [0, 0.0])
+            entry[0] += 1
+            entry[1] += time.perf_counter() - started
+
+    return wrapper
+
+
+@contextlib.contextmanager
+def instrument(stats: dict):
+    # as chamadas internas do sales_brain resolvem pelo globals do módulo, então o patch pega o pipeline inteiro
+    originals = {name: getattr(sales_brain, name) for name in STAGES}
+    for name, fn in originals.items():
+        setattr(sales_brain, name, _timed(name, fn, stats))
+    try:
+        yield
+    finally:
+        for name, fn in originals.items():
+            setattr(sales_brain, name, fn)
+
+
+def scenario_tests() -> list:
+    return [
+        (name[5:], fn)
+        for name, fn in vars(validate_sales_flow).items()
+        if name.startswith("test_") and callable(fn)
+    ]
+
+
+def run_scenarios() -> int:
+    ran = 0
+    for name, fn in scenario_tests():
+        try:
+            fn()
+        except Exception as exc:
+            raise SystemExit(f"BENCH_SCENARIO_FAILED name={name} error={exc!r}")
+        ran += 1
+    return ran
+
+
+def run_synthetic(leads: int) -> int:
+    messages = 0
+    for index in range(leads):
+        store: dict = {}
+        wa_id = f"55119{index:08d}"
+        for message in LONG_CONVERSATION:
+            validate_sales_flow.persisted_pipeline_step(store, wa_id, message=message)
+            messages += 1
+    return messages
+
+
+def run_app(leads: int) -> int:
+    # process_inbound_sales_message de ponta a ponta com Supabase, histórico e OpenAI trocados por fakes em memória
+    import app
+    from services import openai_client
+
+    states: dict = {}
+    history: dict = {}
+
+    async def fake_get_ai_state(wa_id, workspace_id=""):
+        return dict(states.get(wa_id) or {})
+
+    async def fake_upsert_ai_state(wa_id, state, workspace_id=""):
+        states[wa_id] = dict(state or {})
+        return states[wa_id]
+
+    def fake_get_recent_messages(wa_id, limit=20, workspace_id=""):
+        return list(history.get(wa_id, []))[-limit:]
+
+    async def fake_generate_reply(user_message="", **kwargs):
+        return {**openai_client._fallback(user_message), "fallback": False}
+
+    patched = {
+        "get_ai_state": fake_get_ai_state,
+        "upsert_ai_state": fake_upsert_ai_state,
+        "get_recent_messages": fake_get_recent_messages,
+        "generate_reply": fake_generate_reply,
+    }
+    originals = {name: getattr(app, name) for name in patched}
+    for name, fn in patched.items():
+        setattr(app, name, fn)
+
+    async def conversation(index: int) -> int:
+        wa_id = f"55219{index:08d}"
+        for message in LONG_CONVERSATION:
+            history.setdefault(wa_id, []).append({"direction": "in", "text": message})
+            result = await app.process_inbound_sales_message(wa_id, text=message, source="bench")
+            history[wa_id].append({"direction": "out", "text": (result or {}).get("reply") or ""})
+        return len(LONG_CONVERSATION)
+
+    async def run_all() -> int:
+        return sum(await asyncio.gather(*(conversation(index) for index in range(leads))))
+
+    try:
+        return asyncio.run(run_all())
+    finally:
+        for name, fn in originals.items():
+            setattr(app, name, fn)
+
+
+def measure(label: str, fn, *args) -> dict:
+    stats: dict = {}
+    with contextlib.redirect_stdout(io.StringIO()), instrument(stats):
+        cpu_started = time.process_time()
+        wall_started = time.perf_counter()
+        units = fn(*args)
+        cpu = time.process_time() - cpu_started
+        wall = time.perf_counter() - wall_started
+
+    # segunda passada só para alocação; tracemalloc distorce o tempo
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        fn(*args)
+        after = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename") if stat.size_diff > 0)
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+
+    return {
+        "label": label,
+        "units": units,
+        "cpu_ms": round(cpu * 1000, 2),
+        "wall_ms": round(wall * 1000, 2),
+        "per_unit_us": round(cpu * 1e6 / max(1, units), 1),
+        "throughput_per_s": round(units / cpu, 1) if cpu else 0.0,
+        "peak_kb": round(peak / 1024, 1),
+        "retained_kb": round(allocated / 1024, 1),
+        "retained_blocks": blocks,
+        "stages": {
+            name: {"calls": calls, "total_ms": round(total * 1000, 2), "per_call_us": round(total * 1e6 / calls, 1)}
+            for name, (calls, total) in sorted(stats.items(), key=lambda item: -item[1][1])
+        },
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    # regressão = throughput caiu ou custo por chamada de um estágio subiu além do limite
+    regressions = []
+    for label, result in current.items():
+        base = baseline.get(label)
+        if not base:
+            continue
+        if base.get("throughput_per_s") and result["throughput_per_s"] < base["throughput_per_s"] * (1 - threshold):
+            regressions.append(f"{label}.throughput {base['throughput_per_s']} -> {result['throughput_per_s']}")
+        for stage, info in result["stages"].items():
+            base_stage = (base.get("stages") or {}).get(stage)
+            if base_stage and base_stage.get("per_call_us") and info["per_call_us"] > base_stage["per_call_us"] * (1 + threshold):
+                regressions.append(f"{label}.{stage}.per_call_us {base_stage['per_call_us']} -> {info['per_call_us']}")
+    return regressions
+
+
+def print_result(result: dict) -> None:
+    print(
+        f"{result['label']}: units={result['units']} cpu_ms={result['cpu_ms']} per_unit_us={result['per_unit_us']} "
+        f"throughput_per_s={result['throughput_per_s']} peak_kb={result['peak_kb']} retained_kb={result['retained_kb']}"
+    )
+    for stage, info in result["stages"].items():
+        print(f"  {stage:<28} calls={info['calls']:<7} total_ms={info['total_ms']:<9} per_call_us={info['per_call_us']}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline de vendas sobre os cenários do validate_sales_flow.")
+    parser.add_argument("--leads", type=int, default=40, help="leads sintéticos com a conversa longa")
+    parser.add_argument("--skip-app", action="store_true", help="não roda process_inbound_sales_message")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.25, help="regressão tolerada (0.25 = 25%%)")
+    parser.add_argument("--json", action="store_true", help="imprime o resultado completo em JSON")
+    args = parser.parse_args()
+
+    # aquece imports, caches de import e o app antes de medir
+    with contextlib.redirect_stdout(io.StringIO()):
+        run_synthetic(1)
+
+    results = {
+        "scenarios": measure("scenarios", run_scenarios),
+        "synthetic": measure("synthetic", run_synthetic, args.leads),
+    }
+    if not args.skip_app:
+        results["app"] = measure("app", run_app, args.leads)
+
+    for result in results.values():
+        print_result(result)
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"BENCH_BASELINE_SAVED path={args.baseline}")
+        return 0
+    if not args.baseline.exists():
+        print(f"BENCH_BASELINE_MISSING path={args.baseline} (rode com --save-baseline)")
+        return 0
+    regressions = compare(results, json.loads(args.baseline.read_text(encoding="utf-8")), args.threshold)
+    for item in regressions:
+        print(f"BENCH_REGRESSION {item}")
+    print(f"BENCH_RESULT regressions={len(regressions)} threshold={args.threshold}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import io
+import os
+import sys
+import json
+import uuid
+import asyncio
+import argparse
+import contextlib
+import urllib.parse
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+# hosts falsos antes de importar o app: os services leem o ambiente no import
+FAKE_ENV = {
+    "SUPABASE_URL": "http://supabase.budget.local",
+    "SUPABASE_SERVICE_ROLE_KEY": "budget",
+    "WHATSAPP_TOKEN": "budget",
+    "WHATSAPP_PHONE_NUMBER_ID": "budget-phone",
+    "WHATSAPP_GRAPH_BASE_URL": "http://graph.budget.local",
+    "OPENAI_API_KEY": "budget",
+    "OPENAI_BASE_URL": "http://openai.budget.local/v1",
+    "CALL_BUDGET_ENABLED": "1",
+}
+os.environ.update(FAKE_ENV)
+
+import httpx  # noqa: E402
+import requests  # noqa: E402
+
+from scripts.loadtest import CANNED_AI_REPLY, make_postgrest_store, meta_payload  # noqa: E402
+
+# orçamento por mensagem inbound (valores medidos hoje); subir um número aqui é decisão de review
+BUDGETS = {
+    "new_lead_first_message": {"supabase": 45, "graph": 1, "openai": 0},
+    "diagnosis_completion": {"supabase": 65, "graph": 3, "openai": 0},
+    "menu_choice": {"supabase": 61, "graph": 1, "openai": 0},
+    # +1 supabase: o lead tem mensagens no arquivo frio? (limit=1 por lead; "não tem" fica 60s em cache)
+    "free_text_ai_turn": {"supabase": 65, "graph": 1, "openai": 1},
+    "handoff_turn": {"supabase": 110, "graph": 3, "openai": 0},
+}
+# mínimo de chamadas: o cenário tem que exercitar o caminho (pergunta livre do lead chega ao generate_reply)
+REQUIRED_CALLS = {
+    "free_text_ai_turn": {"openai": 1},
+}
+
+COMPLETION_TEXT = "Olá! Acabei de concluir o Diagnóstico Mugô e quero entender os próximos passos."
+
+
+def fake_backend():
+    store = make_postgrest_store()
+    ai_content = json.dumps(CANNED_AI_REPLY, ensure_ascii=False)
+
+    def respond(method: str, url: str, body: bytes, prefer: str):
+        parts = urllib.parse.urlsplit(url)
+        payload = json.loads(body) if body else None
+        if parts.path.endswith("/messages"):
+            return 200, {"messaging_product": "whatsapp", "messages": [{"id": f"wamid.{uuid.uuid4().hex}"}]}
+        if parts.path.endswith("/chat/completions"):
+            return 200, {
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": ai_content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 900, "completion_tokens": 120, "total_tokens": 1020},
+            }
+        if parts.path.startswith("/rest/v1/"):
+            return store(method, parts.path[len("/rest/v1/"):], parts.query, prefer, payload)
+        return 404, {"error": "not found"}
+
+    return respond
+
+
+@contextlib.contextmanager
+def offline_transports(respond):
+    # troca só o transporte: os send() instrumentados pelo call_budget continuam contando
+    def _httpx_response(request: httpx.Request) -> httpx.Response:
+        status, data = respond(request.method, str(request.url), request.read(), request.headers.get("prefer", ""))
+        if data is None:
+            return httpx.Response(status, request=request)
+        return httpx.Response(status, json=data, request=request)
+
+    def handle_request(self, request):
+        return _httpx_response(request)
+
+    async def handle_async_request(self, request):
+        return _httpx_response(request)
+
+    def adapter_send(self, request, **kwargs):
+        body = request.body.encode("utf-8") if isinstance(request.body, str) else (request.body or b"")
+        status, data = respond(request.method, request.url, body, request.headers.get("Prefer", ""))
+        response = requests.Response()
+        response.status_code = status
+        response._content = b"" if data is None else json.dumps(data).encode("utf-8")
+        response.headers["Content-Type"] = "application/json"
+        response.url = request.url
+        response.request = request
+        return response
+
+    originals = (
+        httpx.HTTPTransport.handle_request,
+        httpx.AsyncHTTPTransport.handle_async_request,
+        requests.adapters.HTTPAdapter.send,
+    )
+    httpx.HTTPTransport.handle_request = handle_request
+    httpx.AsyncHTTPTransport.handle_async_request = handle_async_request
+    requests.adapters.HTTPAdapter.send = adapter_send
+    try:
+        yield
+    finally:
+        (
+            httpx.HTTPTransport.handle_request,
+            httpx.AsyncHTTPTransport.handle_async_request,
+            requests.adapters.HTTPAdapter.send,
+        ) = originals
+
+
+def list_reply_payload(wa_id: str, list_id: str, title: str, description: str) -> dict:
+    data = meta_payload(wa_id, "", FAKE_ENV["WHATSAPP_PHONE_NUMBER_ID"])
+    message = data["entry"][0]["changes"][0]["value"]["messages"][0]
+    message.pop("text", None)
+    message["type"] = "interactive"
+    message["interactive"] = {"type": "list_reply", "list_reply": {"id": list_id, "title": title, "description": description}}
+    return data
+
+
+def run_journey() -> dict:
+    import app
+    from services import call_budget
+
+    wa_id = f"5511{uuid.uuid4().int % 10 ** 9:09d}"
+    phone = FAKE_ENV["WHATSAPP_PHONE_NUMBER_ID"]
+    steps = [
+        ("new_lead_first_message", meta_payload(wa_id, "oi", phone)),
+        ("diagnosis_completion", meta_payload(wa_id, COMPLETION_TEXT, phone)),
+        ("menu_choice", list_reply_payload(wa_id, "service_automation", "Automatizar WhatsApp", "Atendimento, leads e CRM")),
+        ("free_text_ai_turn", meta_payload(wa_id, "como funciona essa automação na prática?", phone)),
+        ("handoff_turn", meta_payload(wa_id, "hoje respondemos tudo manual pelo celular e perdemos lead", phone)),
+    ]
+
+    async def replay() -> dict:
+        ledgers = {}
+        for name, payload in steps:
+            cid = f"budget-{name}"
+            with call_budget.track(cid, log=False, scenario=name) as ledger:
+                await app._process_webhook_message(payload, cid)
+            ledgers[name] = ledger
+        return ledgers
+
+    with offline_transports(fake_backend()), contextlib.redirect_stdout(io.StringIO()):
+        return asyncio.run(replay())
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Confere o orçamento de chamadas HTTP por mensagem inbound.")
+    parser.add_argument("--verbose", action="store_true", help="lista as chamadas por template de URL")
+    args = parser.parse_args()
+
+    from services import call_budget
+
+    ledgers = run_journey()
+    failures = 0
+    for name, budget in BUDGETS.items():
+        summary = call_budget.summarize(ledgers[name])
+        violations = call_budget.check(ledgers[name], budget)
+        for target, minimum in REQUIRED_CALLS.get(name, {}).items():
+            used = summary["by_target"].get(target, 0)
+            if used < minimum:
+                violations.append(f"{target} used={used} required={minimum}")
+        used = " ".join(f"{target}={summary['by_target'].get(target, 0)}/{limit}" for target, limit in budget.items())
+        print(f"{'FAIL' if violations else 'OK'} {name}: {used}")
+        if args.verbose or violations:
+            for target, templates in sorted(summary["by_template"].items()):
+                for key, count in sorted(templates.items()):
+                    print(f"    {target:<9} x{count:<3} {key}")
+        failures += bool(violations)
+    if failures:
+        print(f"CALL_BUDGET_CHECK failed={failures}")
+        return 1
+    print("ALL CALL BUDGETS WITHIN LIMITS")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,553 @@
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import socket
+import asyncio
+import sqlite3
+import argparse
+import threading
+import subprocess
+import urllib.parse
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# roteiro de lead real: convite do Mugô Intelligence, conclusão do diagnóstico e conversa de vendas
+CONVERSATION = [
+    "oi",
+    "Olá! Acabei de concluir o Diagnóstico Mugô e quero entender os próximos passos.",
+    "quero automatizar o atendimento no whatsapp",
+    "pelo whatsapp e instagram",
+    "hoje é tudo manual",
+    "quero vender mais",
+    "chegam uns 80 leads por semana",
+    "o maior gargalo é a demora pra responder",
+    "não usamos crm",
+    "é urgente, queria resolver esse mês",
+    "quero falar com a julia",
+]
+
+CANNED_AI_REPLY = {
+    "reply": "Entendi. Me conta: hoje quem responde os contatos e em quanto tempo, mais ou menos?",
+    "intent": "automacao_whatsapp",
+    "next_action": "ask_question",
+    "question_key": "tempo_resposta",
+    "handoff": False,
+    "handoff_reason": None,
+    "lead_score": 45,
+    "lead_temperature": "warm",
+    "lead_theme": "automacao_whatsapp",
+    "meeting_suggested": False,
+    "briefing_ready": False,
+    "suggested_tags": ["automacao"],
+    "lead_fields": {},
+    "memory_summary": "Lead quer organizar o atendimento pelo WhatsApp.",
+}
+
+_LOCK = threading.Lock()
+_METRICS: Dict[str, Any] = {
+    "postgrest_requests": {},
+    "graph_sends": 0,
+    "graph_429": 0,
+    "openai_calls": 0,
+}
+# o driver registra aqui o loop e os callbacks; os stubs rodam em outras threads
+_HOOKS: Dict[str, Any] = {"loop": None, "on_first_seen": None, "on_reply": None}
+
+
+def _count(key: str, sub: str = "") -> None:
+    with _LOCK:
+        if sub:
+            bucket = _METRICS[key]
+            bucket[sub] = bucket.get(sub, 0) + 1
+        else:
+            _METRICS[key] += 1
+
+
+def _notify(hook: str, wa_id: str) -> None:
+    loop = _HOOKS.get("loop")
+    callback = _HOOKS.get(hook)
+    if loop is None or callback is None or not wa_id:
+        return
+    try:
+        loop.call_soon_threadsafe(callback, wa_id, time.monotonic())
+    except RuntimeError:
+        # o app ainda termina envios depois que o driver fechou o loop
+        pass
+
+
+# ---------------------------------------------------------------------------
+# PostgREST: tabelas como documentos JSON no SQLite, com os filtros que services/* usam
+# ---------------------------------------------------------------------------
+
+FILTER_OPS = {"eq": "=", "neq": "!=", "lt": "<", "lte": "<=", "gt": ">", "gte": ">="}
+RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+
+def _column(name: str) -> str:
+    return "json_extract(data, '$.\"" + name.replace('"', "") + "\"')"
+
+
+def _literal(value: str) -> Any:
+    if value == "true":
+        return 1
+    if value == "false":
+        return 0
+    return value
+
+
+def _where(params: List[Tuple[str, str]]) -> Tuple[str, List[Any]]:
+    clauses, args = ["tbl = ?"], []
+    for key, raw in params:
+        if key in RESERVED_PARAMS:
+            continue
+        op, _, value = raw.partition(".")
+        column = _column(key)
+        if op in FILTER_OPS:
+            literal = _literal(value)
+            # compara como texto quando o valor não é booleano (ids numéricos chegam como string na URL)
+            target = column if isinstance(literal, int) else f"CAST({column} AS TEXT)"
+            clauses.append(f"{target} {FILTER_OPS[op]} ?")
+            args.append(literal)
+        elif op == "is":
+            clauses.append(f"{column} IS NULL" if value == "null" else f"{column} = ?")
+            if value != "null":
+                args.append(_literal(value))
+        elif op == "in":
+            items = [item.strip().strip('"') for item in value.strip("()").split(",") if item.strip()]
+            if not items:
+                clauses.append("0")
+                continue
+            clauses.append(f"CAST({column} AS TEXT) IN ({','.join('?' for _ in items)})")
+            args.extend(items)
+    return " AND ".join(clauses), args
+
+
+def _order(raw: str) -> str:
+    parts = []
+    for item in (raw or "").split(","):
+        bits = item.strip().split(".")
+        if not bits or not bits[0]:
+            continue
+        direction = "DESC" if "desc" in bits[1:] else "ASC"
+        nulls = " NULLS LAST" if "nullslast" in bits[1:] else (" NULLS FIRST" if "nullsfirst" in bits[1:] else "")
+        parts.append(f"{_column(bits[0])} {direction}{nulls}")
+    return (" ORDER BY " + ", ".join(parts)) if parts else " ORDER BY id ASC"
+
+
+def _project(row: Dict[str, Any], select: str) -> Dict[str, Any]:
+    if not select or select.strip() == "*":
+        return row
+    columns = [item.split(":")[-1].split("(")[0].strip() for item in select.split(",")]
+    return {column: row.get(column) for column in columns if column}
+
+
+def make_postgrest_store(db_path: str = ":memory:"):
+    # handler puro (método, tabela, query, Prefer, corpo) -> (status, linhas); None = sem corpo
+    db = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+    db.execute("CREATE TABLE IF NOT EXISTS rows (id INTEGER PRIMARY KEY AUTOINCREMENT, tbl TEXT NOT NULL, data TEXT NOT NULL)")
+    db.execute("CREATE INDEX IF NOT EXISTS rows_wa ON rows (tbl, json_extract(data, '$.wa_id'))")
+    db_lock = threading.Lock()
+
+    def select_rows(table: str, params: List[Tuple[str, str]]) -> List[Tuple[int, Dict[str, Any]]]:
+        where, args = _where(params)
+        lookup = dict(params)
+        sql = f"SELECT id, data FROM rows WHERE {where}{_order(lookup.get('order', ''))}"
+        if lookup.get("limit"):
+            sql += f" LIMIT {int(lookup['limit'])}"
+            if lookup.get("offset"):
+                sql += f" OFFSET {int(lookup['offset'])}"
+        with db_lock:
+            return [(row_id, json.loads(data)) for row_id, data in db.execute(sql, [table, *args]).fetchall()]
+
+    def write(row_id: int, row: Dict[str, Any]) -> None:
+        with db_lock:
+            db.execute("UPDATE rows SET data = ? WHERE id = ?", (json.dumps(row, ensure_ascii=False), row_id))
+
+    def respond(rows: List[Dict[str, Any]], prefer: str, status: int) -> Tuple[int, Optional[List[Dict[str, Any]]]]:
+        if "return=minimal" in prefer:
+            return (204 if status == 200 else status), None
+        return status, rows
+
+    def handle(method: str, table: str, query: str, prefer: str, body: Any) -> Tuple[int, Optional[List[Dict[str, Any]]]]:
+        params = list(urllib.parse.parse_qsl(query, keep_blank_values=True))
+        lookup = dict(params)
+        method = method.upper()
+
+        if method == "GET":
+            return 200, [_project(row, lookup.get("select", "*")) for _, row in select_rows(table, params)]
+
+        if method == "DELETE":
+            matched = select_rows(table, params)
+            with db_lock:
+                db.executemany("DELETE FROM rows WHERE id = ?", [(row_id,) for row_id, _ in matched])
+            return respond([row for _, row in matched], prefer, 200)
+
+        if method == "PATCH":
+            updated = []
+            for row_id, row in select_rows(table, params):
+                row = {**row, **(body or {})}
+                write(row_id, row)
+                updated.append(row)
+            return respond(updated, prefer, 200)
+
+        # POST: insert ou upsert (on_conflict + resolution=merge-duplicates)
+        items = body if isinstance(body, list) else [body or {}]
+        conflict = [column.strip() for column in lookup.get("on_conflict", "").split(",") if column.strip()]
+        merge = "merge-duplicates" in prefer
+        written = []
+        for item in items:
+            existing = []
+            if conflict and merge:
+                existing = select_rows(table, [(column, f"eq.{item.get(column)}") for column in conflict if item.get(column) is not None])
+            if existing:
+                row_id, row = existing[0]
+                row = {**row, **item}
+                write(row_id, row)
+            else:
+                row = dict(item)
+                with db_lock:
+                    row_id = db.execute("INSERT INTO rows (tbl, data) VALUES (?, '{}')", (table,)).lastrowid
+                row.setdefault("id", row_id)
+                write(row_id, row)
+            written.append(row)
+        return respond(written, prefer, 201)
+
+    return handle
+
+
+def _first_wa_id(query: str, body: Any) -> str:
+    for key, raw in urllib.parse.parse_qsl(query, keep_blank_values=True):
+        if key == "wa_id" and raw.startswith("eq."):
+            return raw[3:]
+    items = body if isinstance(body, list) else [body]
+    for item in items:
+        if isinstance(item, dict) and item.get("wa_id"):
+            return str(item["wa_id"])
+    return ""
+
+
+def make_postgrest_app(db_path: str) -> FastAPI:
+    api = FastAPI()
+    handle = make_postgrest_store(db_path)
+
+    @api.api_route("/rest/v1/{table}", methods=["GET", "POST", "PATCH", "DELETE"])
+    async def table_route(table: str, request: Request):
+        body: Any = None
+        if request.method in {"POST", "PATCH"}:
+            raw = await request.body()
+            body = json.loads(raw) if raw else {}
+        _count("postgrest_requests", request.method)
+        _notify("on_first_seen", _first_wa_id(request.url.query, body))
+        status, rows = handle(request.method, table, request.url.query, request.headers.get("prefer", ""), body)
+        if rows is None:
+            return Response(status_code=status)
+        return JSONResponse(rows, status_code=status)
+
+    return api
+
+
+# ---------------------------------------------------------------------------
+# Graph API /messages e OpenAI chat completions
+# ---------------------------------------------------------------------------
+
+def make_graph_app(latency_ms: float, rate_429: float, seed: int) -> FastAPI:
+    api = FastAPI()
+    rng = random.Random(seed)
+
+    @api.post("/{version}/{phone_number_id}/messages")
+    async def send_message(version: str, phone_number_id: str, request: Request):
+        body = await request.json()
+        await asyncio.sleep(max(0.0, rng.uniform(0.5, 1.5) * latency_ms / 1000.0))
+        if rng.random() < rate_429:
+            _count("graph_429")
+            return JSONResponse(
+                {"error": {"message": "(#130429) Rate limit hit", "type": "OAuthException", "code": 130429}},
+                status_code=429,
+            )
+        _count("graph_sends")
+        to = str(body.get("to") or "")
+        _notify("on_reply", to)
+        return {"messaging_product": "whatsapp", "contacts": [{"input": to, "wa_id": to}], "messages": [{"id": f"wamid.{uuid.uuid4().hex}"}]}
+
+    return api
+
+
+def make_openai_app(latency_ms: float, seed: int) -> FastAPI:
+    api = FastAPI()
+    rng = random.Random(seed)
+    content = json.dumps(CANNED_AI_REPLY, ensure_ascii=False)
+
+    @api.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        await request.body()
+        _count("openai_calls")
+        await asyncio.sleep(max(0.0, rng.uniform(0.5, 1.5) * latency_ms / 1000.0))
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 900, "completion_tokens": 120, "total_tokens": 1020, "prompt_tokens_details": {"cached_tokens": 640}},
+        }
+
+    return api
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve_in_thread(api: FastAPI, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(api, host="127.0.0.1", port=port, log_level="warning", access_log=False))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.monotonic() + 10
+    while not server.started and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return server
+
+
+def start_app(port: int, env: Dict[str, str], workers: int, log_path: Path) -> subprocess.Popen:
+    log = open(log_path, "w", encoding="utf-8")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=str(ROOT),
+        env={**os.environ, **env},
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+
+
+async def wait_ready(url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                r = await client.get(url, timeout=2.0)
+                if r.status_code < 500:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.3)
+    raise SystemExit(f"LOADTEST_APP_NOT_READY url={url}")
+
+
+# ---------------------------------------------------------------------------
+# driver
+# ---------------------------------------------------------------------------
+
+def meta_payload(wa_id: str, text: str, phone_number_id: str) -> Dict[str, Any]:
+    return {
+        "object": "whatsapp_business_account",
+        "entry": [
+            {
+                "id": "loadtest-waba",
+                "changes": [
+                    {
+                        "field": "messages",
+                        "value": {
+                            "messaging_product": "whatsapp",
+                            "metadata": {"display_phone_number": "5511900000000", "phone_number_id": phone_number_id},
+                            "contacts": [{"profile": {"name": f"Lead {wa_id[-4:]}"}, "wa_id": wa_id}],
+                            "messages": [
+                                {
+                                    "from": wa_id,
+                                    "id": f"wamid.{uuid.uuid4().hex}",
+                                    "timestamp": str(int(time.time())),
+                                    "type": "text",
+                                    "text": {"body": text},
+                                }
+                            ],
+                        },
+                    }
+                ],
+            }
+        ],
+    }
+
+
+def percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    values = sorted(values)
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+
+    def pct(p: float) -> float:
+        return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 1)
+
+    return {"p50": pct(0.5), "p95": pct(0.95), "p99": pct(0.99), "max": round(values[-1] * 1000, 1)}
+
+
+async def drive(base_url: str, args: argparse.Namespace, phone_number_id: str) -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+    pending: Dict[str, Dict[str, Any]] = {}
+    results: Dict[str, List[float]] = {"ack": [], "queue_lag": [], "e2e": []}
+    counters = {"sent": 0, "webhook_errors": 0, "no_reply": 0, "driver_saturated": 0}
+
+    def on_first_seen(wa_id: str, at: float) -> None:
+        item = pending.get(wa_id)
+        if item and item.get("first_seen") is None and item.get("acked_at") is not None:
+            item["first_seen"] = at
+
+    def on_reply(wa_id: str, at: float) -> None:
+        item = pending.get(wa_id)
+        if item and not item["future"].done():
+            item["future"].set_result(at)
+
+    _HOOKS.update({"loop": loop, "on_first_seen": on_first_seen, "on_reply": on_reply})
+    leads = [f"5511{9 * 10 ** 8 + index:09d}" for index in range(args.leads)]
+    cursor = {wa_id: 0 for wa_id in leads}
+    idle = list(leads)
+    tasks = []
+
+    async def one_message(client: httpx.AsyncClient, wa_id: str) -> None:
+        # depois do roteiro, o lead segue conversando sem repetir o convite
+        step = cursor[wa_id]
+        text = CONVERSATION[step] if step < len(CONVERSATION) else CONVERSATION[2 + (step - 2) % (len(CONVERSATION) - 2)]
+        cursor[wa_id] += 1
+        item = {"future": loop.create_future(), "first_seen": None, "acked_at": None}
+        pending[wa_id] = item
+        started = time.monotonic()
+        try:
+            r = await client.post(f"{base_url}/webhook", json=meta_payload(wa_id, text, phone_number_id), timeout=30.0)
+            item["acked_at"] = time.monotonic()
+            results["ack"].append(item["acked_at"] - started)
+            if r.status_code >= 300:
+                counters["webhook_errors"] += 1
+                return
+            replied_at = await asyncio.wait_for(item["future"], timeout=args.reply_timeout)
+            results["e2e"].append(replied_at - started)
+            if item["first_seen"] is not None:
+                results["queue_lag"].append(max(0.0, item["first_seen"] - item["acked_at"]))
+        except asyncio.TimeoutError:
+            counters["no_reply"] += 1
+        except httpx.HTTPError:
+            counters["webhook_errors"] += 1
+        finally:
+            pending.pop(wa_id, None)
+            idle.append(wa_id)
+
+    # malha aberta: uma mensagem a cada 1/rate s; cada lead só manda a próxima depois da resposta anterior
+    interval = 1.0 / max(0.1, args.rate)
+    started = time.monotonic()
+    limits = httpx.Limits(max_connections=max(10, args.leads), max_keepalive_connections=max(10, args.leads))
+    async with httpx.AsyncClient(limits=limits) as client:
+        tick = 0
+        while time.monotonic() - started < args.duration:
+            target = started + tick * interval
+            delay = target - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tick += 1
+            if not idle:
+                counters["driver_saturated"] += 1
+                continue
+            wa_id = idle.pop(0)
+            counters["sent"] += 1
+            tasks.append(asyncio.create_task(one_message(client, wa_id)))
+        send_window = time.monotonic() - started
+        if tasks:
+            await asyncio.gather(*tasks)
+    _HOOKS.update({"loop": None, "on_first_seen": None, "on_reply": None})
+    elapsed = time.monotonic() - started
+
+    completed = len(results["e2e"])
+    return {
+        "duration_s": round(elapsed, 2),
+        "target_rate": args.rate,
+        "achieved_rate": round(counters["sent"] / send_window, 2) if send_window else 0.0,
+        "replied_rate": round(completed / elapsed, 2) if elapsed else 0.0,
+        **counters,
+        "error_rate": round((counters["webhook_errors"] + counters["no_reply"]) / max(1, counters["sent"]), 4),
+        "ack_ms": percentiles(results["ack"]),
+        "queue_lag_ms": percentiles(results["queue_lag"]),
+        "e2e_ms": percentiles(results["e2e"]),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Teste de carga do /webhook com stubs locais de PostgREST, Graph API e OpenAI.")
+    parser.add_argument("--rate", type=float, default=5.0, help="mensagens por segundo")
+    parser.add_argument("--duration", type=float, default=30.0, help="segundos de carga")
+    parser.add_argument("--leads", type=int, default=50, help="leads simultâneos (cada um espera a resposta antes da próxima)")
+    parser.add_argument("--workers", type=int, default=1, help="workers do uvicorn do app")
+    parser.add_argument("--reply-timeout", type=float, default=30.0)
+    parser.add_argument("--graph-latency-ms", type=float, default=120.0)
+    parser.add_argument("--graph-429-rate", type=float, default=0.0, help="fração de envios que a Graph API recusa com 429")
+    parser.add_argument("--openai-latency-ms", type=float, default=900.0)
+    parser.add_argument("--db", default=":memory:", help="arquivo SQLite do stub PostgREST")
+    parser.add_argument("--app-url", default="", help="usa um app já rodando em vez de subir um (precisa apontar para os stubs)")
+    parser.add_argument("--app-log", type=Path, default=Path("/tmp/mugo_loadtest_app.log"))
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    ports = {"postgrest": _free_port(), "graph": _free_port(), "openai": _free_port()}
+    servers = [
+        serve_in_thread(make_postgrest_app(args.db), ports["postgrest"]),
+        serve_in_thread(make_graph_app(args.graph_latency_ms, args.graph_429_rate, args.seed), ports["graph"]),
+        serve_in_thread(make_openai_app(args.openai_latency_ms, args.seed + 1), ports["openai"]),
+    ]
+    phone_number_id = "loadtest-phone"
+    env = {
+        "SUPABASE_URL": f"http://127.0.0.1:{ports['postgrest']}",
+        "SUPABASE_SERVICE_ROLE_KEY": "loadtest",
+        "WHATSAPP_TOKEN": "loadtest",
+        "WHATSAPP_PHONE_NUMBER_ID": phone_number_id,
+        "WHATSAPP_GRAPH_BASE_URL": f"http://127.0.0.1:{ports['graph']}",
+        "OPENAI_API_KEY": "loadtest",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{ports['openai']}/v1",
+    }
+
+    process = None
+    base_url = args.app_url.rstrip("/")
+    if not base_url:
+        app_port = _free_port()
+        process = start_app(app_port, env, args.workers, args.app_log)
+        base_url = f"http://127.0.0.1:{app_port}"
+    else:
+        print("LOADTEST_EXTERNAL_APP env=" + json.dumps(env))
+
+    try:
+        asyncio.run(wait_ready(f"{base_url}/webhook"))
+        report = asyncio.run(drive(base_url, args, phone_number_id))
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        for server in servers:
+            server.should_exit = True
+
+    with _LOCK:
+        report["backends"] = json.loads(json.dumps(_METRICS))
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print(
+            f"LOADTEST rate={report['target_rate']}/s achieved={report['achieved_rate']}/s replied={report['replied_rate']}/s "
+            f"sent={report['sent']} errors={report['webhook_errors']} no_reply={report['no_reply']} "
+            f"saturated={report['driver_saturated']} error_rate={report['error_rate']}"
+        )
+        for key in ("ack_ms", "queue_lag_ms", "e2e_ms"):
+            print(f"  {key:<13} " + " ".join(f"{name}={value}" for name, value in report[key].items()))
+        print(f"  backends {json.dumps(report['backends'], ensure_ascii=False)}")
+        print(f"  app_log {args.app_log}")
+    return 0 if report["error_rate"] < 0.05 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import sys
+import json
+import time
+import random
+import argparse
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+for candidate in (ROOT / ".env", ROOT.parent / ".env"):
+    if candidate.exists():
+        load_dotenv(candidate, override=False)
+        break
+
+from services import intent_model, sales_brain  # noqa: E402
+
+# respostas curtas que não dizem nada do serviço, mesmo vindas de um lead que escolheu um
+LOW_SIGNAL_TEXTS = {
+    "sim", "s", "nao", "n", "ok", "oi", "ola", "opa", "bom dia", "boa tarde", "boa noite", "obrigado",
+    "obrigada", "valeu", "beleza", "blz", "certo", "claro", "pode ser", "entendi", "show", "top",
+    "perfeito", "tudo bem", "tudo bom", "isso", "isso mesmo", "talvez", "nao sei", "ainda nao",
+}
+
+
+def _sample_label(norm: str, service: str) -> str:
+    if norm in LOW_SIGNAL_TEXTS or not service:
+        return intent_model.NEGATIVE_LABEL
+    return service
+
+
+def fetch_samples(workspace_id: str, per_lead: int, limit: int) -> list[tuple[str, str]]:
+    # rótulo = service_interest final salvo no ai_state; texto = primeiras mensagens recebidas do lead
+    # leads sem serviço e mensagens de baixo sinal viram a classe negativa (intent_model.NEGATIVE_LABEL)
+    from services import state, ai_state
+
+    workspace_filter = f"workspace_id=eq.{workspace_id}&" if workspace_id else ""
+    r = state._get(
+        f"{state.SUPABASE_URL}/rest/v1/{ai_state.TABLE}?{workspace_filter}select=wa_id,state&limit={limit}"
+    )
+    r.raise_for_status()
+    labels = {}
+    for row in r.json() or []:
+        service = str(((row.get("state") or {}).get("service_interest")) or "").strip()
+        if service in sales_brain.SEMANTIC_INTENT_BY_SERVICE:
+            labels[str(row.get("wa_id") or "")] = service
+        elif not service:
+            labels[str(row.get("wa_id") or "")] = ""
+
+    samples = []
+    for wa_id, service in labels.items():
+        r = state._get(
+            f"{state.SUPABASE_URL}/rest/v1/{state.MESSAGES_TABLE}"
+            f"?{workspace_filter}wa_id=eq.{wa_id}&direction=eq.in&select=text,created_at"
+            f"&order=created_at.asc&limit={per_lead}"
+        )
+        if r.status_code != 200:
+            continue
+        for row in r.json() or []:
+            norm = sales_brain.normalize_text(row.get("text") or "")
+            if norm and not norm.isdigit():
+                samples.append((norm, _sample_label(norm, service)))
+    return samples
+
+
+def read_samples(path: Path) -> list[tuple[str, str]]:
+    samples = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        norm = sales_brain.normalize_text(row.get("text") or "")
+        if norm:
+            # linha sem rótulo = exemplo negativo
+            samples.append((norm, str(row.get("label") or intent_model.NEGATIVE_LABEL)))
+    return samples
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Treina o classificador local de serviço/intenção.")
+    parser.add_argument("--input", type=Path, help="JSONL com {text, label}; sem isso lê do Supabase")
+    parser.add_argument("--workspace-id", default="")
+    parser.add_argument("--per-lead", type=int, default=2)
+    parser.add_argument("--limit", type=int, default=5000)
+    parser.add_argument("--holdout", type=float, default=0.2)
+    parser.add_argument("--epochs", type=int, default=12)
+    parser.add_argument("--export", type=Path, help="salva o dataset usado em JSONL")
+    parser.add_argument("--output", type=Path, default=intent_model.INTENT_MODEL_PATH)
+    parser.add_argument("--dry-run", action="store_true", help="só avalia, não grava o modelo")
+    args = parser.parse_args()
+
+    samples = read_samples(args.input) if args.input else fetch_samples(args.workspace_id, args.per_lead, args.limit)
+    if len(samples) < 10:
+        print(f"INTENT_MODEL_TRAIN:not_enough_samples samples={len(samples)}")
+        return 1
+    if not any(label == intent_model.NEGATIVE_LABEL for _, label in samples):
+        print(f"INTENT_MODEL_TRAIN:no_negative_samples label={intent_model.NEGATIVE_LABEL}")
+        return 1
+    if args.export:
+        args.export.write_text(
+            "".join(json.dumps({"text": norm, "label": label}, ensure_ascii=False) + "\n" for norm, label in samples),
+            encoding="utf-8",
+        )
+
+    random.Random(13).shuffle(samples)
+    cut = int(len(samples) * (1.0 - args.holdout)) if 0 < args.holdout < 1 else len(samples)
+    train_set, test_set = samples[:cut], samples[cut:]
+
+    started = time.perf_counter()
+    model = intent_model.train(train_set, epochs=args.epochs)
+    train_ms = int((time.perf_counter() - started) * 1000)
+    report = intent_model.evaluate(model, test_set) if test_set else {}
+
+    started = time.perf_counter()
+    for norm, _ in test_set or train_set:
+        intent_model.predict(norm, model)
+    predict_us = int((time.perf_counter() - started) * 1_000_000 / max(1, len(test_set or train_set)))
+
+    print(json.dumps(
+        {
+            "train_samples": len(train_set),
+            "test_samples": len(test_set),
+            "labels": model["labels"],
+            "features": len(model["weights"]),
+            "train_ms": train_ms,
+            "predict_us_per_message": predict_us,
+            "holdout": report,
+        },
+        ensure_ascii=False,
+        indent=2,
+    ))
+
+    if not args.dry_run:
+        # o modelo final usa todo o dataset
+        final = intent_model.train(samples, epochs=args.epochs) if test_set else model
+        intent_model.save_model(final, args.output)
+        print(f"INTENT_MODEL_TRAIN:saved path={args.output} samples={final['samples']}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
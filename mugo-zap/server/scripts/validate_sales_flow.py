@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import re
 import sys
+import subprocess
 import urllib.parse
 import asyncio
 from pathlib import Path
@@ -1402,6 +1403,67 @@ def test_generic_conversation_synthesis_listens_before_asking():
     assert_true("deepens context", step2["next_question"]["category"] in {"estagio_marca", "dificuldade_atual", "budget_signal"})
 
 
+def test_conversation_facts_persist_and_cover_history():
+    import app
+
+    step = pipeline_step(sales_brain.default_lead_state(), message="quero apresentar meus perfumes")
+    facts = step["state_after"].get("conversation_facts") or {}
+    assert_true("facts accumulated", facts.get("message_count") == 1)
+
+    saved = {}
+
+    async def fake_upsert_ai_state(wa_id, state, workspace_id=""):
+        saved.update(state)
+        return state
+
+    original_upsert = app.upsert_ai_state
+    app.upsert_ai_state = fake_upsert_ai_state
+    try:
+        result = app._sales_pipeline_result_from_state(
+            state=step["state_after"], reply=step["reply"], next_question=step["next_question"]
+        )
+        asyncio.run(app._save_ai_result_state("5511777777777", ai_state={}, result=result, user_text="quero apresentar meus perfumes"))
+    finally:
+        app.upsert_ai_state = original_upsert
+    assert_equal("facts persisted", (saved.get("conversation_facts") or {}).get("message_count"), 1)
+
+    # acumulador com uma mensagem não cobre uma janela maior: os termos antigos vêm da varredura
+    history = ["meu atendimento no whatsapp e uma bagunca", "quero apresentar meus perfumes", "e isso"]
+    terms = sales_brain._history_terms({"conversation_facts": facts}, history)
+    assert_true("older history scanned", "whatsapp" in terms)
+
+
+def test_keyword_matching_without_source_warmup():
+    # deploy só com bytecode / ast.parse falhando: nem o matcher nem o catálogo de perguntas podem depender da leitura do próprio fonte
+    code = """
+import ast
+def _fail(*args, **kwargs):
+    raise SyntaxError("no source")
+ast.parse = _fail
+from services import sales_brain
+briefing = sales_brain.build_internal_briefing({}, [{"direction": "in", "text": "oi"}, {"direction": "in", "text": "quero um chatbot urgente, tudo para ontem"}])
+assert briefing["primary_track"] == "ia_no_negocio", briefing["primary_track"]
+assert sales_brain.should_handoff_now({}, [{"direction": "in", "text": "quero falar com um atendente"}])
+assert sales_brain._has_any("preciso disso essa semana", ["essa semana", "urgente"])
+expected = {sales_brain.normalize_text(question) for question in sales_brain._backend_questions()}
+assert set(sales_brain.QUESTION_CATEGORIES) == expected and len(expected) > 40, len(sales_brain.QUESTION_CATEGORIES)
+print("WARMUP_OFF_OK")
+"""
+    result = subprocess.run([sys.executable, "-c", code], cwd=str(ROOT), capture_output=True, text=True, timeout=120)
+    if result.returncode != 0 or "WARMUP_OFF_OK" not in result.stdout:
+        raise AssertionError(f"matcher without ast warm-up: {result.stderr.strip()[-600:]}")
+
+
+def test_reply_cache_fingerprint_shared_across_leads():
+    from services import reply_cache
+
+    lead_a = {"service_interest": "site", "funnel_stage": "qualificacao", "site_scope": "criar do zero", "business_name": "Loja A", "main_goal": "vender"}
+    lead_b = {**lead_a, "business_name": "Studio B", "main_goal": "gerar leads"}
+    assert_equal("same slots share key", reply_cache.cache_key("sim", lead_a), reply_cache.cache_key("sim", lead_b))
+    assert_true("filled budget changes key", reply_cache.cache_key("sim", lead_a) != reply_cache.cache_key("sim", {**lead_a, "budget_signal": "5 mil"}))
+    assert_true("other service changes key", reply_cache.cache_key("sim", lead_a) != reply_cache.cache_key("sim", {**lead_a, "service_interest": "branding"}))
+
+
 def _assert_consultative_discovery_reply(name: str, step: dict, learned_terms: list[str]):
     if step["next_question"]["next_action"] != "ask_question":
         return
@@ -1566,6 +1628,9 @@ def main():
         ("pipeline_anti_loop", test_pipeline_anti_loop),
         ("last_three_questions_block_semantic_repeat", test_last_three_questions_block_semantic_repeat),
         ("generic_conversation_synthesis_listens_before_asking", test_generic_conversation_synthesis_listens_before_asking),
+        ("conversation_facts_persist_and_cover_history", test_conversation_facts_persist_and_cover_history),
+        ("keyword_matching_without_source_warmup", test_keyword_matching_without_source_warmup),
+        ("reply_cache_fingerprint_shared_across_leads", test_reply_cache_fingerprint_shared_across_leads),
         ("consultative_discovery_across_required_segments", test_consultative_discovery_across_required_segments),
         ("efficiency_prefers_handoff_when_next_question_adds_little", test_efficiency_prefers_handoff_when_next_question_adds_little),
     ]
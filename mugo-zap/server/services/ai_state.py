@@ -6,6 +6,9 @@ from datetime import datetime, timezone
 from typing import Any, Dict, Optional
 
 import httpx
+from services.coalesce import coalesced_get_async, forget_results
+from services import log
+from services.tracing import traced
 from services.workspace import DEFAULT_WORKSPACE_ID, resolve_workspace_id
 
 SUPABASE_URL = (os.getenv("SUPABASE_URL") or "").strip().rstrip("/")
@@ -72,6 +75,7 @@ DEFAULT_STATE: Dict[str, Any] = {
     "selected_service_id": "",
     "suggested_tags": [],
     "lead_fields": {},
+    "conversation_facts": {},
     "briefing": {},
     "primary_track": None,
     "related_needs": [],
@@ -122,15 +126,27 @@ def _resolve_workspace_id(workspace_id: Optional[str] = "") -> str:
     return resolve_workspace_id(explicit_workspace_id=workspace_id) or DEFAULT_WORKSPACE_ID
 
 
+def _log_save_result(op: str, r: httpx.Response) -> None:
+    # corpo completo do estado só em debug; falha sobe para warning
+    log.log(
+        "debug" if r.status_code < 300 else "warning",
+        "SALES_STATE_SAVE_RESULT",
+        op=op,
+        status=r.status_code,
+        body=lambda: _short_body(r.text),
+    )
+
+
+@traced("state_load")
 async def get_ai_state(wa_id: str, workspace_id: Optional[str] = "") -> Dict[str, Any]:
     wa_id = _normalize_wa_id(wa_id)
     workspace_id = _resolve_workspace_id(workspace_id)
-    print(f"SALES_STATE_LOAD_KEY wa_id={wa_id or '-'} workspace_id={workspace_id or '-'} table={TABLE}")
+    log.debug("SALES_STATE_LOAD_KEY", wa_id=wa_id, workspace_id=workspace_id, table=TABLE)
     if not wa_id:
         return dict(DEFAULT_STATE)
 
     if not _is_ready():
-        print("SALES_STATE_LOAD_RAW skipped reason=supabase_not_configured")
+        log.debug("SALES_STATE_LOAD_RAW", skipped=True, reason="supabase_not_configured")
         return dict(DEFAULT_STATE)
 
     urls = [
@@ -142,14 +158,19 @@ async def get_ai_state(wa_id: str, workspace_id: Optional[str] = "") -> Dict[str
         rows = []
         async with httpx.AsyncClient(timeout=12) as client:
             for index, url in enumerate(urls):
-                r = await client.get(url, headers=_headers())
-                print(
-                    f"SALES_STATE_LOAD_RAW wa_id={wa_id} workspace_id={workspace_id} "
-                    f"query_index={index} status={r.status_code} body={_short_body(r.text)}"
+                r = await coalesced_get_async(client, url, _headers())
+                log.log(
+                    "debug" if r.status_code == 200 else "warning",
+                    "SALES_STATE_LOAD_RAW",
+                    wa_id=wa_id,
+                    workspace_id=workspace_id,
+                    query_index=index,
+                    status=r.status_code,
+                    body=lambda: _short_body(r.text),
                 )
                 if r.status_code == 200:
                     rows = r.json() or []
-                    print(f"SALES_STATE_LOAD_RAW wa_id={wa_id} rows={len(rows)} query_index={index}")
+                    log.debug("SALES_STATE_LOAD_RAW", wa_id=wa_id, rows=len(rows), query_index=index)
                     break
                 if index == 0 and _looks_like_missing_workspace(r.status_code, r.text):
                     continue
@@ -157,22 +178,24 @@ async def get_ai_state(wa_id: str, workspace_id: Optional[str] = "") -> Dict[str
 
         if not rows:
             await upsert_ai_state(wa_id, dict(DEFAULT_STATE), workspace_id=workspace_id)
-            print(f"SALES_STATE_LOAD_FLATTENED wa_id={wa_id} empty=true")
+            log.debug("SALES_STATE_LOAD_FLATTENED", wa_id=wa_id, empty=True)
             return dict(DEFAULT_STATE)
 
         state = rows[0].get("state") or {}
         merged = _merge_defaults(state)
-        print(
-            f"SALES_STATE_LOAD_FLATTENED wa_id={wa_id} "
-            f"state={json.dumps({k: merged.get(k) for k in ['service_interest', 'last_question_category', 'site_scope', 'lead_source', 'current_status']}, ensure_ascii=False)}"
+        log.debug(
+            "SALES_STATE_LOAD_FLATTENED",
+            wa_id=wa_id,
+            state=lambda: {k: merged.get(k) for k in ["service_interest", "last_question_category", "site_scope", "lead_source", "current_status"]},
         )
         return merged
 
     except Exception as e:
-        print(f"SALES_STATE_LOAD_RAW wa_id={wa_id} error={type(e).__name__}:{str(e)[:300]}")
+        log.error("SALES_STATE_LOAD_RAW", wa_id=wa_id, error=f"{type(e).__name__}:{str(e)[:300]}")
         return dict(DEFAULT_STATE)
 
 
+@traced("state_save")
 async def upsert_ai_state(wa_id: str, state: Dict[str, Any], workspace_id: Optional[str] = "") -> Dict[str, Any]:
     wa_id = _normalize_wa_id(wa_id)
     workspace_id = _resolve_workspace_id(workspace_id)
@@ -180,13 +203,18 @@ async def upsert_ai_state(wa_id: str, state: Dict[str, Any], workspace_id: Optio
         return dict(DEFAULT_STATE)
 
     merged = _merge_defaults(state or {})
-    print(
-        f"SALES_STATE_SAVE_PAYLOAD wa_id={wa_id} workspace_id={workspace_id} "
-        f"state={json.dumps({k: merged.get(k) for k in ['service_interest', 'last_question_category', 'last_question_asked', 'site_scope', 'lead_source', 'current_status', 'current_tools']}, ensure_ascii=False)[:900]}"
+    log.debug(
+        "SALES_STATE_SAVE_PAYLOAD",
+        wa_id=wa_id,
+        workspace_id=workspace_id,
+        state=lambda: {
+            k: merged.get(k)
+            for k in ["service_interest", "last_question_category", "last_question_asked", "site_scope", "lead_source", "current_status", "current_tools"]
+        },
     )
 
     if not _is_ready():
-        print("SALES_STATE_SAVE_RESULT skipped reason=supabase_not_configured")
+        log.debug("SALES_STATE_SAVE_RESULT", skipped=True, reason="supabase_not_configured")
         return merged
 
     payload = {
@@ -201,6 +229,7 @@ async def upsert_ai_state(wa_id: str, state: Dict[str, Any], workspace_id: Optio
     legacy_filter = f"wa_id=eq.{wa_id}"
 
     async def _patch(client: httpx.AsyncClient, query: str, body: Dict[str, Any]) -> httpx.Response:
+        forget_results(f"{SUPABASE_URL}/rest/v1/{TABLE}")
         return await client.patch(
             f"{SUPABASE_URL}/rest/v1/{TABLE}?{query}",
             headers={**_headers(), "Prefer": "return=representation"},
@@ -208,6 +237,7 @@ async def upsert_ai_state(wa_id: str, state: Dict[str, Any], workspace_id: Optio
         )
 
     async def _insert(client: httpx.AsyncClient, body: Dict[str, Any]) -> httpx.Response:
+        forget_results(f"{SUPABASE_URL}/rest/v1/{TABLE}")
         return await client.post(
             f"{SUPABASE_URL}/rest/v1/{TABLE}",
             headers={**_headers(), "Prefer": "return=representation"},
@@ -225,30 +255,30 @@ async def upsert_ai_state(wa_id: str, state: Dict[str, Any], workspace_id: Optio
     try:
         async with httpx.AsyncClient(timeout=12) as client:
             r = await _patch(client, workspace_filter, payload)
-            print(f"SALES_STATE_SAVE_RESULT op=patch_workspace status={r.status_code} body={_short_body(r.text)}")
+            _log_save_result("patch_workspace", r)
             state_out = _state_from_response(r)
             if state_out:
                 return state_out
 
             if _looks_like_missing_workspace(r.status_code, r.text):
                 r = await _patch(client, legacy_filter, legacy_payload)
-                print(f"SALES_STATE_SAVE_RESULT op=patch_legacy status={r.status_code} body={_short_body(r.text)}")
+                _log_save_result("patch_legacy", r)
                 state_out = _state_from_response(r)
                 if state_out:
                     return state_out
                 r = await _insert(client, legacy_payload)
-                print(f"SALES_STATE_SAVE_RESULT op=insert_legacy status={r.status_code} body={_short_body(r.text)}")
+                _log_save_result("insert_legacy", r)
                 state_out = _state_from_response(r)
                 return state_out or merged
 
             r = await _insert(client, payload)
-            print(f"SALES_STATE_SAVE_RESULT op=insert_workspace status={r.status_code} body={_short_body(r.text)}")
+            _log_save_result("insert_workspace", r)
             state_out = _state_from_response(r)
             if state_out:
                 return state_out
 
             r = await _patch(client, legacy_filter, legacy_payload)
-            print(f"SALES_STATE_SAVE_RESULT op=patch_legacy_after_insert status={r.status_code} body={_short_body(r.text)}")
+            _log_save_result("patch_legacy_after_insert", r)
             state_out = _state_from_response(r)
             if state_out:
                 return state_out
@@ -256,7 +286,7 @@ async def upsert_ai_state(wa_id: str, state: Dict[str, Any], workspace_id: Optio
         return merged
 
     except Exception as e:
-        print(f"SALES_STATE_SAVE_RESULT wa_id={wa_id} error={type(e).__name__}:{str(e)[:300]}")
+        log.error("SALES_STATE_SAVE_RESULT", wa_id=wa_id, error=f"{type(e).__name__}:{str(e)[:300]}")
         return merged
 
 
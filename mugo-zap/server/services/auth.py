@@ -1,9 +1,31 @@
 import os
+import time
+import asyncio
+import hashlib
+from typing import Any, Dict, Optional
+
 import httpx
+import jwt
 from fastapi import HTTPException
 
 SUPABASE_URL = (os.getenv("SUPABASE_URL") or "").strip().rstrip("/")
 SERVICE_KEY = (os.getenv("SUPABASE_SERVICE_ROLE_KEY") or "").strip()
+# /auth/v1/user aceita a anon key; service role só como fallback (mesma regra do app.py)
+SUPABASE_API_KEY = (os.getenv("SUPABASE_ANON_KEY") or "").strip() or SERVICE_KEY
+SUPABASE_JWT_SECRET = (os.getenv("SUPABASE_JWT_SECRET") or "").strip()
+SUPABASE_JWT_AUDIENCE = (os.getenv("SUPABASE_JWT_AUDIENCE") or "authenticated").strip()
+SUPABASE_JWKS_URL = (
+    os.getenv("SUPABASE_JWKS_URL")
+    or (f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json" if SUPABASE_URL else "")
+).strip()
+AUTH_CACHE_TTL_SECONDS = float((os.getenv("AUTH_CACHE_TTL_SECONDS") or "60").strip() or 60)
+AUTH_CACHE_MAX_ENTRIES = 512
+JWT_LEEWAY_SECONDS = 10
+
+_HMAC_ALGORITHMS = {"HS256", "HS384", "HS512"}
+_JWKS_ALGORITHMS = {"RS256", "ES256", "EdDSA"}
+_JWKS_CLIENT: Optional[jwt.PyJWKClient] = None
+_TOKEN_USER_CACHE: Dict[str, tuple[float, Dict[str, Any]]] = {}
 
 INTERNAL_ALLOWED_DOMAINS = [
     d.strip().lower()
@@ -26,22 +48,146 @@ async def get_user_from_token(token: str) -> dict:
     if not token:
         raise HTTPException(status_code=401, detail="Missing token")
 
-    if not SUPABASE_URL or not SERVICE_KEY:
+    if not SUPABASE_URL or not SUPABASE_API_KEY:
         raise HTTPException(status_code=500, detail="Server missing Supabase env")
 
+    cached = get_cached_token_user(token)
+    if cached:
+        return cached
+
+    claims = await verify_access_token(token)
+    if claims is not None:
+        user = user_from_claims(claims)
+        remember_token_user(token, user, token_exp=float(claims.get("exp") or 0))
+        return user
+
     url = f"{SUPABASE_URL}/auth/v1/user"
     headers = {
-        "apikey": SERVICE_KEY,
+        "apikey": SUPABASE_API_KEY,
         "Authorization": f"Bearer {token}",
     }
 
-    async with httpx.AsyncClient(timeout=10) as client:
-        r = await client.get(url, headers=headers)
+    try:
+        async with httpx.AsyncClient(timeout=10) as client:
+            r = await client.get(url, headers=headers)
+    except httpx.HTTPError as e:
+        print("SUPABASE AUTH ERROR:", repr(e))
+        raise HTTPException(status_code=503, detail="Auth service temporarily unavailable")
 
     if r.status_code != 200:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    return r.json()
+    user = r.json()
+    remember_token_user(token, user)
+    return user
+
+
+def _token_cache_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _jwks_client() -> Optional[jwt.PyJWKClient]:
+    global _JWKS_CLIENT
+    if _JWKS_CLIENT is None and SUPABASE_JWKS_URL:
+        _JWKS_CLIENT = jwt.PyJWKClient(SUPABASE_JWKS_URL, cache_keys=True, lifespan=600, timeout=6)
+    return _JWKS_CLIENT
+
+
+def _unverified_expiry(token: str) -> float:
+    try:
+        claims = jwt.decode(token, options={"verify_signature": False, "verify_exp": False})
+        return float(claims.get("exp") or 0)
+    except Exception:
+        return 0.0
+
+
+def get_cached_token_user(token: str) -> Optional[Dict[str, Any]]:
+    entry = _TOKEN_USER_CACHE.get(_token_cache_key(token))
+    if not entry:
+        return None
+    expires_at, user = entry
+    if expires_at <= time.time():
+        _TOKEN_USER_CACHE.pop(_token_cache_key(token), None)
+        return None
+    return dict(user)
+
+
+def remember_token_user(token: str, user: Dict[str, Any], token_exp: float = 0) -> None:
+    # nunca guarda além do exp do próprio token
+    if AUTH_CACHE_TTL_SECONDS <= 0 or not user:
+        return
+    now = time.time()
+    expires_at = now + AUTH_CACHE_TTL_SECONDS
+    token_exp = token_exp or _unverified_expiry(token)
+    if token_exp:
+        expires_at = min(expires_at, token_exp)
+    if expires_at <= now:
+        return
+    if len(_TOKEN_USER_CACHE) >= AUTH_CACHE_MAX_ENTRIES:
+        for key in [key for key, (exp, _) in _TOKEN_USER_CACHE.items() if exp <= now]:
+            _TOKEN_USER_CACHE.pop(key, None)
+        while len(_TOKEN_USER_CACHE) >= AUTH_CACHE_MAX_ENTRIES:
+            _TOKEN_USER_CACHE.pop(next(iter(_TOKEN_USER_CACHE)), None)
+    _TOKEN_USER_CACHE[_token_cache_key(token)] = (expires_at, dict(user))
+
+
+def user_from_claims(claims: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": claims.get("sub"),
+        "aud": claims.get("aud"),
+        "role": claims.get("role"),
+        "email": (claims.get("email") or "").strip().lower(),
+        "phone": claims.get("phone") or "",
+        "user_metadata": claims.get("user_metadata") or {},
+        "app_metadata": claims.get("app_metadata") or {},
+        "is_anonymous": bool(claims.get("is_anonymous")),
+    }
+
+
+async def verify_access_token(token: str) -> Optional[Dict[str, Any]]:
+    # None = sem chave local (segue para /auth/v1/user); token inválido/expirado = 401
+    token = (token or "").strip()
+    if not token:
+        raise HTTPException(status_code=401, detail="Missing token")
+
+    try:
+        header = jwt.get_unverified_header(token)
+    except jwt.PyJWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    alg = str(header.get("alg") or "")
+    if alg in _HMAC_ALGORITHMS and SUPABASE_JWT_SECRET:
+        key: Any = SUPABASE_JWT_SECRET
+    elif alg in _JWKS_ALGORITHMS and header.get("kid") and _jwks_client():
+        try:
+            key = (await asyncio.to_thread(_jwks_client().get_signing_key_from_jwt, token)).key
+        except (jwt.PyJWKClientError, jwt.exceptions.PyJWKError, jwt.InvalidTokenError) as e:
+            print("SUPABASE JWKS UNAVAILABLE:", repr(e))
+            return None
+    else:
+        return None
+
+    try:
+        claims = jwt.decode(
+            token,
+            key,
+            algorithms=[alg],
+            audience=SUPABASE_JWT_AUDIENCE or None,
+            leeway=JWT_LEEWAY_SECONDS,
+            options={"require": ["exp", "sub"], "verify_aud": bool(SUPABASE_JWT_AUDIENCE)},
+        )
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(status_code=401, detail="Token expired")
+    except jwt.PyJWTError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    issuer = str(claims.get("iss") or "")
+    if SUPABASE_URL and issuer and not issuer.startswith(SUPABASE_URL):
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if claims.get("role") not in (None, "authenticated"):
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    return claims
 
 
 def is_allowed_internal_user(user: dict) -> bool:
@@ -0,0 +1,193 @@
+import os
+import re
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+import httpx
+import requests
+
+from services import log
+
+# conta as chamadas HTTP de saída por cid (uma mensagem inbound) agrupadas por destino e template de URL
+
+# ligado por padrão de propósito: instala no import do app um wrapper em httpx/requests send() que só
+# incrementa um dict; o log CALL_BUDGET e scripts/check_call_budget.py dependem dele
+CALL_BUDGET_ENABLED = (os.getenv("CALL_BUDGET_ENABLED") or "1").strip().lower() not in {"0", "false", "no", "off"}
+CALL_BUDGET_WARN_TOTAL = int((os.getenv("CALL_BUDGET_WARN_TOTAL") or "0").strip() or 0)
+CALL_BUDGET_RECENT = 200
+
+_SUPABASE_HOST = urlsplit((os.getenv("SUPABASE_URL") or "").strip()).netloc
+_GRAPH_HOST = urlsplit((os.getenv("WHATSAPP_GRAPH_BASE_URL") or "https://graph.facebook.com").strip()).netloc
+_OPENAI_HOST = urlsplit((os.getenv("OPENAI_BASE_URL") or "https://api.openai.com/v1").strip()).netloc
+
+_CURRENT: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("call_budget_ledger", default=None)
+_LOCK = threading.Lock()
+_RECENT: deque = deque(maxlen=CALL_BUDGET_RECENT)
+_TOTALS: Dict[str, int] = {}
+_STATE: Dict[str, bool] = {"installed": False}
+
+# parâmetros PostgREST cujo valor descreve a consulta (os demais carregam dados do lead)
+_STRUCTURAL_PARAMS = {"select", "order", "on_conflict", "columns"}
+_POSTGREST_OPS = re.compile(r"^(eq|neq|lt|lte|gt|gte|like|ilike|is|in|cs|cd|not)\.")
+_ID_SEGMENT = re.compile(r"^(\d+|[0-9a-f]{8}-[0-9a-f-]{27,}|[0-9a-f]{24,})$", re.IGNORECASE)
+
+
+def _target(host: str) -> str:
+    if host and host == _SUPABASE_HOST:
+        return "supabase"
+    if host == _GRAPH_HOST:
+        return "graph"
+    if host == _OPENAI_HOST:
+        return "openai"
+    return host or "unknown"
+
+
+@lru_cache(maxsize=2048)
+def url_template(url: str) -> tuple:
+    parts = urlsplit(url)
+    path = "/".join("{id}" if _ID_SEGMENT.match(segment) else segment for segment in parts.path.split("/"))
+    params = []
+    for key, value in parse_qsl(parts.query, keep_blank_values=True):
+        if key in _STRUCTURAL_PARAMS:
+            params.append(f"{key}={value}")
+        else:
+            op = _POSTGREST_OPS.match(value)
+            params.append(f"{key}={op.group(1)}" if op else key)
+    template = path + ("?" + "&".join(sorted(params)) if params else "")
+    return _target(parts.netloc), template
+
+
+def record(method: str, url: str) -> None:
+    target, template = url_template(str(url))
+    key = f"{str(method).upper()} {template}"
+    with _LOCK:
+        _TOTALS[target] = _TOTALS.get(target, 0) + 1
+    ledger = _CURRENT.get()
+    if ledger is None:
+        return
+    with _LOCK:
+        calls = ledger["calls"].setdefault(target, {})
+        calls[key] = calls.get(key, 0) + 1
+
+
+def install() -> None:
+    # instrumenta a camada HTTP uma vez: httpx (sync/async) e requests passam todos por send()
+    if _STATE["installed"] or not CALL_BUDGET_ENABLED:
+        return
+    _STATE["installed"] = True
+
+    sync_send = httpx.Client.send
+    async_send = httpx.AsyncClient.send
+    requests_send = requests.Session.send
+
+    def _httpx_send(self, request, *args, **kwargs):
+        record(request.method, request.url)
+        return sync_send(self, request, *args, **kwargs)
+
+    async def _httpx_async_send(self, request, *args, **kwargs):
+        record(request.method, request.url)
+        return await async_send(self, request, *args, **kwargs)
+
+    def _requests_send(self, request, **kwargs):
+        record(request.method, request.url)
+        return requests_send(self, request, **kwargs)
+
+    httpx.Client.send = _httpx_send
+    httpx.AsyncClient.send = _httpx_async_send
+    requests.Session.send = _requests_send
+
+
+def summarize(ledger: Dict[str, Any]) -> Dict[str, Any]:
+    with _LOCK:
+        calls = {target: dict(templates) for target, templates in ledger["calls"].items()}
+    by_target = {target: sum(templates.values()) for target, templates in calls.items()}
+    return {
+        "cid": ledger["cid"],
+        "labels": dict(ledger.get("labels") or {}),
+        "total": sum(by_target.values()),
+        "by_target": by_target,
+        "by_template": calls,
+        "elapsed_ms": int(((ledger.get("finished") or time.monotonic()) - ledger["started"]) * 1000),
+    }
+
+
+def _log(summary: Dict[str, Any]) -> None:
+    # pelo mesmo writer do log estruturado: com LOG_ASYNC=1 não sai fora de ordem com os eventos do cid
+    log.info(
+        "CALL_BUDGET",
+        cid=summary["cid"],
+        total=summary["total"],
+        **dict(sorted(summary["by_target"].items())),
+        elapsed_ms=summary["elapsed_ms"],
+    )
+    if CALL_BUDGET_WARN_TOTAL and summary["total"] > CALL_BUDGET_WARN_TOTAL:
+        top = sorted(
+            ((count, target, key) for target, templates in summary["by_template"].items() for key, count in templates.items()),
+            reverse=True,
+        )[:5]
+        log.warning(
+            "CALL_BUDGET_EXCEEDED",
+            cid=summary["cid"],
+            total=summary["total"],
+            limit=CALL_BUDGET_WARN_TOTAL,
+            top=[f"{target}:{key}x{count}" for count, target, key in top],
+        )
+
+
+@contextmanager
+def track(cid: str, log: bool = True, **labels: Any) -> Iterator[Dict[str, Any]]:
+    outer = _CURRENT.get()
+    if outer is not None:
+        # chamada aninhada (ex.: process_inbound_sales_message dentro do webhook) conta no cid de fora
+        yield outer
+        return
+    ledger = {"cid": cid, "labels": labels, "started": time.monotonic(), "finished": None, "calls": {}}
+    token = _CURRENT.set(ledger)
+    try:
+        yield ledger
+    finally:
+        _CURRENT.reset(token)
+        ledger["finished"] = time.monotonic()
+        summary = summarize(ledger)
+        with _LOCK:
+            _RECENT.append(summary)
+        if log and _STATE["installed"]:
+            _log(summary)
+
+
+def current() -> Optional[Dict[str, Any]]:
+    return _CURRENT.get()
+
+
+def check(ledger: Dict[str, Any], budget: Dict[str, int]) -> List[str]:
+    # budget por destino ("supabase", "graph", "openai") e/ou "total"
+    summary = summarize(ledger)
+    violations = []
+    for target, limit in budget.items():
+        used = summary["total"] if target == "total" else summary["by_target"].get(target, 0)
+        if used > limit:
+            templates = summary["by_template"] if target == "total" else {target: summary["by_template"].get(target, {})}
+            detail = sorted(
+                (f"{name}:{key} x{count}" for name, keys in templates.items() for key, count in keys.items()),
+            )
+            violations.append(f"{target} used={used} budget={limit} calls={detail}")
+    return violations
+
+
+def assert_within(ledger: Dict[str, Any], budget: Dict[str, int]) -> None:
+    violations = check(ledger, budget)
+    if violations:
+        raise AssertionError(f"call budget exceeded cid={ledger['cid']}: " + "; ".join(violations))
+
+
+def call_budget_stats(limit: int = 20) -> Dict[str, Any]:
+    with _LOCK:
+        recent = list(_RECENT)[-max(0, limit):]
+        totals = dict(_TOTALS)
+    return {"enabled": CALL_BUDGET_ENABLED, "installed": _STATE["installed"], "totals": totals, "warn_total": CALL_BUDGET_WARN_TOTAL, "recent": recent}
@@ -0,0 +1,188 @@
+import os
+import time
+import asyncio
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+
+import httpx
+
+COALESCE_RESULT_TTL_SECONDS = float((os.getenv("COALESCE_RESULT_TTL_MS") or "0").strip() or 0) / 1000.0
+COALESCE_MAX_RESULTS = 256
+
+_LOCK = threading.Lock()
+_INFLIGHT: Dict[str, Dict[str, Any]] = {}
+_ASYNC_INFLIGHT: Dict[str, asyncio.Future] = {}
+_RESULTS: Dict[str, tuple[float, httpx.Response]] = {}
+# sequência de escritas: prefixo (URL da tabela, "" = tudo) -> número da última escrita que o invalidou
+_WRITE_SEQ: Dict[str, int] = {"": 0}
+_SEQ: Dict[str, int] = {"value": 0}
+_STATS: Dict[str, int] = {"requests": 0, "leaders": 0, "collapsed": 0, "ttl_hits": 0, "errors": 0}
+
+
+def _key(url: str, headers: Optional[Dict[str, str]]) -> str:
+    auth = str((headers or {}).get("Authorization") or (headers or {}).get("apikey") or "")
+    return f"{url}|{hashlib.sha1(auth.encode('utf-8')).hexdigest()[:12]}"
+
+
+def _ttl(ttl: Optional[float]) -> float:
+    return COALESCE_RESULT_TTL_SECONDS if ttl is None else max(0.0, float(ttl))
+
+
+def _cached_result(key: str) -> Optional[httpx.Response]:
+    entry = _RESULTS.get(key)
+    if not entry:
+        return None
+    if entry[0] <= time.monotonic():
+        _RESULTS.pop(key, None)
+        return None
+    _STATS["ttl_hits"] += 1
+    return entry[1]
+
+
+def _table_prefix(url: str) -> str:
+    return str(url or "").split("?", 1)[0]
+
+
+def _matches(key: str, prefix: str) -> bool:
+    if not prefix:
+        return True
+    return key.startswith(prefix) and key[len(prefix):len(prefix) + 1] in {"", "?", "|"}
+
+
+def _written_since(key: str, seq: int) -> bool:
+    return any(last > seq and _matches(key, prefix) for prefix, last in _WRITE_SEQ.items())
+
+
+def _remember_result(key: str, response: httpx.Response, ttl: float, seq: int) -> None:
+    if ttl <= 0 or response.status_code != 200:
+        return
+    with _LOCK:
+        # leitura que começou antes de uma escrita na mesma tabela não pode ficar em cache
+        if _written_since(key, seq):
+            return
+        while len(_RESULTS) >= COALESCE_MAX_RESULTS:
+            _RESULTS.pop(next(iter(_RESULTS)), None)
+        _RESULTS[key] = (time.monotonic() + ttl, response)
+
+
+def forget_results(url: str = "") -> None:
+    # escrita local na tabela de `url` (vazio = todas): descarta resultados em cache e desacopla leituras em voo dela
+    prefix = _table_prefix(url)
+    with _LOCK:
+        _SEQ["value"] += 1
+        _WRITE_SEQ[prefix] = _SEQ["value"]
+        for store in (_RESULTS, _INFLIGHT, _ASYNC_INFLIGHT):
+            for key in [key for key in store if _matches(key, prefix)]:
+                store.pop(key, None)
+
+
+def coalesce_stats() -> Dict[str, Any]:
+    with _LOCK:
+        return {
+            **_STATS,
+            "inflight": len(_INFLIGHT) + len(_ASYNC_INFLIGHT),
+            "cached_results": len(_RESULTS),
+            "result_ttl_ms": int(COALESCE_RESULT_TTL_SECONDS * 1000),
+        }
+
+
+def coalesced_get(
+    client: httpx.Client,
+    url: str,
+    headers: Optional[Dict[str, str]] = None,
+    *,
+    ttl: Optional[float] = None,
+) -> httpx.Response:
+    key = _key(url, headers)
+    ttl = _ttl(ttl)
+
+    with _LOCK:
+        _STATS["requests"] += 1
+        cached = _cached_result(key)
+        if cached is not None:
+            return cached
+        entry = _INFLIGHT.get(key)
+        leader = entry is None
+        seq = _SEQ["value"]
+        if leader:
+            entry = _INFLIGHT[key] = {"event": threading.Event(), "response": None, "error": None}
+            _STATS["leaders"] += 1
+        else:
+            _STATS["collapsed"] += 1
+
+    if not leader:
+        entry["event"].wait()
+        if entry["error"] is not None:
+            raise entry["error"]
+        return entry["response"]
+
+    try:
+        response = client.get(url, headers=headers)
+        entry["response"] = response
+        _remember_result(key, response, ttl, seq)
+        return response
+    except Exception as e:
+        entry["error"] = e
+        _STATS["errors"] += 1
+        raise
+    finally:
+        with _LOCK:
+            if _INFLIGHT.get(key) is entry:
+                _INFLIGHT.pop(key, None)
+        entry["event"].set()
+
+
+async def coalesced_get_async(
+    client: httpx.AsyncClient,
+    url: str,
+    headers: Optional[Dict[str, str]] = None,
+    *,
+    ttl: Optional[float] = None,
+) -> httpx.Response:
+    key = _key(url, headers)
+    ttl = _ttl(ttl)
+
+    with _LOCK:
+        _STATS["requests"] += 1
+        cached = _cached_result(key)
+        if cached is not None:
+            return cached
+
+    while True:
+        with _LOCK:
+            future = _ASYNC_INFLIGHT.get(key)
+            leader = future is None
+            seq = _SEQ["value"]
+            if leader:
+                future = _ASYNC_INFLIGHT[key] = asyncio.get_running_loop().create_future()
+                _STATS["leaders"] += 1
+            else:
+                _STATS["collapsed"] += 1
+
+        if leader:
+            break
+        response = await asyncio.shield(future)
+        if response is not None:
+            return response
+        # líder cancelado (resultado None): quem esperava tenta de novo em vez de herdar o cancelamento
+
+    try:
+        response = await client.get(url, headers=headers)
+        future.set_result(response)
+        _remember_result(key, response, ttl, seq)
+        return response
+    except asyncio.CancelledError:
+        if not future.done():
+            future.set_result(None)
+        raise
+    except Exception as e:
+        _STATS["errors"] += 1
+        if not future.done():
+            future.set_exception(e)
+            future.exception()
+        raise
+    finally:
+        with _LOCK:
+            if _ASYNC_INFLIGHT.get(key) is future:
+                _ASYNC_INFLIGHT.pop(key, None)
@@ -0,0 +1,440 @@
+import os
+import json
+import time
+import bisect
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+# contadores são por worker (memória do processo): cada worker soma só o que ele viu e o reseed realinha com o banco
+DASHBOARD_RESEED_SECONDS = float((os.getenv("DASHBOARD_RESEED_SECONDS") or "300").strip() or 300)
+DASHBOARD_SEED_LIMIT = int((os.getenv("DASHBOARD_SEED_LIMIT") or "5000").strip() or 5000)
+DASHBOARD_TREND_MESSAGE_LIMIT = int((os.getenv("DASHBOARD_TREND_MESSAGE_LIMIT") or "50000").strip() or 50000)
+NEW_LEAD_WINDOW_SECONDS = 300
+HOURLY_BUCKETS = 48
+DAILY_BUCKETS = 35
+
+ROLLUP_EVENTS = ("messages_in", "messages_out", "new_leads", "handoffs")
+HANDOFF_STATUSES = {"handoff", "handoff_pending", "handoff_active"}
+BOT_STATUSES = {"bot_active", "ai_active", "resume_ready"}
+PAUSED_STATUSES = {"automation_paused", "paused"}
+FLOW_STATUSES = {
+    "bot_active",
+    "ai_active",
+    "human_active",
+    "handoff_pending",
+    "handoff_active",
+    "paused",
+    "followup_scheduled",
+    "resume_ready",
+    "closed",
+}
+
+_LOCK = threading.RLock()
+_WORKSPACES: Dict[str, Dict[str, Any]] = {}
+
+
+def operation_status(row: Optional[Dict[str, Any]]) -> str:
+    row = row or {}
+
+    flow_data = row.get("flow_data") or {}
+    if isinstance(flow_data, str):
+        try:
+            flow_data = json.loads(flow_data)
+        except Exception:
+            flow_data = {}
+
+    flow_status = str((flow_data or {}).get("bot_status") or "").strip().lower()
+    attendance_mode = ((row.get("attendance_mode") or "")).strip().lower()
+    automation_paused = bool(row.get("automation_paused"))
+    bot_enabled = bool(row.get("bot_enabled", True))
+    handoff_active = bool(row.get("handoff_active"))
+    handoff_at = (row.get("handoff_at") or "").strip()
+
+    if flow_status in FLOW_STATUSES:
+        return flow_status
+
+    if handoff_active or handoff_at:
+        return "handoff"
+
+    if attendance_mode == "human":
+        return "human_active"
+
+    if automation_paused:
+        return "automation_paused"
+
+    if bot_enabled:
+        return "bot_active"
+
+    return "manual"
+
+
+# colunas cruas de whatsapp_users que decidem a classificação; seed e updates ao vivo usam só elas
+ROW_FIELDS = (
+    "assigned_to",
+    "human_owner",
+    "owner",
+    "source",
+    "last_source",
+    "entry_type",
+    "inbound_type",
+    "attendance_mode",
+    "automation_paused",
+    "bot_enabled",
+    "handoff_active",
+    "handoff_at",
+)
+
+
+def normalize_row(row: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    # só o que veio na linha: um update parcial não apaga o que o seed já sabia
+    row = row or {}
+    fields = {key: row[key] for key in ROW_FIELDS if key in row}
+    if "flow_data" in row:
+        flow_data = row.get("flow_data") or {}
+        if isinstance(flow_data, str):
+            try:
+                flow_data = json.loads(flow_data)
+            except Exception:
+                flow_data = {}
+        fields["flow_status"] = str((flow_data or {}).get("bot_status") or "").strip().lower()
+    return fields
+
+
+def _owner(row: Dict[str, Any]) -> str:
+    return str(row.get("assigned_to") or row.get("human_owner") or row.get("owner") or "").strip().lower()
+
+
+def _classify(fields: Dict[str, Any]) -> tuple:
+    source = str(fields.get("source") or fields.get("last_source") or "sem_origem").strip() or "sem_origem"
+    entry_type = str(fields.get("entry_type") or fields.get("inbound_type") or "unknown").strip() or "unknown"
+    status = operation_status({**fields, "flow_data": {"bot_status": fields.get("flow_status") or ""}}) or "manual"
+    return (_owner(fields), source, entry_type, status)
+
+
+def _parse_ts(value: Any) -> Optional[datetime]:
+    raw = str(value or "").strip()
+    if not raw:
+        return None
+    try:
+        parsed = datetime.fromisoformat(raw.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _created_recently(row: Dict[str, Any]) -> bool:
+    created = _parse_ts(row.get("created_at"))
+    return bool(created) and (datetime.now(timezone.utc) - created).total_seconds() <= NEW_LEAD_WINDOW_SECONDS
+
+
+def _empty_counters() -> Dict[str, Any]:
+    return {
+        "conversations_open": 0,
+        "handoffs_pending": 0,
+        "waiting_human": 0,
+        "bot_active": 0,
+        "paused_automation": 0,
+        "leads_by_source": {},
+        "leads_by_entry_type": {},
+        "leads_by_status": {},
+    }
+
+
+def _empty_workspace() -> Dict[str, Any]:
+    return {
+        "seeded_at": 0.0,
+        "seeding": False,
+        # observações feitas enquanto o seed consulta o banco; reaplicadas no bucket novo antes da troca
+        "journal": [],
+        "rows": {},
+        "buckets": {},
+        "tasks": {},
+        "due": [],
+        "hourly": {},
+        "daily": {},
+        "trends_rebuilt_at": "",
+        "trends_truncated": False,
+    }
+
+
+def _workspace(workspace_id: str) -> Dict[str, Any]:
+    ws = _WORKSPACES.get(workspace_id)
+    if ws is None:
+        ws = _WORKSPACES[workspace_id] = _empty_workspace()
+    return ws
+
+
+def _bump(mapping: Dict[str, int], key: str, delta: int) -> None:
+    value = mapping.get(key, 0) + delta
+    if value > 0:
+        mapping[key] = value
+    else:
+        mapping.pop(key, None)
+
+
+def _apply(ws: Dict[str, Any], klass: tuple, delta: int) -> None:
+    owner, source, entry_type, status = klass
+    counters = ws["buckets"].get(owner)
+    if counters is None:
+        counters = ws["buckets"][owner] = _empty_counters()
+
+    counters["conversations_open"] += delta
+    _bump(counters["leads_by_source"], source, delta)
+    _bump(counters["leads_by_entry_type"], entry_type, delta)
+    _bump(counters["leads_by_status"], status, delta)
+    if status in HANDOFF_STATUSES:
+        counters["handoffs_pending"] += delta
+    if status == "human_active":
+        counters["waiting_human"] += delta
+    if status in BOT_STATUSES:
+        counters["bot_active"] += delta
+    if status in PAUSED_STATUSES:
+        counters["paused_automation"] += delta
+
+
+def _bucket_keys(at: Optional[datetime] = None) -> tuple:
+    at = at or datetime.now(timezone.utc)
+    return at.strftime("%Y-%m-%dT%H:00"), at.strftime("%Y-%m-%d")
+
+
+def _record(ws: Dict[str, Any], event: str, amount: int = 1, at: Optional[datetime] = None) -> None:
+    hour_key, day_key = _bucket_keys(at)
+    for series, key, keep in (("hourly", hour_key, HOURLY_BUCKETS), ("daily", day_key, DAILY_BUCKETS)):
+        buckets = ws[series]
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = {name: 0 for name in ROLLUP_EVENTS}
+            for old_key in sorted(buckets)[:-keep]:
+                buckets.pop(old_key, None)
+        bucket[event] = bucket.get(event, 0) + amount
+
+
+def _observe(ws: Dict[str, Any], apply: Callable[..., None], *args: Any) -> None:
+    # chamar com _LOCK; durante o seed a mesma observação fica no journal para o bucket novo
+    apply(ws, *args)
+    if ws["seeding"]:
+        ws["journal"].append((time.monotonic(), apply, args))
+
+
+def record_event(workspace_id: str, event: str, amount: int = 1) -> None:
+    if not workspace_id or event not in ROLLUP_EVENTS:
+        return
+    with _LOCK:
+        _observe(_workspace(workspace_id), _record, event, amount)
+
+
+def _observe_conversation(ws: Dict[str, Any], wa_id: str, row: Dict[str, Any], is_new: Optional[bool]) -> None:
+    known = ws["rows"].get(wa_id)
+    previous, fields = known if known is not None else (None, {})
+    fields = {**fields, **normalize_row(row)}
+    klass = _classify(fields)
+    ws["rows"][wa_id] = (klass, fields)
+    if previous == klass:
+        return
+    if previous is not None:
+        _apply(ws, previous, -1)
+    elif ws["seeded_at"] and (is_new if is_new is not None else _created_recently(row)):
+        # lead fora do DASHBOARD_SEED_LIMIT entra nos contadores mas não vira lead novo
+        _record(ws, "new_leads")
+    _apply(ws, klass, 1)
+    if klass[3] in HANDOFF_STATUSES and (previous is None or previous[3] not in HANDOFF_STATUSES):
+        _record(ws, "handoffs")
+
+
+def observe_conversation(workspace_id: str, row: Optional[Dict[str, Any]], is_new: Optional[bool] = None) -> None:
+    # row: linha crua de whatsapp_users (ou parcial, ex.: só flow_data); is_new=None decide por created_at
+    wa_id = str((row or {}).get("wa_id") or "").strip()
+    if not workspace_id or not wa_id:
+        return
+
+    with _LOCK:
+        _observe(_workspace(workspace_id), _observe_conversation, wa_id, dict(row or {}), is_new)
+
+
+def _forget_conversation(ws: Dict[str, Any], wa_id: str) -> None:
+    previous = ws["rows"].pop(wa_id, None)
+    if previous is not None:
+        _apply(ws, previous[0], -1)
+    for task_id in [task_id for task_id, task in ws["tasks"].items() if task[1] == wa_id]:
+        _drop_task(ws, task_id)
+
+
+def forget_conversation(workspace_id: str, wa_id: str) -> None:
+    wa_id = str(wa_id or "").strip()
+    with _LOCK:
+        ws = _WORKSPACES.get(workspace_id)
+        if not ws:
+            return
+        _observe(ws, _forget_conversation, wa_id)
+
+
+def _drop_task(ws: Dict[str, Any], task_id: str) -> None:
+    task = ws["tasks"].pop(task_id, None)
+    if task is None:
+        return
+    index = bisect.bisect_left(ws["due"], (task[0], task_id))
+    if index < len(ws["due"]) and ws["due"][index] == (task[0], task_id):
+        ws["due"].pop(index)
+
+
+def _observe_task(ws: Dict[str, Any], task_id: str, task: Dict[str, Any]) -> None:
+    previous = ws["tasks"].get(task_id)
+    status = str(task.get("status") or "open").strip().lower()
+    if status != "open":
+        _drop_task(ws, task_id)
+        return
+    due_at = str(task.get("due_at") or (previous or ("",))[0] or "").strip()
+    wa_id = str(task.get("wa_id") or (previous or ("", ""))[1] or "").strip()
+    _drop_task(ws, task_id)
+    ws["tasks"][task_id] = (due_at, wa_id)
+    if due_at:
+        bisect.insort(ws["due"], (due_at, task_id))
+
+
+def observe_task(workspace_id: str, task: Optional[Dict[str, Any]]) -> None:
+    task = task or {}
+    task_id = str(task.get("id") or "").strip()
+    if not workspace_id or not task_id:
+        return
+
+    with _LOCK:
+        _observe(_workspace(workspace_id), _observe_task, task_id, dict(task))
+
+
+def needs_seed(workspace_id: str) -> bool:
+    ws = _WORKSPACES.get(workspace_id)
+    return not ws or not ws["seeded_at"]
+
+
+def is_stale(workspace_id: str) -> bool:
+    ws = _WORKSPACES.get(workspace_id)
+    if not ws or not ws["seeded_at"]:
+        return True
+    return (time.monotonic() - ws["seeded_at"]) >= DASHBOARD_RESEED_SECONDS
+
+
+def _rebuild_trends(fresh: Dict[str, Any], rows: List[Dict[str, Any]], messages: List[Dict[str, Any]]) -> None:
+    # mesmos eventos do ao vivo, reconstruídos do banco: novos leads (created_at), handoffs (handoff_at), mensagens
+    now = datetime.now(timezone.utc)
+    oldest = now - timedelta(days=DAILY_BUCKETS)
+    for row in rows:
+        for column, event in (("created_at", "new_leads"), ("handoff_at", "handoffs")):
+            at = _parse_ts(row.get(column))
+            if at and oldest <= at <= now:
+                _record(fresh, event, at=at)
+    for message in messages:
+        direction = str(message.get("direction") or "").strip()
+        at = _parse_ts(message.get("created_at"))
+        if direction in {"in", "out"} and at and oldest <= at <= now:
+            _record(fresh, f"messages_{direction}", at=at)
+    fresh["trends_rebuilt_at"] = now.isoformat()
+    fresh["trends_truncated"] = len(messages) >= DASHBOARD_TREND_MESSAGE_LIMIT
+
+
+def seed_workspace(
+    workspace_id: str,
+    load_rows: Callable[[int], Iterable[Dict[str, Any]]],
+    load_open_tasks: Callable[[int], Iterable[Dict[str, Any]]],
+    load_messages: Optional[Callable[[str, int], Iterable[Dict[str, Any]]]] = None,
+) -> None:
+    # load_rows: linhas cruas de whatsapp_users com flow_data (mesmo formato que upsert_user devolve)
+    with _LOCK:
+        ws = _workspace(workspace_id)
+        if ws["seeding"]:
+            return
+        ws["seeding"] = True
+        ws["journal"] = []
+
+    try:
+        started = time.monotonic()
+        rows = list(load_rows(DASHBOARD_SEED_LIMIT) or [])
+        tasks = list(load_open_tasks(DASHBOARD_SEED_LIMIT) or [])
+        since = (datetime.now(timezone.utc) - timedelta(days=DAILY_BUCKETS)).isoformat()
+        messages = list(load_messages(since, DASHBOARD_TREND_MESSAGE_LIMIT) or []) if load_messages else []
+        messages_loaded_at = time.monotonic()
+
+        fresh = _empty_workspace()
+        for row in rows:
+            wa_id = str((row or {}).get("wa_id") or "").strip()
+            if not wa_id or wa_id in fresh["rows"]:
+                continue
+            fields = normalize_row(row)
+            klass = _classify(fields)
+            _apply(fresh, klass, 1)
+            fresh["rows"][wa_id] = (klass, fields)
+        for task in tasks:
+            task_id = str((task or {}).get("id") or "").strip()
+            due_at = str((task or {}).get("due_at") or "").strip()
+            if not task_id:
+                continue
+            fresh["tasks"][task_id] = (due_at, str(task.get("wa_id") or "").strip())
+            if due_at:
+                fresh["due"].append((due_at, task_id))
+        fresh["due"].sort()
+        if load_messages:
+            _rebuild_trends(fresh, rows, messages)
+
+        with _LOCK:
+            ws = _workspace(workspace_id)
+            fresh["seeded_at"] = time.monotonic()
+            replayed = 0
+            for at, apply, args in ws["journal"]:
+                # evento de tendência anterior à consulta de mensagens provavelmente já veio do banco
+                if apply is _record and load_messages and at < messages_loaded_at:
+                    continue
+                apply(fresh, *args)
+                replayed += 1
+            if not load_messages:
+                # sem reconstrução as tendências seguem as ao vivo, que já contêm o que foi reaplicado
+                fresh["hourly"] = ws["hourly"]
+                fresh["daily"] = ws["daily"]
+            _WORKSPACES[workspace_id] = fresh
+        print(
+            f"DASHBOARD_COUNTERS:seeded workspace_id={workspace_id} conversations={len(fresh['rows'])} "
+            f"open_tasks={len(fresh['tasks'])} messages={len(messages)} replayed={replayed} ms={int((time.monotonic() - started) * 1000)}"
+        )
+    finally:
+        with _LOCK:
+            ws = _workspace(workspace_id)
+            ws["seeding"] = False
+            ws["journal"] = []
+
+
+def _merge_counters(target: Dict[str, Any], counters: Dict[str, Any]) -> None:
+    for key, value in counters.items():
+        if isinstance(value, dict):
+            bucket = target.setdefault(key, {})
+            for name, count in value.items():
+                bucket[name] = bucket.get(name, 0) + count
+        else:
+            target[key] = target.get(key, 0) + value
+
+
+def summary(workspace_id: str, owners: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    now_iso = datetime.now(timezone.utc).isoformat()
+    result = _empty_counters()
+    with _LOCK:
+        ws = _workspace(workspace_id)
+        if owners is None:
+            selected: List[Dict[str, Any]] = list(ws["buckets"].values())
+        else:
+            keys = {""} | {str(owner or "").strip().lower() for owner in owners}
+            selected = [ws["buckets"][key] for key in keys if key in ws["buckets"]]
+        for counters in selected:
+            _merge_counters(result, counters)
+        result["urgent_tasks"] = bisect.bisect_right(ws["due"], (now_iso, "\uffff"))
+    return result
+
+
+def trends(workspace_id: str) -> Dict[str, Any]:
+    # buckets reconstruídos do Supabase a cada reseed; entre reseeds cada worker soma só os eventos que ele viu
+    with _LOCK:
+        ws = _workspace(workspace_id)
+        return {
+            "hourly": [{"bucket": key, **ws["hourly"][key]} for key in sorted(ws["hourly"])],
+            "daily": [{"bucket": key, **ws["daily"][key]} for key in sorted(ws["daily"])],
+            "rebuilt_at": ws["trends_rebuilt_at"],
+            "truncated": ws["trends_truncated"],
+            "approximate": True,
+        }
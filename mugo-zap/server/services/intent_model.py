@@ -0,0 +1,201 @@
+import os
+import json
+import math
+import random
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+INTENT_MODEL_PATH = Path(
+    (os.getenv("INTENT_MODEL_PATH") or "").strip()
+    or (Path(__file__).resolve().parents[1] / "data" / "intent_model.json")
+)
+INTENT_MODEL_MIN_CONFIDENCE = float((os.getenv("INTENT_MODEL_MIN_CONFIDENCE") or "0.8").strip() or 0.8)
+NGRAM_MIN = 2
+NGRAM_MAX = 4
+MIN_DF = 2
+WEIGHT_EPSILON = 1e-3
+# classe negativa: confirmação, saudação e conversa sem serviço; sem ela todo texto cai em algum serviço
+NEGATIVE_LABEL = "other"
+
+_LOCK = threading.Lock()
+_MODEL_CACHE: Dict[str, Any] = {"mtime": None, "model": None}
+
+
+def features(norm: str) -> Dict[str, int]:
+    # n-gramas de caracteres (com borda de palavra) + palavras inteiras; espera texto já normalizado
+    counts: Dict[str, int] = {}
+    norm = (norm or "").strip()
+    if not norm:
+        return counts
+    padded = f" {norm} "
+    for size in range(NGRAM_MIN, NGRAM_MAX + 1):
+        for index in range(len(padded) - size + 1):
+            gram = padded[index:index + size]
+            counts[gram] = counts.get(gram, 0) + 1
+    for word in norm.split():
+        key = f"w:{word}"
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def _vectorize(norm: str, idf: Dict[str, float]) -> Dict[str, float]:
+    vector = {
+        gram: (1.0 + math.log(count)) * idf[gram]
+        for gram, count in features(norm).items()
+        if gram in idf
+    }
+    length = math.sqrt(sum(value * value for value in vector.values())) or 1.0
+    return {gram: value / length for gram, value in vector.items()}
+
+
+def _softmax(scores: List[float]) -> List[float]:
+    top = max(scores)
+    exps = [math.exp(score - top) for score in scores]
+    total = sum(exps) or 1.0
+    return [value / total for value in exps]
+
+
+def train(
+    samples: Iterable[Tuple[str, str]],
+    *,
+    epochs: int = 12,
+    learning_rate: float = 0.8,
+    l2: float = 1e-5,
+    seed: int = 7,
+) -> Dict[str, Any]:
+    # regressão logística multinomial com SGD sobre TF-IDF esparso
+    samples = [(norm, label) for norm, label in samples if norm and label]
+    if not samples:
+        raise ValueError("no training samples")
+    labels = sorted({label for _, label in samples})
+    label_index = {label: index for index, label in enumerate(labels)}
+
+    df: Dict[str, int] = {}
+    for norm, _ in samples:
+        for gram in features(norm):
+            df[gram] = df.get(gram, 0) + 1
+    total = len(samples)
+    idf = {gram: math.log((1 + total) / (1 + count)) + 1.0 for gram, count in df.items() if count >= MIN_DF}
+
+    vectors = [(_vectorize(norm, idf), label_index[label]) for norm, label in samples]
+    weights: Dict[str, List[float]] = {}
+    bias = [0.0] * len(labels)
+    rng = random.Random(seed)
+
+    for epoch in range(epochs):
+        rng.shuffle(vectors)
+        rate = learning_rate / (1.0 + epoch * 0.5)
+        for vector, target in vectors:
+            scores = list(bias)
+            for gram, value in vector.items():
+                row = weights.get(gram)
+                if row:
+                    for index, weight in enumerate(row):
+                        scores[index] += weight * value
+            probs = _softmax(scores)
+            for index, prob in enumerate(probs):
+                gradient = prob - (1.0 if index == target else 0.0)
+                bias[index] -= rate * gradient
+                for gram, value in vector.items():
+                    row = weights.get(gram)
+                    if row is None:
+                        row = weights[gram] = [0.0] * len(labels)
+                    row[index] -= rate * (gradient * value + l2 * row[index])
+
+    pruned = {
+        gram: [round(weight, 5) for weight in row]
+        for gram, row in weights.items()
+        if any(abs(weight) >= WEIGHT_EPSILON for weight in row)
+    }
+    return {
+        "version": 1,
+        "labels": labels,
+        "idf": {gram: round(value, 5) for gram, value in idf.items() if gram in pruned},
+        "weights": pruned,
+        "bias": [round(value, 5) for value in bias],
+        "samples": total,
+        "trained_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def predict_proba(norm: str, model: Optional[Dict[str, Any]] = None) -> Dict[str, float]:
+    model = model or load_model()
+    if not model or not norm:
+        return {}
+    scores = list(model["bias"])
+    weights = model["weights"]
+    for gram, value in _vectorize(norm, model["idf"]).items():
+        row = weights.get(gram)
+        if row:
+            for index, weight in enumerate(row):
+                scores[index] += weight * value
+    return dict(zip(model["labels"], _softmax(scores)))
+
+
+def predict(norm: str, model: Optional[Dict[str, Any]] = None) -> Tuple[str, float]:
+    probs = predict_proba(norm, model)
+    if not probs:
+        return "", 0.0
+    label = max(probs, key=probs.get)
+    if label == NEGATIVE_LABEL:
+        return "", probs[label]
+    return label, probs[label]
+
+
+def evaluate(model: Dict[str, Any], samples: Iterable[Tuple[str, str]]) -> Dict[str, Any]:
+    per_label: Dict[str, Dict[str, int]] = {}
+    correct = total = confident = confident_correct = 0
+    for norm, label in samples:
+        predicted, prob = predict(norm, model)
+        # cobertura/precisão só contam quando o modelo devolve um serviço
+        confident_hit = bool(predicted) and prob >= INTENT_MODEL_MIN_CONFIDENCE
+        predicted = predicted or NEGATIVE_LABEL
+        total += 1
+        stats = per_label.setdefault(label, {"total": 0, "correct": 0})
+        stats["total"] += 1
+        if predicted == label:
+            correct += 1
+            stats["correct"] += 1
+        if confident_hit:
+            confident += 1
+            confident_correct += int(predicted == label)
+    return {
+        "samples": total,
+        "accuracy": round(correct / total, 4) if total else 0.0,
+        "coverage_at_threshold": round(confident / total, 4) if total else 0.0,
+        "precision_at_threshold": round(confident_correct / confident, 4) if confident else 0.0,
+        "threshold": INTENT_MODEL_MIN_CONFIDENCE,
+        "per_label": {
+            label: {**stats, "accuracy": round(stats["correct"] / stats["total"], 4)}
+            for label, stats in sorted(per_label.items())
+        },
+    }
+
+
+def save_model(model: Dict[str, Any], path: Path = INTENT_MODEL_PATH) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(model, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def load_model() -> Optional[Dict[str, Any]]:
+    # recarrega só quando o arquivo muda; sem modelo treinado o classificador fica desligado
+    try:
+        mtime = INTENT_MODEL_PATH.stat().st_mtime
+    except FileNotFoundError:
+        return None
+    if _MODEL_CACHE["mtime"] == mtime:
+        return _MODEL_CACHE["model"]
+    with _LOCK:
+        if _MODEL_CACHE["mtime"] != mtime:
+            try:
+                model = json.loads(INTENT_MODEL_PATH.read_text(encoding="utf-8"))
+            except Exception as e:
+                print(f"INTENT_MODEL:load_error path={INTENT_MODEL_PATH} error={repr(e)}")
+                model = None
+            _MODEL_CACHE.update({"mtime": mtime, "model": model})
+    return _MODEL_CACHE["model"]
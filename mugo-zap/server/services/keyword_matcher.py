@@ -0,0 +1,118 @@
+import re
+import threading
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, Optional, Pattern, Sequence, Tuple
+
+# um único autômato (regex em trie) com todo o vocabulário das heurísticas de venda:
+# cada texto é varrido uma vez e as listas viram interseção de conjuntos
+
+_LOCK = threading.Lock()
+_VOCAB: Dict[str, None] = {}
+_LISTS: Dict[Tuple[str, ...], FrozenSet[str]] = {}
+# (geração, padrão, prefixos) trocados de uma vez: quem está no meio de scan() segue com o snapshot que leu
+_STATE: Dict[str, Tuple[int, Optional[Pattern], Dict[str, FrozenSet[str]]]] = {"compiled": (0, None, {})}
+SCAN_CACHE_SIZE = 512
+
+
+def _trie_regex(terms: Iterable[str]) -> str:
+    trie: Dict[str, dict] = {}
+    for term in terms:
+        node = trie
+        for ch in term:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: Dict[str, dict]) -> str:
+        terminal = "" in node
+        children = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not children:
+            return ""
+        body = children[0] if len(children) == 1 else "(?:" + "|".join(children) + ")"
+        # ramo guloso: tenta o termo mais longo primeiro e recua para o prefixo terminal
+        return f"(?:{body})?" if terminal else body
+
+    return build(trie)
+
+
+def _rebuild() -> None:
+    # chamado com _LOCK: troca o snapshot e limpa o cache na mesma seção crítica; o cache é chaveado pela
+    # geração, então uma varredura que começou com o padrão antigo não serve resultado velho depois da troca
+    terms = [term for term in _VOCAB if term]
+    pattern = re.compile("(?=(" + _trie_regex(terms) + "))") if terms else None
+    prefixes = {
+        term: frozenset(term[:size] for size in range(1, len(term) + 1) if term[:size] in _VOCAB)
+        for term in terms
+    }
+    _STATE["compiled"] = (_STATE["compiled"][0] + 1, pattern, prefixes)
+    _scan_generation.cache_clear()
+
+
+def register(terms: Iterable[str]) -> FrozenSet[str]:
+    key = tuple(terms)
+    compiled = _LISTS.get(key)
+    if compiled is not None:
+        return compiled
+    with _LOCK:
+        compiled = frozenset(key)
+        missing = [term for term in key if term not in _VOCAB]
+        for term in missing:
+            _VOCAB[term] = None
+        if missing:
+            _rebuild()
+        _LISTS[key] = compiled
+    return compiled
+
+
+def register_many(vocabularies: Iterable[Sequence[str]]) -> None:
+    with _LOCK:
+        changed = False
+        for terms in vocabularies:
+            key = tuple(terms)
+            for term in key:
+                if term not in _VOCAB:
+                    _VOCAB[term] = None
+                    changed = True
+            _LISTS[key] = frozenset(key)
+        if changed:
+            _rebuild()
+
+
+@lru_cache(maxsize=SCAN_CACHE_SIZE)
+def _scan_generation(text: str, generation: int) -> FrozenSet[str]:
+    _generation, pattern, prefixes = _STATE["compiled"]
+    if pattern is None or not text:
+        return frozenset()
+    # lookahead acha o termo mais longo em cada posição; os prefixos dele também estão no texto
+    # (se a geração avançou desde a leitura, o resultado usa o vocabulário mais novo, nunca o velho)
+    found = {match.group(1) for match in pattern.finditer(text)}
+    matched = set()
+    for term in found:
+        matched |= prefixes.get(term, frozenset((term,)))
+    return frozenset(matched)
+
+
+def scan(text: str) -> FrozenSet[str]:
+    return _scan_generation(text, _STATE["compiled"][0])
+
+
+def has_any(text: str, terms: Sequence[str]) -> bool:
+    compiled = _LISTS.get(terms if isinstance(terms, tuple) else tuple(terms))
+    if compiled is None:
+        compiled = register(terms)
+    if "" in compiled:
+        return True
+    return not compiled.isdisjoint(scan(text or ""))
+
+
+def is_registered(terms: Sequence[str]) -> bool:
+    return all(term in _VOCAB for term in terms if term)
+
+
+def matched_categories(text: str, categories: Dict[str, Sequence[str]]) -> FrozenSet[str]:
+    found = scan(text or "")
+    return frozenset(name for name, terms in categories.items() if not register(terms).isdisjoint(found))
+
+
+def stats() -> Dict[str, int]:
+    info = _scan_generation.cache_info()
+    return {"terms": len(_VOCAB), "lists": len(_LISTS), "scan_hits": info.hits, "scan_misses": info.misses}
@@ -0,0 +1,201 @@
+import os
+import time
+import heapq
+import asyncio
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+# o estado é por processo: LLM_MAX_CONCURRENCY/LLM_TPM_BUDGET são da conta e cada worker fica com a sua fração
+# (LLM_WORKERS, ou WEB_CONCURRENCY que o gunicorn usa como número de workers)
+LLM_WORKERS = max(1, int((os.getenv("LLM_WORKERS") or os.getenv("WEB_CONCURRENCY") or "1").strip() or 1))
+LLM_TOTAL_CONCURRENCY = int((os.getenv("LLM_MAX_CONCURRENCY") or "8").strip() or 8)
+LLM_TOTAL_TPM_BUDGET = int((os.getenv("LLM_TPM_BUDGET") or "200000").strip() or 200000)
+LLM_MAX_CONCURRENCY = max(1, LLM_TOTAL_CONCURRENCY // LLM_WORKERS)
+LLM_TPM_BUDGET = max(1, LLM_TOTAL_TPM_BUDGET // LLM_WORKERS)
+LLM_QUEUE_MAX_WAIT_SECONDS = float((os.getenv("LLM_QUEUE_MAX_WAIT_SECONDS") or "4").strip() or 4)
+PRIORITY_WEIGHTS = {"hot": 4.0, "warm": 2.0, "cold": 1.0}
+
+
+def _parse_weights(raw: str) -> Dict[str, float]:
+    # LLM_WORKSPACE_WEIGHTS="ws_a=2,ws_b=0.5"; workspace sem peso usa 1
+    weights: Dict[str, float] = {}
+    for item in (raw or "").split(","):
+        key, _, value = item.partition("=")
+        try:
+            if key.strip() and float(value) > 0:
+                weights[key.strip()] = float(value)
+        except ValueError:
+            print(f"LLM_SCHEDULER:invalid_weight item={item!r}")
+    return weights
+
+
+WORKSPACE_WEIGHTS = _parse_weights((os.getenv("LLM_WORKSPACE_WEIGHTS") or "").strip())
+
+_STATE: Dict[str, Any] = {
+    "inflight": 0,
+    "tokens": float(LLM_TPM_BUDGET),
+    "refilled_at": time.monotonic(),
+    "virtual_time": 0.0,
+    "seq": 0,
+    "wakeup": None,
+}
+_QUEUE: List[tuple] = []
+_FLOW_FINISH: Dict[tuple, float] = {}
+_WAITS: deque = deque(maxlen=500)
+_STATS: Dict[str, Any] = {"admitted": 0, "shed": 0, "queued": 0, "workspaces": {}}
+
+
+def lead_priority(lead_context: Optional[Dict[str, Any]]) -> str:
+    lead_context = lead_context or {}
+    temperature = str(lead_context.get("lead_temperature") or "").strip().lower()
+    try:
+        score = int(lead_context.get("lead_score") or 0)
+    except (TypeError, ValueError):
+        score = 0
+    if temperature == "hot" or score >= 70 or lead_context.get("handoff"):
+        return "hot"
+    if temperature == "warm" or score >= 40:
+        return "warm"
+    return "cold"
+
+
+def _workspace_stats(workspace_id: str) -> Dict[str, int]:
+    stats = _STATS["workspaces"].get(workspace_id)
+    if stats is None:
+        stats = _STATS["workspaces"][workspace_id] = {"admitted": 0, "shed": 0, "tokens": 0}
+    return stats
+
+
+def _refill() -> None:
+    now = time.monotonic()
+    elapsed = now - _STATE["refilled_at"]
+    _STATE["refilled_at"] = now
+    _STATE["tokens"] = min(float(LLM_TPM_BUDGET), _STATE["tokens"] + elapsed * LLM_TPM_BUDGET / 60.0)
+
+
+def _schedule_wakeup(delay: float) -> None:
+    handle = _STATE.get("wakeup")
+    if handle is not None and not handle.cancelled():
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    _STATE["wakeup"] = loop.call_later(max(0.01, delay), _wakeup)
+
+
+def _wakeup() -> None:
+    _STATE["wakeup"] = None
+    _dispatch()
+
+
+def _dispatch() -> None:
+    # menor finish tag primeiro (WFQ por workspace+prioridade); respeita concorrência e balde de tokens por minuto
+    while _QUEUE and _STATE["inflight"] < LLM_MAX_CONCURRENCY:
+        finish, _seq, entry = _QUEUE[0]
+        if entry["future"].done():
+            heapq.heappop(_QUEUE)
+            continue
+        _refill()
+        if _STATE["tokens"] < entry["tokens"] and _STATE["inflight"] > 0:
+            missing = entry["tokens"] - _STATE["tokens"]
+            _schedule_wakeup(missing * 60.0 / LLM_TPM_BUDGET)
+            return
+        heapq.heappop(_QUEUE)
+        _STATE["tokens"] -= entry["tokens"]
+        _STATE["inflight"] += 1
+        _STATE["virtual_time"] = max(_STATE["virtual_time"], entry["start"])
+        entry["future"].set_result(True)
+
+
+async def acquire(
+    workspace_id: str,
+    *,
+    tokens: int,
+    priority: str = "cold",
+    deadline: Optional[float] = None,
+) -> Optional[Dict[str, Any]]:
+    workspace_id = workspace_id or "default"
+    tokens = max(1, int(tokens))
+    # cada (workspace, prioridade) é um fluxo; lead quente não espera atrás da fila fria do mesmo workspace
+    flow = (workspace_id, priority)
+    weight = WORKSPACE_WEIGHTS.get(workspace_id, 1.0) * PRIORITY_WEIGHTS.get(priority, 1.0)
+    start = max(_STATE["virtual_time"], _FLOW_FINISH.get(flow, 0.0))
+    finish = start + tokens / weight
+    _FLOW_FINISH[flow] = finish
+
+    future = asyncio.get_running_loop().create_future()
+    entry = {"future": future, "tokens": tokens, "start": start, "workspace_id": workspace_id}
+    _STATE["seq"] += 1
+    heapq.heappush(_QUEUE, (finish, _STATE["seq"], entry))
+    enqueued_at = time.monotonic()
+    _dispatch()
+
+    max_wait = LLM_QUEUE_MAX_WAIT_SECONDS
+    if deadline is not None:
+        max_wait = min(max_wait, deadline - enqueued_at)
+    if not future.done():
+        _STATS["queued"] += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=max(0.0, max_wait))
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            if future.done():
+                release({"tokens": tokens, "workspace_id": workspace_id}, tokens)
+            else:
+                future.cancel()
+            raise
+
+    waited = time.monotonic() - enqueued_at
+    _WAITS.append(waited)
+    ws_stats = _workspace_stats(workspace_id)
+    if not future.done() or future.cancelled():
+        # fila estourou o orçamento do turno: devolve a vez e o caller usa a resposta determinística
+        future.cancel()
+        _FLOW_FINISH[flow] = max(start, _FLOW_FINISH.get(flow, 0.0) - tokens / weight)
+        _STATS["shed"] += 1
+        ws_stats["shed"] += 1
+        print(f"LLM_SCHEDULER:shed workspace_id={workspace_id} priority={priority} waited_ms={int(waited * 1000)} queued={len(_QUEUE)}")
+        return None
+
+    _STATS["admitted"] += 1
+    ws_stats["admitted"] += 1
+    return {"tokens": tokens, "workspace_id": workspace_id, "priority": priority, "waited": waited}
+
+
+def release(ticket: Optional[Dict[str, Any]], used_tokens: Optional[int] = None) -> None:
+    if not ticket:
+        return
+    _STATE["inflight"] = max(0, _STATE["inflight"] - 1)
+    if used_tokens is not None:
+        # reconcilia a estimativa com o uso real devolvido pela API
+        _STATE["tokens"] = min(float(LLM_TPM_BUDGET), _STATE["tokens"] + ticket["tokens"] - int(used_tokens))
+        _workspace_stats(ticket["workspace_id"])["tokens"] += int(used_tokens)
+    _dispatch()
+
+
+def scheduler_stats() -> Dict[str, Any]:
+    waits = sorted(_WAITS)
+
+    def pct(p: float) -> int:
+        return int(waits[min(len(waits) - 1, int(len(waits) * p))] * 1000) if waits else 0
+
+    _refill()
+    return {
+        "workers": LLM_WORKERS,
+        "max_concurrency": LLM_MAX_CONCURRENCY,
+        "tpm_budget": LLM_TPM_BUDGET,
+        "total_max_concurrency": LLM_TOTAL_CONCURRENCY,
+        "total_tpm_budget": LLM_TOTAL_TPM_BUDGET,
+        "tokens_available": int(_STATE["tokens"]),
+        "inflight": _STATE["inflight"],
+        "queued_now": sum(1 for _, _, entry in _QUEUE if not entry["future"].done()),
+        "admitted": _STATS["admitted"],
+        "shed": _STATS["shed"],
+        "queued_total": _STATS["queued"],
+        "wait_p50_ms": pct(0.5),
+        "wait_p95_ms": pct(0.95),
+        "wait_max_ms": int(waits[-1] * 1000) if waits else 0,
+        "workspaces": {ws: dict(stats) for ws, stats in _STATS["workspaces"].items()},
+    }
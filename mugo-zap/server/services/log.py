@@ -0,0 +1,188 @@
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+# log estruturado: nível e amostragem são checados antes de montar qualquer campo;
+# campos podem ser callables (avaliados só se o evento sair); LOG_ASYNC=1 passa a escrita para uma thread
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+LOG_LEVEL = LEVELS.get((os.getenv("LOG_LEVEL") or "info").strip().lower(), 20)
+LOG_FORMAT = (os.getenv("LOG_FORMAT") or "text").strip().lower()
+# desligado por padrão: na fila as linhas saem fora de ordem com os print() diretos e se perdem num kill -9
+LOG_ASYNC = (os.getenv("LOG_ASYNC") or "0").strip() not in {"0", "false", "no"}
+LOG_QUEUE_SIZE = int((os.getenv("LOG_QUEUE_SIZE") or "10000").strip() or 10000)
+LOG_MAX_FIELD_CHARS = int((os.getenv("LOG_MAX_FIELD_CHARS") or "1400").strip() or 1400)
+CONTEXT_FIELDS = ("cid", "wa_id", "workspace_id")
+
+# eventos de alto volume saem amostrados por padrão; LOG_SAMPLE=EVENTO=taxa,... sobrescreve
+DEFAULT_SAMPLE_RATES = {
+    "DERIVED_PANEL_CONVERSATION": 0.01,
+}
+
+
+def _parse_sample_rates(raw: str) -> Dict[str, float]:
+    rates = dict(DEFAULT_SAMPLE_RATES)
+    for item in (raw or "").split(","):
+        event, _, rate = item.partition("=")
+        if event.strip() and rate.strip():
+            try:
+                rates[event.strip()] = max(0.0, min(1.0, float(rate)))
+            except ValueError:
+                continue
+    return rates
+
+
+SAMPLE_RATES = _parse_sample_rates(os.getenv("LOG_SAMPLE") or "")
+
+_CONTEXT: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("log_context", default=None)
+_QUEUE: "queue.Queue[str]" = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+_WRITER: Dict[str, Optional[threading.Thread]] = {"thread": None}
+_WRITER_LOCK = threading.Lock()
+_STATS: Dict[str, int] = {"emitted": 0, "below_level": 0, "sampled_out": 0, "dropped": 0}
+
+
+def enabled(level: str) -> bool:
+    return LEVELS.get(level, 20) >= LOG_LEVEL
+
+
+@contextmanager
+def context(**fields: Any) -> Iterator[Dict[str, Any]]:
+    token = _CONTEXT.set({key: value for key, value in fields.items() if value})
+    try:
+        yield _CONTEXT.get()
+    finally:
+        _CONTEXT.reset(token)
+
+
+def bind(**fields: Any) -> None:
+    # completa o contexto aberto por context() (ex.: wa_id só é conhecido depois do parse)
+    current = _CONTEXT.get()
+    if current is not None:
+        current.update({key: value for key, value in fields.items() if value})
+
+
+def _value(value: Any) -> Any:
+    return value() if callable(value) else value
+
+
+def _text_value(value: Any) -> str:
+    if value is None or value == "":
+        return "-"
+    if isinstance(value, (dict, list, tuple)):
+        return json.dumps(value, ensure_ascii=False, default=str)[:LOG_MAX_FIELD_CHARS]
+    if isinstance(value, str):
+        if not value or any(ch in value for ch in " \n\t'\"="):
+            return repr(value[:LOG_MAX_FIELD_CHARS])
+        return value[:LOG_MAX_FIELD_CHARS]
+    return str(value)
+
+
+def _render(level: str, event: str, fields: Dict[str, Any]) -> str:
+    merged = {**(_CONTEXT.get() or {}), **{key: _value(value) for key, value in fields.items()}}
+    if LOG_FORMAT == "json":
+        record = {"ts": round(time.time(), 3), "level": level, "event": event}
+        for key, value in merged.items():
+            if isinstance(value, str) and len(value) > LOG_MAX_FIELD_CHARS:
+                value = value[:LOG_MAX_FIELD_CHARS]
+            record[key] = value
+        return json.dumps(record, ensure_ascii=False, default=str)
+    ordered = [key for key in CONTEXT_FIELDS if key in merged] + [key for key in merged if key not in CONTEXT_FIELDS]
+    parts = [event] + [f"{key}={_text_value(merged[key])}" for key in ordered]
+    if level in {"warning", "error"}:
+        parts.insert(1, f"level={level}")
+    return " ".join(parts)
+
+
+def _drain() -> None:
+    while True:
+        line = _QUEUE.get()
+        batch = [line]
+        while len(batch) < 256:
+            try:
+                batch.append(_QUEUE.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            sys.stdout.write("\n".join(batch) + "\n")
+            sys.stdout.flush()
+        except Exception:
+            pass
+
+
+def _ensure_writer() -> None:
+    if _WRITER["thread"] is not None:
+        return
+    with _WRITER_LOCK:
+        if _WRITER["thread"] is None:
+            thread = threading.Thread(target=_drain, name="log-writer", daemon=True)
+            thread.start()
+            _WRITER["thread"] = thread
+
+
+def flush() -> None:
+    lines = []
+    while True:
+        try:
+            lines.append(_QUEUE.get_nowait())
+        except queue.Empty:
+            break
+    if lines:
+        sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
+
+
+atexit.register(flush)
+
+
+def log(level: str, event: str, **fields: Any) -> None:
+    if LEVELS.get(level, 20) < LOG_LEVEL:
+        _STATS["below_level"] += 1
+        return
+    rate = SAMPLE_RATES.get(event)
+    if rate is not None and random.random() >= rate:
+        _STATS["sampled_out"] += 1
+        return
+    line = _render(level, event, fields)
+    _STATS["emitted"] += 1
+    if not LOG_ASYNC:
+        print(line)
+        return
+    _ensure_writer()
+    try:
+        _QUEUE.put_nowait(line)
+    except queue.Full:
+        _STATS["dropped"] += 1
+
+
+def debug(event: str, **fields: Any) -> None:
+    log("debug", event, **fields)
+
+
+def info(event: str, **fields: Any) -> None:
+    log("info", event, **fields)
+
+
+def warning(event: str, **fields: Any) -> None:
+    log("warning", event, **fields)
+
+
+def error(event: str, **fields: Any) -> None:
+    log("error", event, **fields)
+
+
+def log_stats() -> Dict[str, Any]:
+    return {
+        **_STATS,
+        "queued": _QUEUE.qsize(),
+        "level": next((name for name, value in LEVELS.items() if value == LOG_LEVEL), str(LOG_LEVEL)),
+        "format": LOG_FORMAT,
+        "async": LOG_ASYNC,
+    }
@@ -0,0 +1,233 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+import traceback
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from services import log, tracing
+
+# mede o atraso do event loop com um heartbeat; uma thread separada vê quando o heartbeat para
+# e captura a pilha da thread do loop no meio do travamento (chamada bloqueante + cid + endpoint)
+
+LOOP_WATCHDOG = (os.getenv("LOOP_WATCHDOG") or "1").strip() not in {"0", "false", "no"}
+LOOP_WATCHDOG_INTERVAL_MS = max(10, int((os.getenv("LOOP_WATCHDOG_INTERVAL_MS") or "100").strip() or 100))
+LOOP_STALL_MS = max(LOOP_WATCHDOG_INTERVAL_MS, int((os.getenv("LOOP_STALL_MS") or "250").strip() or 250))
+LOOP_STALL_STACK_DEPTH = 30
+LOOP_STALL_RECENT = 100
+LAG_BUCKETS_SECONDS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_SERVER_ROOT = str(Path(__file__).resolve().parents[1])
+# wrappers de instrumentação não são o "culpado": o frame bloqueante é quem chamou por eles
+_INSTRUMENTATION_FILES = {"loop_watchdog.py", "call_budget.py", "tracing.py", "log.py"}
+_LOCK = threading.Lock()
+_STATE: Dict[str, Any] = {
+    "task": None,
+    "thread": None,
+    "stop": None,
+    "loop_thread_id": None,
+    "beat": 0.0,
+    "captured": None,
+}
+_LAG: List[Any] = [[0] * len(LAG_BUCKETS_SECONDS), 0.0, 0]
+_STALLS: Dict[str, Any] = {"count": 0, "seconds": 0.0, "max_ms": 0}
+_BY_ENDPOINT: Dict[str, int] = {}
+_BY_SITE: Dict[str, Dict[str, Any]] = {}
+_RECENT: deque = deque(maxlen=LOOP_STALL_RECENT)
+
+
+def _is_app_frame(filename: str) -> bool:
+    if not filename.startswith(_SERVER_ROOT) or "site-packages" in filename:
+        return False
+    return Path(filename).name not in _INSTRUMENTATION_FILES
+
+
+def _endpoint_label(scope: Dict[str, Any]) -> str:
+    # template da rota (/api/conversations/{wa_id}), nunca o path cru: telefone no label e cardinalidade sem fim
+    route = scope.get("route")
+    template = getattr(route, "path", "") if route is not None else ""
+    return f"{scope.get('method', '')} {template or 'unmatched'}".strip()
+
+
+def _capture(thread_id: int) -> Optional[Dict[str, Any]]:
+    frame = sys._current_frames().get(thread_id)
+    if frame is None:
+        return None
+    cid = ""
+    endpoint = ""
+    blocking_at = ""
+    cursor = frame
+    # do frame mais interno para fora: primeiro frame do app = chamada bloqueante; cid/scope vêm dos locals
+    while cursor is not None:
+        code = cursor.f_code
+        if not blocking_at and _is_app_frame(code.co_filename):
+            blocking_at = f"{Path(code.co_filename).name}:{cursor.f_lineno}:{code.co_name}"
+        try:
+            local_vars = cursor.f_locals
+        except Exception:
+            local_vars = {}
+        if not cid and isinstance(local_vars.get("cid"), str):
+            cid = local_vars["cid"]
+        scope = local_vars.get("scope")
+        if isinstance(scope, dict) and scope.get("type") == "http" and (not endpoint or endpoint.endswith(" unmatched")):
+            # o router grava "route" no scope; um scope mais externo pode ser o que já passou pelo roteamento
+            endpoint = _endpoint_label(scope)
+        cursor = cursor.f_back
+    stack = traceback.format_list(traceback.extract_stack(frame)[-LOOP_STALL_STACK_DEPTH:])
+    return {
+        "cid": cid,
+        "endpoint": endpoint or "-",
+        "blocking_at": blocking_at or "-",
+        "stack": [line.rstrip() for line in stack],
+    }
+
+
+def _monitor(stop: threading.Event) -> None:
+    interval = LOOP_WATCHDOG_INTERVAL_MS / 1000
+    threshold = LOOP_STALL_MS / 1000
+    while not stop.wait(interval / 2):
+        beat = _STATE["beat"]
+        thread_id = _STATE["loop_thread_id"]
+        if not beat or thread_id is None or _STATE["captured"] is not None:
+            continue
+        if time.perf_counter() - beat > interval + threshold:
+            # uma captura por travamento; o heartbeat atrasado fecha o registro com a duração
+            _STATE["captured"] = {**(_capture(thread_id) or {}), "beat": beat}
+
+
+def _observe_lag(lag: float) -> None:
+    with _LOCK:
+        for index, bound in enumerate(LAG_BUCKETS_SECONDS):
+            if lag <= bound:
+                _LAG[0][index] += 1
+                break
+        _LAG[1] += lag
+        _LAG[2] += 1
+
+
+def _record_stall(lag: float, beat: float) -> None:
+    captured = _STATE["captured"] or {}
+    if captured.get("beat") != beat:
+        captured = {}
+    stall_ms = int(lag * 1000)
+    endpoint = captured.get("endpoint") or "-"
+    site = captured.get("blocking_at") or "-"
+    with _LOCK:
+        _STALLS["count"] += 1
+        _STALLS["seconds"] += lag
+        _STALLS["max_ms"] = max(_STALLS["max_ms"], stall_ms)
+        _BY_ENDPOINT[endpoint] = _BY_ENDPOINT.get(endpoint, 0) + 1
+        entry = _BY_SITE.setdefault(site, {"count": 0, "total_ms": 0, "max_ms": 0, "endpoint": endpoint, "cid": ""})
+        entry["count"] += 1
+        entry["total_ms"] += stall_ms
+        entry["max_ms"] = max(entry["max_ms"], stall_ms)
+        entry["endpoint"] = endpoint
+        entry["cid"] = captured.get("cid") or entry["cid"]
+        _RECENT.append(
+            {
+                "at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "stall_ms": stall_ms,
+                "cid": captured.get("cid") or "",
+                "endpoint": endpoint,
+                "blocking_at": site,
+                "stack": captured.get("stack") or [],
+            }
+        )
+    log.warning(
+        "LOOP_STALL",
+        cid=captured.get("cid") or "-",
+        stall_ms=stall_ms,
+        endpoint=endpoint,
+        blocking_at=site,
+        stack=lambda: " | ".join(line.strip().replace("\n", " ") for line in (captured.get("stack") or [])[-6:]),
+    )
+
+
+async def _heartbeat() -> None:
+    interval = LOOP_WATCHDOG_INTERVAL_MS / 1000
+    threshold = LOOP_STALL_MS / 1000
+    _STATE["loop_thread_id"] = threading.get_ident()
+    started = time.perf_counter()
+    while True:
+        _STATE["beat"] = started
+        await asyncio.sleep(interval)
+        now = time.perf_counter()
+        # novo beat antes de processar o anterior: a thread não captura um travamento já encerrado
+        beat, started = started, now
+        _STATE["beat"] = started
+        lag = max(0.0, now - beat - interval)
+        _observe_lag(lag)
+        if lag >= threshold:
+            _record_stall(lag, beat)
+        _STATE["captured"] = None
+
+
+def start() -> bool:
+    # chamado no startup do app (dentro do loop); idempotente
+    if not LOOP_WATCHDOG or _STATE["task"] is not None:
+        return False
+    stop_event = threading.Event()
+    thread = threading.Thread(target=_monitor, args=(stop_event,), name="loop-watchdog", daemon=True)
+    _STATE.update({"stop": stop_event, "thread": thread, "task": asyncio.get_running_loop().create_task(_heartbeat())})
+    thread.start()
+    print(f"LOOP_WATCHDOG_STARTED interval_ms={LOOP_WATCHDOG_INTERVAL_MS} stall_ms={LOOP_STALL_MS}")
+    return True
+
+
+def stop() -> None:
+    task, stop_event = _STATE["task"], _STATE["stop"]
+    if task is not None:
+        task.cancel()
+    if stop_event is not None:
+        stop_event.set()
+    _STATE.update({"task": None, "thread": None, "stop": None, "beat": 0.0, "captured": None})
+
+
+def render_prometheus() -> str:
+    with _LOCK:
+        buckets, total, count = list(_LAG[0]), _LAG[1], _LAG[2]
+        stalls = dict(_STALLS)
+        by_endpoint = dict(_BY_ENDPOINT)
+    return (
+        tracing.render_histogram(
+            "mugo_event_loop_lag_seconds",
+            "Atraso do heartbeat do event loop em relação ao intervalo esperado.",
+            LAG_BUCKETS_SECONDS,
+            {(): (buckets, total, count)},
+        )
+        + tracing.render_counter(
+            "mugo_event_loop_stalls_total",
+            f"Travamentos do event loop acima de {LOOP_STALL_MS}ms por endpoint.",
+            "endpoint",
+            by_endpoint,
+        )
+        + tracing.render_counter(
+            "mugo_event_loop_stall_seconds_total",
+            "Tempo total com o event loop travado.",
+            "kind",
+            {"stall": round(stalls["seconds"], 6)},
+        )
+    )
+
+
+def loop_watchdog_stats(limit: int = 20) -> Dict[str, Any]:
+    with _LOCK:
+        lag_count = _LAG[2]
+        lag_avg_ms = round(_LAG[1] / lag_count * 1000, 2) if lag_count else 0.0
+        stalls = dict(_STALLS)
+        by_site = sorted(({"blocking_at": site, **info} for site, info in _BY_SITE.items()), key=lambda item: -item["total_ms"])
+        recent = list(_RECENT)[-max(0, limit):]
+    return {
+        "running": _STATE["task"] is not None,
+        "interval_ms": LOOP_WATCHDOG_INTERVAL_MS,
+        "stall_ms": LOOP_STALL_MS,
+        "heartbeats": lag_count,
+        "lag_avg_ms": lag_avg_ms,
+        "stalls": {**stalls, "seconds": round(stalls["seconds"], 3)},
+        "by_endpoint": dict(_BY_ENDPOINT),
+        "by_blocking_site": by_site,
+        "recent": recent,
+    }
@@ -0,0 +1,340 @@
+import os
+import re
+import gzip
+import json
+import time
+import base64
+import hashlib
+import threading
+import urllib.parse
+from pathlib import Path
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+import httpx
+
+# supabase (padrão): tabela compartilhada por todas as instâncias; local: disco do worker (só instância única com disco persistente)
+MESSAGE_ARCHIVE_BACKEND = (os.getenv("MESSAGE_ARCHIVE_BACKEND") or "supabase").strip().lower()
+MESSAGE_ARCHIVE_TABLE = (os.getenv("SUPABASE_TABLE_MESSAGE_ARCHIVE") or "whatsapp_message_archive").strip()
+# existência de arquivo por lead: "tem" não expira (arquivo não é apagado); "não tem" vale pouco porque outro worker pode arquivar
+MESSAGE_ARCHIVE_NEGATIVE_TTL_SECONDS = 60
+MESSAGE_ARCHIVE_PRESENCE_MAX = 20000
+MESSAGE_ARCHIVE_DIR = Path(
+    (os.getenv("MESSAGE_ARCHIVE_DIR") or "").strip()
+    or (Path(__file__).resolve().parents[1] / "data" / "message_archive")
+)
+MESSAGE_HOT_DAYS = int((os.getenv("MESSAGE_HOT_DAYS") or "90").strip() or 90)
+INDEX_FILE = "index.json"
+
+SUPABASE_URL = (os.getenv("SUPABASE_URL") or "").strip().rstrip("/")
+SUPABASE_SERVICE_ROLE_KEY = (os.getenv("SUPABASE_SERVICE_ROLE_KEY") or "").strip()
+
+_LOCK = threading.Lock()
+_INDEX_CACHE: Dict[str, tuple[float, Dict[str, Any]]] = {}
+_PRESENCE: "OrderedDict[tuple, tuple[bool, float]]" = OrderedDict()
+_CLIENT = httpx.Client(timeout=httpx.Timeout(connect=6.0, read=20.0, write=20.0, pool=20.0))
+
+
+def _workspace_dir(workspace_id: str) -> Path:
+    safe = re.sub(r"[^A-Za-z0-9_.-]+", "_", (workspace_id or "").strip()) or "default"
+    return MESSAGE_ARCHIVE_DIR / safe
+
+
+def _empty_index() -> Dict[str, Any]:
+    return {"version": 1, "wa_ids": {}}
+
+
+def _load_index(workspace_id: str) -> Dict[str, Any]:
+    path = _workspace_dir(workspace_id) / INDEX_FILE
+    try:
+        mtime = path.stat().st_mtime
+    except FileNotFoundError:
+        return _empty_index()
+
+    cached = _INDEX_CACHE.get(workspace_id)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    try:
+        index = json.loads(path.read_text(encoding="utf-8")) or _empty_index()
+    except Exception as e:
+        print(f"MESSAGE_ARCHIVE:index_error workspace_id={workspace_id} error={repr(e)}")
+        return _empty_index()
+    _INDEX_CACHE[workspace_id] = (mtime, index)
+    return index
+
+
+def _save_index(workspace_id: str, index: Dict[str, Any]) -> None:
+    path = _workspace_dir(workspace_id) / INDEX_FILE
+    tmp = path.with_suffix(".json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    _INDEX_CACHE.pop(workspace_id, None)
+
+
+def _month(created_at: str) -> str:
+    month = str(created_at or "")[:7]
+    return month if re.fullmatch(r"\d{4}-\d{2}", month) else "unknown"
+
+
+def _local_has_archived(workspace_id: str, wa_id: str) -> bool:
+    return bool((_load_index(workspace_id).get("wa_ids") or {}).get(wa_id))
+
+
+def _local_archive_rows(workspace_id: str, grouped: Dict[tuple, List[Dict[str, Any]]]) -> int:
+    # um membro gzip por (mês, wa_id) anexado ao segmento do mês; o índice aponta offset/tamanho
+    total = 0
+    with _LOCK:
+        directory = _workspace_dir(workspace_id)
+        directory.mkdir(parents=True, exist_ok=True)
+        index = json.loads(json.dumps(_load_index(workspace_id)))
+        entries_by_wa_id = index.setdefault("wa_ids", {})
+
+        for month in sorted({key[0] for key in grouped}):
+            segment = f"{month}.ndjson.gz"
+            with open(directory / segment, "ab") as f:
+                for (row_month, wa_id), items in sorted(grouped.items()):
+                    if row_month != month:
+                        continue
+                    items.sort(key=lambda row: (str(row.get("created_at") or ""), str(row.get("id") or "")))
+                    body = "".join(json.dumps(row, ensure_ascii=False, separators=(",", ":")) + "\n" for row in items)
+                    data = gzip.compress(body.encode("utf-8"))
+                    offset = f.tell()
+                    f.write(data)
+                    entries_by_wa_id.setdefault(wa_id, []).append([
+                        segment,
+                        offset,
+                        len(data),
+                        len(items),
+                        str(items[0].get("created_at") or ""),
+                        str(items[-1].get("created_at") or ""),
+                    ])
+                    total += len(items)
+                f.flush()
+                os.fsync(f.fileno())
+
+        for entries in entries_by_wa_id.values():
+            entries.sort(key=lambda entry: (entry[5], entry[4]))
+        _save_index(workspace_id, index)
+
+    return total
+
+
+def _read_member(directory: Path, segment: str, offset: int, length: int) -> List[Dict[str, Any]]:
+    with open(directory / segment, "rb") as f:
+        f.seek(offset)
+        data = gzip.decompress(f.read(length))
+    return [json.loads(line) for line in data.decode("utf-8").splitlines() if line.strip()]
+
+
+def _local_read(workspace_id: str, wa_id: str, before: str, limit: int) -> List[Dict[str, Any]]:
+    entries = (_load_index(workspace_id).get("wa_ids") or {}).get(wa_id) or []
+    if not entries or limit <= 0:
+        return []
+
+    directory = _workspace_dir(workspace_id)
+    collected: List[Dict[str, Any]] = []
+    for segment, offset, length, _count, first_at, _last_at in reversed(entries):
+        if before and first_at and first_at >= before:
+            continue
+        try:
+            rows = _read_member(directory, segment, int(offset), int(length))
+        except Exception as e:
+            print(f"MESSAGE_ARCHIVE:read_error workspace_id={workspace_id} segment={segment} error={repr(e)}")
+            continue
+        collected.extend(
+            row for row in rows
+            if str(row.get("wa_id") or "") == wa_id and (not before or str(row.get("created_at") or "") < before)
+        )
+        if len(_dedupe(collected)) >= limit:
+            break
+    return collected
+
+
+def _headers(extra: Dict[str, str] | None = None) -> Dict[str, str]:
+    if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+        raise RuntimeError("Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY")
+    return {
+        "apikey": SUPABASE_SERVICE_ROLE_KEY,
+        "Authorization": f"Bearer {SUPABASE_SERVICE_ROLE_KEY}",
+        "Content-Type": "application/json",
+        **(extra or {}),
+    }
+
+
+def _chunk_id(workspace_id: str, wa_id: str, items: List[Dict[str, Any]]) -> str:
+    # determinístico pelos ids: rearquivar o mesmo lote depois de uma queda antes do delete vira upsert, não duplicata
+    ids = ",".join(sorted(str(row.get("id") or "") for row in items))
+    return hashlib.sha1(f"{workspace_id}|{wa_id}|{ids}".encode("utf-8")).hexdigest()
+
+
+def _remote_archive_rows(workspace_id: str, grouped: Dict[tuple, List[Dict[str, Any]]]) -> int:
+    payload = []
+    for (month, wa_id), items in sorted(grouped.items()):
+        items.sort(key=lambda row: (str(row.get("created_at") or ""), str(row.get("id") or "")))
+        body = "".join(json.dumps(row, ensure_ascii=False, separators=(",", ":")) + "\n" for row in items)
+        payload.append(
+            {
+                "chunk_id": _chunk_id(workspace_id, wa_id, items),
+                "workspace_id": workspace_id,
+                "wa_id": wa_id,
+                "month": month,
+                "first_at": items[0].get("created_at") or None,
+                "last_at": items[-1].get("created_at") or None,
+                "message_count": len(items),
+                "message_ids": [str(row.get("id") or "") for row in items],
+                "payload": base64.b64encode(gzip.compress(body.encode("utf-8"))).decode("ascii"),
+            }
+        )
+    r = _CLIENT.post(
+        f"{SUPABASE_URL}/rest/v1/{MESSAGE_ARCHIVE_TABLE}?on_conflict=chunk_id",
+        headers=_headers({"Prefer": "resolution=merge-duplicates,return=minimal"}),
+        content=json.dumps(payload, ensure_ascii=False),
+    )
+    if r.status_code not in (200, 201, 204):
+        # sem confirmação do arquivo compartilhado o chamador não pode apagar as mensagens quentes
+        raise RuntimeError(f"archive upsert {r.status_code}: {r.text[:300]}")
+    for _, wa_id in grouped:
+        _remember_presence(workspace_id, wa_id, True)
+    return sum(len(items) for items in grouped.values())
+
+
+def _remember_presence(workspace_id: str, wa_id: str, present: bool) -> None:
+    with _LOCK:
+        _PRESENCE[(workspace_id, wa_id)] = (present, time.monotonic() + MESSAGE_ARCHIVE_NEGATIVE_TTL_SECONDS)
+        _PRESENCE.move_to_end((workspace_id, wa_id))
+        while len(_PRESENCE) > MESSAGE_ARCHIVE_PRESENCE_MAX:
+            _PRESENCE.popitem(last=False)
+
+
+def _remote_has_archived(workspace_id: str, wa_id: str) -> Optional[bool]:
+    # consulta só o lead (limit=1 no índice workspace_id+wa_id); None = erro, que não entra no cache
+    cached = _PRESENCE.get((workspace_id, wa_id))
+    if cached and (cached[0] or cached[1] > time.monotonic()):
+        return cached[0]
+    try:
+        r = _CLIENT.get(
+            f"{SUPABASE_URL}/rest/v1/{MESSAGE_ARCHIVE_TABLE}"
+            f"?workspace_id=eq.{workspace_id}&wa_id=eq.{urllib.parse.quote(wa_id)}&select=wa_id&limit=1",
+            headers=_headers(),
+        )
+    except Exception as e:
+        print(f"MESSAGE_ARCHIVE:presence_error workspace_id={workspace_id} wa_id={wa_id} error={repr(e)}")
+        return None
+    if r.status_code != 200:
+        print(f"MESSAGE_ARCHIVE:presence_error workspace_id={workspace_id} wa_id={wa_id} status={r.status_code}")
+        return None
+    present = bool(r.json() or [])
+    _remember_presence(workspace_id, wa_id, present)
+    return present
+
+
+def _remote_chunk_count(workspace_id: str) -> Optional[int]:
+    try:
+        r = _CLIENT.get(
+            f"{SUPABASE_URL}/rest/v1/{MESSAGE_ARCHIVE_TABLE}?workspace_id=eq.{workspace_id}&select=chunk_id&limit=1",
+            headers=_headers({"Prefer": "count=exact"}),
+        )
+        total = (r.headers.get("content-range") or "").rpartition("/")[2]
+        return int(total) if r.status_code in (200, 206) and total.isdigit() else None
+    except Exception as e:
+        print(f"MESSAGE_ARCHIVE:count_error workspace_id={workspace_id} error={repr(e)}")
+        return None
+
+
+def _remote_read(workspace_id: str, wa_id: str, before: str, limit: int) -> List[Dict[str, Any]]:
+    url = (
+        f"{SUPABASE_URL}/rest/v1/{MESSAGE_ARCHIVE_TABLE}?workspace_id=eq.{workspace_id}&wa_id=eq.{wa_id}"
+        f"&select=payload&order=last_at.desc&limit=50"
+    )
+    if before:
+        url += f"&first_at=lt.{urllib.parse.quote(before)}"
+    try:
+        r = _CLIENT.get(url, headers=_headers())
+    except Exception as e:
+        print(f"MESSAGE_ARCHIVE:read_error workspace_id={workspace_id} wa_id={wa_id} error={repr(e)}")
+        return []
+    if r.status_code != 200:
+        print(f"MESSAGE_ARCHIVE:read_error workspace_id={workspace_id} wa_id={wa_id} status={r.status_code}")
+        return []
+    collected: List[Dict[str, Any]] = []
+    for chunk in r.json() or []:
+        try:
+            body = gzip.decompress(base64.b64decode(chunk.get("payload") or "")).decode("utf-8")
+        except Exception as e:
+            print(f"MESSAGE_ARCHIVE:decode_error workspace_id={workspace_id} wa_id={wa_id} error={repr(e)}")
+            continue
+        collected.extend(
+            row for row in (json.loads(line) for line in body.splitlines() if line.strip())
+            if not before or str(row.get("created_at") or "") < before
+        )
+        if len(_dedupe(collected)) >= limit:
+            break
+    return collected
+
+
+def _dedupe(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # o mesmo id pode estar em dois lotes (arquivado, queda antes do delete, arquivado de novo)
+    unique: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        key = str(row.get("id") or "") or f"{row.get('created_at')}|{row.get('direction')}|{row.get('text')}"
+        unique.setdefault(key, row)
+    return sorted(unique.values(), key=lambda row: (str(row.get("created_at") or ""), str(row.get("id") or "")))
+
+
+def archive_rows(workspace_id: str, rows: Iterable[Dict[str, Any]]) -> int:
+    grouped: Dict[tuple, List[Dict[str, Any]]] = {}
+    for row in rows or []:
+        wa_id = str((row or {}).get("wa_id") or "").strip()
+        if not wa_id:
+            continue
+        grouped.setdefault((_month(row.get("created_at")), wa_id), []).append(row)
+    if not grouped:
+        return 0
+    if MESSAGE_ARCHIVE_BACKEND == "local":
+        return _local_archive_rows(workspace_id, grouped)
+    return _remote_archive_rows(workspace_id, grouped)
+
+
+def has_archived_messages(workspace_id: str, wa_id: str) -> bool:
+    if MESSAGE_ARCHIVE_BACKEND == "local":
+        return _local_has_archived(workspace_id, wa_id)
+    if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+        return False
+    # em erro tenta a leitura mesmo assim: melhor uma chamada a mais do que esconder histórico já arquivado
+    present = _remote_has_archived(workspace_id, wa_id)
+    return True if present is None else present
+
+
+def read_archived_messages(workspace_id: str, wa_id: str, before: str = "", limit: int = 40) -> List[Dict[str, Any]]:
+    if limit <= 0:
+        return []
+    if MESSAGE_ARCHIVE_BACKEND == "local":
+        rows = _local_read(workspace_id, wa_id, before, limit)
+    else:
+        rows = _remote_read(workspace_id, wa_id, before, limit)
+    return _dedupe(rows)[-limit:]
+
+
+def archive_stats(workspace_id: str) -> Dict[str, Any]:
+    if MESSAGE_ARCHIVE_BACKEND != "local":
+        return {
+            "backend": "supabase",
+            "table": MESSAGE_ARCHIVE_TABLE,
+            "hot_days": MESSAGE_HOT_DAYS,
+            "chunks": _remote_chunk_count(workspace_id),
+        }
+    directory = _workspace_dir(workspace_id)
+    entries_by_wa_id = _load_index(workspace_id).get("wa_ids") or {}
+    segments = sorted(directory.glob("*.ndjson.gz")) if directory.exists() else []
+    return {
+        "backend": "local",
+        "dir": str(directory),
+        "hot_days": MESSAGE_HOT_DAYS,
+        "wa_ids": len(entries_by_wa_id),
+        "messages": sum(entry[3] for entries in entries_by_wa_id.values() for entry in entries),
+        "segments": {path.name: path.stat().st_size for path in segments},
+    }
@@ -1,10 +1,16 @@
 import os
 import json
 import re
+import time
+import hashlib
+import asyncio
+from collections import deque
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
 import httpx
+from services import llm_scheduler
+from services.tracing import traced
 
 OPENAI_API_KEY = (
     os.getenv("OPENAI_API_KEY")
@@ -14,9 +20,47 @@ OPENAI_API_KEY = (
 
 OPENAI_MODEL = (os.getenv("OPENAI_MODEL") or "gpt-4.1-mini").strip()
 OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT") or "12")
+OPENAI_BASE_URL = (os.getenv("OPENAI_BASE_URL") or "https://api.openai.com/v1").strip().rstrip("/")
+OPENAI_URL = f"{OPENAI_BASE_URL}/chat/completions"
+# orçamento de tokens da parte dinâmica do prompt (histórico + contexto do lead + fluxo)
+OPENAI_CONTEXT_BUDGET_TOKENS = int(os.getenv("OPENAI_CONTEXT_BUDGET_TOKENS") or "1200")
+MEMORY_SUMMARY_MAX_TOKENS = int(os.getenv("MEMORY_SUMMARY_MAX_TOKENS") or "120")
+CONTEXT_BUDGET_SHARES = (("history", 0.55), ("lead_context", 0.30), ("flow", 0.15))
+LEAD_CONTEXT_DROP_ORDER = ("memory_notes", "follow_up", "briefing", "lead_fields", "forbidden_questions", "missing_fields")
+OPENAI_MIN_BUDGET_SECONDS = float(os.getenv("OPENAI_MIN_BUDGET_SECONDS") or "1.5")
+OPENAI_HEDGE_ENABLED = (os.getenv("OPENAI_HEDGE_ENABLED") or "0").strip().lower() in {"1", "true", "yes", "on"}
+OPENAI_HEDGE_MIN_SAMPLES = 20
+OPENAI_BREAKER_FAILURES = int(os.getenv("OPENAI_BREAKER_FAILURES") or "4")
+OPENAI_BREAKER_COOLDOWN_SECONDS = float(os.getenv("OPENAI_BREAKER_COOLDOWN_SECONDS") or "30")
 PROMPT_PATH = Path(__file__).resolve().parents[1] / "prompts" / "atendimento_mugo.txt"
 _PROMPT_CACHE = ""
 
+NEXT_QUESTION_RULE = (
+    "A próxima pergunta sugerida pelo backend tem prioridade. Se next_best_question existir, use-a como base. "
+    "Não pergunte serviço, objetivo, origem, processo, urgência ou orçamento quando esse campo já estiver preenchido."
+)
+_USAGE: Dict[str, int] = {
+    "responses": 0,
+    "prompt_tokens": 0,
+    "cached_tokens": 0,
+    "completion_tokens": 0,
+    "responses_with_cache_hit": 0,
+}
+
+_HTTP_CLIENT: Optional[httpx.AsyncClient] = None
+_HTTP_CLIENT_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_LATENCIES: deque = deque(maxlen=200)
+_BREAKER: Dict[str, Any] = {
+    "state": "closed",
+    "failures": 0,
+    "opened_at": 0.0,
+    "probe_in_flight": False,
+    "short_circuited": 0,
+    "hedges": 0,
+    "hedge_wins": 0,
+    "budget_skips": 0,
+}
+
 
 def _ai_log(event: str, **fields: Any) -> None:
     safe_fields = []
@@ -48,6 +92,31 @@ def load_mugo_prompt() -> str:
     return _PROMPT_CACHE
 
 
+def _static_prefix() -> str:
+    # tudo que não muda entre leads fica no primeiro bloco, para o cache de prefixo do provedor
+    return f"{load_mugo_prompt()}\n\n{NEXT_QUESTION_RULE}"
+
+
+def _prompt_cache_key(static_prefix: str) -> str:
+    return "mugo-atendimento-" + hashlib.sha1(static_prefix.encode("utf-8")).hexdigest()[:12]
+
+
+def _compact(value: Any) -> Any:
+    if isinstance(value, dict):
+        items = {k: _compact(v) for k, v in value.items()}
+        return {k: v for k, v in items.items() if v not in (None, "", [], {})}
+    if isinstance(value, (list, tuple)):
+        return [_compact(v) for v in value if v not in (None, "", [], {})]
+    return value
+
+
+def _compact_json(value: Any) -> str:
+    try:
+        return json.dumps(_compact(value), ensure_ascii=False, separators=(",", ":"), default=str)
+    except Exception:
+        return str(value)
+
+
 def _fallback(user_message: str) -> Dict[str, Any]:
     msg = (user_message or "").strip()
     score = _score_from_text(msg)
@@ -241,23 +310,73 @@ def _default_briefing(msg: str, intent: str) -> Dict[str, Any]:
     }
 
 
-def _format_recent_messages(recent_messages: Optional[List[Dict[str, Any]]]) -> str:
-    rows = []
-    for item in (recent_messages or [])[-12:]:
+def estimate_tokens(text: Any) -> int:
+    # aproximação local (~3.5 caracteres por token em pt-BR), suficiente para orçamento
+    text = text if isinstance(text, str) else _compact_json(text)
+    return (len(text) * 2 + 6) // 7 if text else 0
+
+
+def _trim_to_tokens(text: str, max_tokens: int) -> str:
+    text = (text or "").strip()
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[: max(0, max_tokens * 7 // 2 - 1)].rstrip() + "…"
+
+
+def fold_memory_summary(summary: str, fragments: List[str], max_tokens: int = MEMORY_SUMMARY_MAX_TOKENS) -> str:
+    # resumo incremental: anexa fragmentos novos e descarta os mais antigos quando passa do orçamento
+    parts = [part.strip() for part in str(summary or "").split(" | ") if part.strip()]
+    for fragment in fragments or []:
+        fragment = " ".join(str(fragment or "").split())
+        if fragment and fragment not in parts:
+            parts.append(fragment)
+    while len(parts) > 1 and estimate_tokens(" | ".join(parts)) > max_tokens:
+        parts.pop(0)
+    return _trim_to_tokens(" | ".join(parts), max_tokens)
+
+
+def _format_recent_messages(
+    recent_messages: Optional[List[Dict[str, Any]]],
+    budget_tokens: Optional[int] = None,
+) -> tuple[str, List[Dict[str, Any]]]:
+    rows: List[str] = []
+    dropped: List[Dict[str, Any]] = []
+    used = 0
+    items = (recent_messages or [])[-12:]
+    # do mais recente para o mais antigo; o que não cabe vira resumo
+    for index in range(len(items) - 1, -1, -1):
+        item = items[index]
         direction = (item.get("direction") or "").strip().lower()
         role = "cliente" if direction == "in" else "mugo"
         text = (item.get("text") or "").strip()
-        if text:
-            rows.append(f"{role}: {text[:500]}")
+        if not text:
+            continue
+        line = f"{role}: {text[:500]}"
+        cost = estimate_tokens(line) + 1
+        if budget_tokens is not None and rows and used + cost > budget_tokens:
+            dropped = [row for row in items[: index + 1] if (row.get("text") or "").strip()]
+            break
+        if budget_tokens is not None and not rows and cost > budget_tokens:
+            line = _trim_to_tokens(line, budget_tokens)
+            cost = budget_tokens
+        rows.append(line)
+        used += cost
 
     if not rows:
-        return "Sem histórico recente disponível."
+        return "Sem histórico recente disponível.", dropped
 
-    return "\n".join(rows)
+    rows.reverse()
+    return "\n".join(rows), dropped
 
 
-def _format_lead_context(lead_context: Optional[Dict[str, Any]]) -> str:
+def _format_lead_context(
+    lead_context: Optional[Dict[str, Any]],
+    budget_tokens: Optional[int] = None,
+    summary_fragments: Optional[List[str]] = None,
+) -> str:
     if not lead_context:
+        if summary_fragments:
+            return _compact_json({"memory_summary": fold_memory_summary("", summary_fragments)})
         return "Sem contexto comercial salvo."
 
     fields = lead_context.get("lead_fields") if isinstance(lead_context.get("lead_fields"), dict) else {}
@@ -287,15 +406,27 @@ def _format_lead_context(lead_context: Optional[Dict[str, Any]]) -> str:
         if key not in known_fields
     ]
 
+    memory_summary = lead_context.get("memory_summary") or ""
+    if summary_fragments:
+        memory_summary = fold_memory_summary(memory_summary, summary_fragments)
+
+    # campos já presentes em known_fields não se repetem em lead_fields/briefing
+    known_values = {str(v) for v in known_fields.values()}
+    promoted = set(known_fields) | {"last_question_asked", "last_question_category", "next_best_question"}
+    lead_fields = {k: v for k, v in fields.items() if k not in promoted}
+    briefing = lead_context.get("briefing") if isinstance(lead_context.get("briefing"), dict) else {}
+    briefing = {k: v for k, v in briefing.items() if k not in promoted and str(v) not in known_values}
+    memory_notes = lead_context.get("memory_notes") if isinstance(lead_context.get("memory_notes"), list) else []
+
     safe_context = {
-        "memory_summary": lead_context.get("memory_summary"),
+        "memory_summary": memory_summary,
         "memory_theme": lead_context.get("memory_theme"),
         "memory_goal": lead_context.get("memory_goal"),
-        "memory_notes": lead_context.get("memory_notes"),
-        "lead_fields": lead_context.get("lead_fields"),
+        "memory_notes": [note.get("user") for note in memory_notes[-3:] if isinstance(note, dict)],
+        "lead_fields": lead_fields,
         "known_fields": known_fields,
         "missing_fields": missing_fields,
-        "briefing": lead_context.get("briefing"),
+        "briefing": briefing,
         "follow_up": lead_context.get("follow_up"),
         "last_question_asked": lead_context.get("last_question_asked"),
         "last_question_category": lead_context.get("last_question_category"),
@@ -315,10 +446,23 @@ def _format_lead_context(lead_context: Optional[Dict[str, Any]]) -> str:
         "handoff_done": lead_context.get("handoff_done"),
     }
 
-    try:
-        return json.dumps(safe_context, ensure_ascii=False, indent=2)
-    except Exception:
-        return str(safe_context)
+    text = _compact_json(safe_context)
+    if budget_tokens is None:
+        return text
+
+    for key in LEAD_CONTEXT_DROP_ORDER:
+        if estimate_tokens(text) <= budget_tokens:
+            break
+        safe_context.pop(key, None)
+        text = _compact_json(safe_context)
+    if estimate_tokens(text) > budget_tokens and safe_context.get("memory_summary"):
+        excess = estimate_tokens(text) - budget_tokens
+        safe_context["memory_summary"] = _trim_to_tokens(
+            str(safe_context["memory_summary"]),
+            max(16, estimate_tokens(str(safe_context["memory_summary"])) - excess),
+        )
+        text = _compact_json(safe_context)
+    return text
 
 
 def _extract_json_object(s: str) -> Optional[Dict[str, Any]]:
@@ -389,7 +533,7 @@ def _normalize_ai_output(
     )
     handoff_summary = str(handoff_summary).strip() or msg[:220]
 
-    memory_summary = str(out.get("memory_summary") or handoff_summary or msg[:220]).strip()[:220]
+    memory_summary = _trim_to_tokens(str(out.get("memory_summary") or handoff_summary or msg[:220]), MEMORY_SUMMARY_MAX_TOKENS)
     memory_goal = str(out.get("memory_goal") or msg[:180]).strip()[:180]
     memory_theme = str(out.get("memory_theme") or intent).strip() or intent
 
@@ -478,6 +622,198 @@ def _normalize_ai_output(
     return normalized
 
 
+def _budget_context(
+    recent_messages: Optional[List[Dict[str, Any]]],
+    lead_context: Optional[Dict[str, Any]],
+    flow_text: str,
+    total_tokens: int = OPENAI_CONTEXT_BUDGET_TOKENS,
+) -> tuple[str, str, str, int]:
+    # fluxo -> histórico -> contexto do lead; a sobra de cada seção passa para a seguinte
+    shares = {name: int(total_tokens * share) for name, share in CONTEXT_BUDGET_SHARES}
+    flow_text = _trim_to_tokens(flow_text, shares["flow"]) if flow_text else ""
+    flow_tokens = estimate_tokens(flow_text)
+
+    history_text, dropped = _format_recent_messages(
+        recent_messages,
+        budget_tokens=shares["history"] + max(0, shares["flow"] - flow_tokens),
+    )
+    history_tokens = estimate_tokens(history_text)
+
+    fragments = [
+        f"cliente: {_trim_to_tokens(str(row.get('text') or ''), 30)}"
+        for row in dropped
+        if (row.get("direction") or "").strip().lower() == "in"
+    ]
+    lead_context_text = _format_lead_context(
+        lead_context,
+        budget_tokens=max(shares["lead_context"], total_tokens - flow_tokens - history_tokens),
+        summary_fragments=fragments,
+    )
+    return history_text, lead_context_text, flow_text, flow_tokens + history_tokens + estimate_tokens(lead_context_text)
+
+
+def _build_messages(
+    msg: str,
+    *,
+    lead_profile: Dict[str, Any],
+    history_text: str,
+    lead_context_text: str,
+    flow_text: str,
+) -> List[Dict[str, str]]:
+    # ordem do mais estável para o mais volátil: prompt fixo, perfil do lead, histórico, contexto do turno
+    return [
+        {"role": "system", "content": _static_prefix()},
+        {"role": "system", "content": f"Perfil técnico do lead:\n{_compact_json(lead_profile)}"},
+        {"role": "system", "content": f"Histórico recente da conversa:\n{history_text}"},
+        {"role": "system", "content": f"Contexto comercial salvo do lead:\n{lead_context_text}"},
+        {"role": "system", "content": f"Contexto do fluxo atual:\n{flow_text or 'Nenhum.'}"},
+        {"role": "user", "content": msg},
+    ]
+
+
+def _record_usage(data: Dict[str, Any]) -> Dict[str, int]:
+    usage = (data or {}).get("usage") or {}
+    prompt_tokens = int(usage.get("prompt_tokens") or 0)
+    cached_tokens = int(((usage.get("prompt_tokens_details") or {}).get("cached_tokens")) or 0)
+    completion_tokens = int(usage.get("completion_tokens") or 0)
+    _USAGE["responses"] += 1
+    _USAGE["prompt_tokens"] += prompt_tokens
+    _USAGE["cached_tokens"] += cached_tokens
+    _USAGE["completion_tokens"] += completion_tokens
+    if cached_tokens:
+        _USAGE["responses_with_cache_hit"] += 1
+    return {"prompt_tokens": prompt_tokens, "cached_tokens": cached_tokens, "completion_tokens": completion_tokens}
+
+
+def prompt_cache_stats() -> Dict[str, Any]:
+    prompt_tokens = _USAGE["prompt_tokens"]
+    responses = _USAGE["responses"]
+    return {
+        **_USAGE,
+        "token_hit_rate": round(_USAGE["cached_tokens"] / prompt_tokens, 4) if prompt_tokens else 0.0,
+        "response_hit_rate": round(_USAGE["responses_with_cache_hit"] / responses, 4) if responses else 0.0,
+        "avg_prompt_tokens": int(prompt_tokens / responses) if responses else 0,
+    }
+
+
+def _http_client() -> httpx.AsyncClient:
+    global _HTTP_CLIENT, _HTTP_CLIENT_LOOP
+    loop = asyncio.get_running_loop()
+    if _HTTP_CLIENT is None or _HTTP_CLIENT.is_closed or _HTTP_CLIENT_LOOP is not loop:
+        _HTTP_CLIENT = httpx.AsyncClient(
+            timeout=OPENAI_TIMEOUT,
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=60),
+            headers={"Content-Type": "application/json"},
+        )
+        _HTTP_CLIENT_LOOP = loop
+    return _HTTP_CLIENT
+
+
+async def close_openai_client() -> None:
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is not None and not _HTTP_CLIENT.is_closed:
+        await _HTTP_CLIENT.aclose()
+    _HTTP_CLIENT = None
+
+
+def _latency_p95() -> Optional[float]:
+    if len(_LATENCIES) < OPENAI_HEDGE_MIN_SAMPLES:
+        return None
+    ordered = sorted(_LATENCIES)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+def _breaker_allows() -> bool:
+    if _BREAKER["state"] == "closed":
+        return True
+    if _BREAKER["state"] == "open":
+        if time.monotonic() - _BREAKER["opened_at"] < OPENAI_BREAKER_COOLDOWN_SECONDS:
+            return False
+        _BREAKER["state"] = "half_open"
+        _BREAKER["probe_in_flight"] = False
+    if _BREAKER["probe_in_flight"]:
+        return False
+    _BREAKER["probe_in_flight"] = True
+    return True
+
+
+def _breaker_success(latency: float) -> None:
+    _LATENCIES.append(latency)
+    if _BREAKER["state"] != "closed":
+        _ai_log("breaker_closed", previous=_BREAKER["state"])
+    _BREAKER.update({"state": "closed", "failures": 0, "probe_in_flight": False})
+
+
+def _breaker_failure(reason: str) -> None:
+    _BREAKER["failures"] += 1
+    _BREAKER["probe_in_flight"] = False
+    if _BREAKER["state"] == "half_open" or _BREAKER["failures"] >= OPENAI_BREAKER_FAILURES:
+        if _BREAKER["state"] != "open":
+            _ai_log("breaker_open", failures=_BREAKER["failures"], reason=reason)
+        _BREAKER.update({"state": "open", "opened_at": time.monotonic()})
+
+
+def openai_health() -> Dict[str, Any]:
+    p95 = _latency_p95()
+    return {
+        "model": OPENAI_MODEL,
+        "breaker": {k: v for k, v in _BREAKER.items() if k != "probe_in_flight"},
+        "samples": len(_LATENCIES),
+        "p95_ms": int(p95 * 1000) if p95 is not None else None,
+        "hedge_enabled": OPENAI_HEDGE_ENABLED,
+        "prompt_cache": prompt_cache_stats(),
+        "scheduler": llm_scheduler.scheduler_stats(),
+    }
+
+
+async def _post_completion(payload: Dict[str, Any], timeout: float) -> httpx.Response:
+    r = await _http_client().post(
+        OPENAI_URL,
+        headers={"Authorization": f"Bearer {OPENAI_API_KEY}"},
+        json=payload,
+        timeout=timeout,
+    )
+    if r.status_code == 429 or r.status_code >= 500:
+        raise httpx.HTTPStatusError(f"status={r.status_code} body={(r.text or '')[:200]}", request=r.request, response=r)
+    return r
+
+
+async def _post_with_hedge(payload: Dict[str, Any], timeout: float, wa_id: str = "") -> httpx.Response:
+    p95 = _latency_p95() if OPENAI_HEDGE_ENABLED else None
+    if p95 is None or p95 >= timeout:
+        return await _post_completion(payload, timeout)
+
+    started = time.monotonic()
+    primary = asyncio.create_task(_post_completion(payload, timeout))
+    done, _ = await asyncio.wait({primary}, timeout=p95)
+    if done:
+        return primary.result()
+
+    remaining = timeout - (time.monotonic() - started)
+    if remaining < OPENAI_MIN_BUDGET_SECONDS:
+        return await primary
+
+    _BREAKER["hedges"] += 1
+    _ai_log("hedge", wa_id=wa_id, after_ms=int(p95 * 1000), remaining_ms=int(remaining * 1000))
+    hedge = asyncio.create_task(_post_completion(payload, remaining))
+    pending = {primary, hedge}
+    error: Optional[BaseException] = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is hedge:
+                        _BREAKER["hedge_wins"] += 1
+                    return task.result()
+                error = task.exception()
+        raise error or RuntimeError("hedge_failed")
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+@traced("openai")
 async def generate_reply(
     user_message: str,
     wa_id: str = "",
@@ -487,6 +823,8 @@ async def generate_reply(
     flow_context: Optional[Dict[str, Any]] = None,
     recent_messages: Optional[List[Dict[str, Any]]] = None,
     lead_context: Optional[Dict[str, Any]] = None,
+    deadline: Optional[float] = None,
+    workspace_id: str = "",
 ) -> Dict[str, Any]:
     msg = (user_message or "").strip()
     if not msg:
@@ -524,47 +862,69 @@ async def generate_reply(
 
         return out
 
-    flow_txt = ""
-    if flow_context:
-        try:
-            flow_txt = json.dumps(flow_context, ensure_ascii=False)
-        except Exception:
-            flow_txt = str(flow_context)
+    flow_txt = _compact_json(flow_context) if flow_context else ""
 
     lead_profile = {
         "wa_id": wa_id,
         "name": name,
         "telefone": telefone,
         "first_message_sent": first_message_sent,
-        "flow_context": flow_context or {},
     }
 
-    official_prompt = load_mugo_prompt()
-    history_text = _format_recent_messages(recent_messages)
-    lead_context_text = _format_lead_context(lead_context)
-
     if flow_context:
         flow_txt = (
             f"{flow_txt}\n\nO lead concluiu um mini-briefing estruturado. "
             "Confirme em até 2 linhas, não faça novas perguntas e marque handoff=true."
         )
 
+    history_text, lead_context_text, flow_txt, context_tokens = _budget_context(recent_messages, lead_context, flow_txt)
+
     payload = {
         "model": OPENAI_MODEL,
-        "messages": [
-            {"role": "system", "content": official_prompt},
-            {"role": "system", "content": f"Histórico recente da conversa:\n{history_text}"},
-            {"role": "system", "content": f"Contexto comercial salvo do lead:\n{lead_context_text}"},
-            {"role": "system", "content": "A próxima pergunta sugerida pelo backend tem prioridade. Se next_best_question existir, use-a como base. Não pergunte serviço, objetivo, origem, processo, urgência ou orçamento quando esse campo já estiver preenchido."},
-            {"role": "system", "content": f"Perfil técnico do lead:\n{json.dumps(lead_profile, ensure_ascii=False)}"},
-            {"role": "system", "content": f"Contexto do fluxo atual:\n{flow_txt or 'Nenhum.'}"},
-            {"role": "user", "content": msg},
-        ],
+        "messages": _build_messages(
+            msg,
+            lead_profile=lead_profile,
+            history_text=history_text,
+            lead_context_text=lead_context_text,
+            flow_text=flow_txt,
+        ),
+        "prompt_cache_key": _prompt_cache_key(_static_prefix()),
         "temperature": 0.3,
         "max_tokens": 700,
         "response_format": {"type": "json_object"},
     }
 
+    timeout = OPENAI_TIMEOUT
+    if deadline is not None:
+        timeout = min(timeout, deadline - time.monotonic())
+    if timeout < OPENAI_MIN_BUDGET_SECONDS:
+        _BREAKER["budget_skips"] += 1
+        _ai_log("fallback_budget_exhausted", wa_id=wa_id, remaining_ms=int(timeout * 1000))
+        return {**_fallback(user_message), "budget_exhausted": True}
+
+    # circuito aberto não entra na fila: nada de reservar tokens do balde que não vão ser usados
+    if not _breaker_allows():
+        _BREAKER["short_circuited"] += 1
+        _ai_log("fallback_circuit_open", wa_id=wa_id, failures=_BREAKER["failures"])
+        return {**_fallback(user_message), "circuit_open": True}
+
+    priority = llm_scheduler.lead_priority(lead_context)
+    ticket = await llm_scheduler.acquire(
+        workspace_id,
+        tokens=estimate_tokens(_static_prefix()) + context_tokens + estimate_tokens(msg) + payload["max_tokens"],
+        priority=priority,
+        deadline=None if deadline is None else deadline - OPENAI_MIN_BUDGET_SECONDS,
+    )
+    if ticket is None:
+        # a sonda do half-open não chegou a sair; a próxima mensagem pode tentar
+        _BREAKER["probe_in_flight"] = False
+        _ai_log("fallback_shed", wa_id=wa_id, workspace_id=workspace_id or "-", priority=priority)
+        return {**_fallback(user_message), "shed": True}
+    if deadline is not None:
+        timeout = min(OPENAI_TIMEOUT, deadline - time.monotonic())
+
+    started = time.monotonic()
+    usage: Dict[str, int] = {}
     try:
         _ai_log(
             "request",
@@ -574,22 +934,21 @@ async def generate_reply(
             recent_messages=len(recent_messages or []),
             has_lead_context=bool(lead_context),
             has_flow_context=bool(flow_context),
+            context_tokens_est=context_tokens,
+            timeout_ms=int(timeout * 1000),
+            queue_wait_ms=int(ticket["waited"] * 1000),
+            priority=priority,
         )
-        async with httpx.AsyncClient(timeout=OPENAI_TIMEOUT) as client:
-            r = await client.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {OPENAI_API_KEY}",
-                    "Content-Type": "application/json",
-                },
-                json=payload,
-            )
+        r = await _post_with_hedge(payload, timeout, wa_id=wa_id)
+        _breaker_success(time.monotonic() - started)
 
         if r.status_code >= 300:
             _ai_log("http_error", wa_id=wa_id, status_code=r.status_code, body=(r.text or "")[:500])
             return _fallback(user_message)
 
-        content = (r.json().get("choices", [{}])[0].get("message", {}) or {}).get("content", "") or ""
+        data = r.json()
+        usage = _record_usage(data)
+        content = (data.get("choices", [{}])[0].get("message", {}) or {}).get("content", "") or ""
         content = content.strip()
 
         out = _extract_json_object(content)
@@ -607,9 +966,17 @@ async def generate_reply(
             handoff=normalized.get("handoff"),
             meeting_suggested=normalized.get("meeting_suggested"),
             briefing_ready=normalized.get("briefing_ready"),
+            **usage,
         )
         return normalized
 
+    except (httpx.TimeoutException, httpx.TransportError, httpx.HTTPStatusError) as e:
+        _breaker_failure(type(e).__name__)
+        _ai_log("exception", wa_id=wa_id, error=repr(e), elapsed_ms=int((time.monotonic() - started) * 1000))
+        return _fallback(user_message)
     except Exception as e:
+        _BREAKER["probe_in_flight"] = False
         _ai_log("exception", wa_id=wa_id, error=repr(e))
         return _fallback(user_message)
+    finally:
+        llm_scheduler.release(ticket, (usage["prompt_tokens"] + usage["completion_tokens"]) if usage else None)
@@ -0,0 +1,202 @@
+import os
+import sys
+import time
+import hmac
+import uuid
+import marshal
+import pstats
+import cProfile
+import threading
+from io import StringIO
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from services import log
+
+# profiling sob demanda do worker que atende a requisição (cada worker uvicorn tem o seu):
+# 1) amostragem de pilhas de todas as threads por N segundos -> collapsed stacks (flamegraph.pl / speedscope)
+# 2) cProfile nas requisições marcadas com o header de uma sessão armada pelo admin -> dump pstats
+# ocioso, o custo é um dict vazio checado no middleware
+
+PROFILE_MAX_SECONDS = int((os.getenv("PROFILE_MAX_SECONDS") or "60").strip() or 60)
+PROFILE_MAX_SESSIONS = 5
+PROFILE_HEADER = "x-mugo-profile"
+# pilha cuja folha está num destes arquivos é thread ociosa (select do loop, wait de fila/condição)
+_IDLE_FILES = {"selectors.py", "threading.py", "queue.py"}
+
+_LOCK = threading.Lock()
+_SAMPLING = threading.Lock()
+_SESSIONS: Dict[str, Dict[str, Any]] = {}
+_ACTIVE: Dict[str, Optional[str]] = {"token": None}
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+def sample_stacks(seconds: float, interval_ms: int = 5, include_idle: bool = False) -> Dict[str, Any]:
+    # roda numa thread própria (asyncio.to_thread); o loop segue atendendo e aparece nas amostras
+    if not _SAMPLING.acquire(blocking=False):
+        raise RuntimeError("profile_already_running")
+    try:
+        seconds = max(0.1, min(float(seconds), PROFILE_MAX_SECONDS))
+        interval = max(1, int(interval_ms)) / 1000
+        own_id = threading.get_ident()
+        names = {}
+        counts: Dict[str, int] = {}
+        samples = 0
+        idle = 0
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            frames = sys._current_frames()
+            if len(names) != len(frames):
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in frames.items():
+                if thread_id == own_id:
+                    continue
+                if not include_idle and Path(frame.f_code.co_filename).name in _IDLE_FILES:
+                    idle += 1
+                    continue
+                stack = []
+                cursor = frame
+                while cursor is not None:
+                    stack.append(_frame_label(cursor))
+                    cursor = cursor.f_back
+                stack.append(names.get(thread_id) or f"thread-{thread_id}")
+                key = ";".join(reversed(stack))
+                counts[key] = counts.get(key, 0) + 1
+                samples += 1
+            time.sleep(interval)
+        collapsed = "\n".join(f"{stack} {count}" for stack, count in sorted(counts.items()))
+        log.info("PROFILE_SAMPLED", seconds=seconds, interval_ms=int(interval * 1000), samples=samples, idle_skipped=idle, stacks=len(counts))
+        return {"collapsed": collapsed + ("\n" if collapsed else ""), "samples": samples, "idle_skipped": idle, "stacks": len(counts)}
+    finally:
+        _SAMPLING.release()
+
+
+def arm_session(count: int = 20, path: str = "", ttl_seconds: int = 600) -> Dict[str, Any]:
+    # path vazio: só requisições com o header; com path, toda requisição naquele prefixo entra (tráfego real do /webhook)
+    now = time.time()
+    with _LOCK:
+        for token, session in list(_SESSIONS.items()):
+            if session["expires_at"] < now:
+                _SESSIONS.pop(token, None)
+        if len(_SESSIONS) >= PROFILE_MAX_SESSIONS:
+            raise RuntimeError("too_many_profile_sessions")
+        token = uuid.uuid4().hex
+        _SESSIONS[token] = {
+            "token": token,
+            "path": (path or "").strip(),
+            "remaining": max(1, int(count)),
+            "profiled": 0,
+            "skipped_busy": 0,
+            "armed_at": now,
+            "expires_at": now + max(10, int(ttl_seconds)),
+            "stats": None,
+        }
+    log.info("PROFILE_SESSION_ARMED", token=token[:8], count=count, path=path or "-", ttl_seconds=ttl_seconds)
+    return {"token": token, "header": PROFILE_HEADER, "count": max(1, int(count)), "path": path or ""}
+
+
+def _match_session(scope: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    tagged = ""
+    for name, value in scope.get("headers") or []:
+        if name == PROFILE_HEADER.encode():
+            tagged = value.decode("latin-1").strip()
+            break
+    path = scope.get("path") or ""
+    now = time.time()
+    with _LOCK:
+        for token, session in _SESSIONS.items():
+            if session["remaining"] <= 0 or session["expires_at"] < now:
+                continue
+            if (tagged and hmac.compare_digest(tagged, token)) or (session["path"] and path.startswith(session["path"])):
+                return session
+    return None
+
+
+def _store(session: Dict[str, Any], profile: cProfile.Profile) -> None:
+    with _LOCK:
+        if session["stats"] is None:
+            session["stats"] = pstats.Stats(profile)
+        else:
+            session["stats"].add(profile)
+        session["profiled"] += 1
+
+
+def asgi_middleware(app: Callable) -> Callable:
+    async def middleware(scope, receive, send):
+        if scope.get("type") != "http" or not _SESSIONS:
+            return await app(scope, receive, send)
+        session = _match_session(scope)
+        if session is None:
+            return await app(scope, receive, send)
+        with _LOCK:
+            # cProfile é por thread: uma requisição perfilada por vez; corrotinas concorrentes no loop entram no perfil
+            busy = _ACTIVE["token"] is not None or session["remaining"] <= 0
+            if busy:
+                session["skipped_busy"] += 1
+            else:
+                session["remaining"] -= 1
+                _ACTIVE["token"] = session["token"]
+        if busy:
+            return await app(scope, receive, send)
+        profile = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            profile.enable()
+        except ValueError as exc:
+            # outro profiler já ligado no processo: atende sem perfilar
+            _ACTIVE["token"] = None
+            log.warning("PROFILE_ENABLE_ERROR", path=scope.get("path") or "-", error=repr(exc))
+            return await app(scope, receive, send)
+        try:
+            # inclui as background tasks (o webhook processa a mensagem depois de responder)
+            return await app(scope, receive, send)
+        finally:
+            profile.disable()
+            _ACTIVE["token"] = None
+            _store(session, profile)
+            log.info(
+                "PROFILE_REQUEST",
+                token=session["token"][:8],
+                path=scope.get("path") or "-",
+                ms=int((time.perf_counter() - started) * 1000),
+                remaining=session["remaining"],
+            )
+
+    return middleware
+
+
+def session_result(token: str, fmt: str = "pstats", limit: int = 60, sort: str = "cumulative") -> Optional[Dict[str, Any]]:
+    buffer = StringIO()
+    with _LOCK:
+        session = _SESSIONS.get(token)
+        if session is None:
+            return None
+        meta = {key: value for key, value in session.items() if key not in {"stats", "token"}}
+        if session["stats"] is None:
+            return {**meta, "body": b"" if fmt == "pstats" else ""}
+        if fmt == "pstats":
+            # mesmo formato de Stats.dump_stats: abre com pstats.Stats(arquivo), snakeviz, gprof2dot
+            return {**meta, "body": marshal.dumps(session["stats"].stats)}
+        # cópia: ordenar/imprimir não mexe nos stats que ainda recebem requisições
+        printable = pstats.Stats(stream=buffer)
+        printable.add(session["stats"])
+    printable.sort_stats(sort).print_stats(max(1, int(limit)))
+    return {**meta, "body": buffer.getvalue()}
+
+
+def close_session(token: str) -> bool:
+    with _LOCK:
+        return _SESSIONS.pop(token, None) is not None
+
+
+def profiler_stats() -> Dict[str, Any]:
+    with _LOCK:
+        sessions = [
+            {**{key: value for key, value in session.items() if key != "stats"}, "token": token[:8]}
+            for token, session in _SESSIONS.items()
+        ]
+    return {"sampling": _SAMPLING.locked(), "active_request": bool(_ACTIVE["token"]), "sessions": sessions}
@@ -1,15 +1,19 @@
 import os
 import json
+import time
 from datetime import datetime, timezone
 from typing import Any, Dict, List, Optional
 
 import httpx
 
+from services.coalesce import coalesced_get, forget_results
 from services.workspace import DEFAULT_WORKSPACE_ID, resolve_workspace_id
 
 SUPABASE_URL = (os.getenv("SUPABASE_URL") or "").strip().rstrip("/")
 SUPABASE_SERVICE_ROLE_KEY = (os.getenv("SUPABASE_SERVICE_ROLE_KEY") or "").strip()
 PROFILES_TABLE = (os.getenv("SUPABASE_PROFILES_TABLE") or "profiles").strip()
+PROFILE_CACHE_TTL_SECONDS = float((os.getenv("PROFILE_CACHE_TTL_SECONDS") or "60").strip() or 60)
+PROFILE_CACHE_MAX_ENTRIES = 512
 
 ROLE_ADMIN = "admin"
 ROLE_GESTOR = "gestor"
@@ -18,6 +22,7 @@ VALID_ROLES = {ROLE_ADMIN, ROLE_GESTOR, ROLE_ATENDIMENTO}
 
 _TIMEOUT = httpx.Timeout(connect=6.0, read=12.0, write=12.0, pool=12.0)
 _CLIENT = httpx.Client(timeout=_TIMEOUT, headers={"Content-Type": "application/json"})
+_PROFILE_CACHE: Dict[tuple, tuple[float, Dict[str, Any]]] = {}
 
 
 def now_iso() -> str:
@@ -95,6 +100,30 @@ def _normalize_profile(row: Dict[str, Any], fallback_user: Dict[str, Any] | None
     }
 
 
+def _cached_profile(key: tuple) -> Optional[Dict[str, Any]]:
+    entry = _PROFILE_CACHE.get(key)
+    if not entry:
+        return None
+    expires_at, profile = entry
+    if expires_at <= time.time():
+        _PROFILE_CACHE.pop(key, None)
+        return None
+    return dict(profile)
+
+
+def _remember_profile(key: tuple, profile: Dict[str, Any]) -> Dict[str, Any]:
+    if PROFILE_CACHE_TTL_SECONDS > 0 and profile:
+        while len(_PROFILE_CACHE) >= PROFILE_CACHE_MAX_ENTRIES:
+            _PROFILE_CACHE.pop(next(iter(_PROFILE_CACHE)), None)
+        _PROFILE_CACHE[key] = (time.time() + PROFILE_CACHE_TTL_SECONDS, dict(profile))
+    return profile
+
+
+def invalidate_profile_cache() -> None:
+    _PROFILE_CACHE.clear()
+    forget_results(f"{SUPABASE_URL}/rest/v1/{PROFILES_TABLE}")
+
+
 def get_profile_for_user(user: Dict[str, Any], workspace_id: str = "") -> Dict[str, Any]:
     if not user:
         return {}
@@ -106,6 +135,11 @@ def get_profile_for_user(user: Dict[str, Any], workspace_id: str = "") -> Dict[s
     if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY or (not auth_user_id and not email):
         return _normalize_profile(_profile_payload_from_user(user, workspace_id), fallback_user=user)
 
+    cache_key = (workspace_id, auth_user_id, email)
+    cached = _cached_profile(cache_key)
+    if cached:
+        return cached
+
     filters = []
     if auth_user_id:
         filters.append(f"auth_user_id=eq.{auth_user_id}")
@@ -118,11 +152,11 @@ def get_profile_for_user(user: Dict[str, Any], workspace_id: str = "") -> Dict[s
             f"?workspace_id=eq.{workspace_id}&{filter_expr}&select=*&limit=1"
         )
         try:
-            resp = _CLIENT.get(url, headers=_headers())
+            resp = coalesced_get(_CLIENT, url, _headers())
             if resp.status_code == 200:
                 rows = resp.json() or []
                 if rows:
-                    return _normalize_profile(rows[0], fallback_user=user)
+                    return _remember_profile(cache_key, _normalize_profile(rows[0], fallback_user=user))
             elif resp.status_code in {404, 406} or "does not exist" in resp.text.lower():
                 break
         except Exception:
@@ -132,6 +166,7 @@ def get_profile_for_user(user: Dict[str, Any], workspace_id: str = "") -> Dict[s
     if auth_user_id:
         try:
             url = f"{SUPABASE_URL}/rest/v1/{PROFILES_TABLE}?on_conflict=auth_user_id"
+            forget_results(url)
             resp = _CLIENT.post(
                 url,
                 headers=_headers({"Prefer": "resolution=merge-duplicates,return=representation"}),
@@ -140,7 +175,7 @@ def get_profile_for_user(user: Dict[str, Any], workspace_id: str = "") -> Dict[s
             if resp.status_code in (200, 201):
                 rows = resp.json() or []
                 if rows:
-                    return _normalize_profile(rows[0], fallback_user=user)
+                    return _remember_profile(cache_key, _normalize_profile(rows[0], fallback_user=user))
         except Exception:
             pass
 
@@ -153,7 +188,7 @@ def list_profiles(workspace_id: str = "") -> List[Dict[str, Any]]:
         f"{SUPABASE_URL}/rest/v1/{PROFILES_TABLE}"
         f"?workspace_id=eq.{workspace_id}&select=*&order=name.asc"
     )
-    resp = _CLIENT.get(url, headers=_headers())
+    resp = coalesced_get(_CLIENT, url, _headers())
     if resp.status_code != 200:
         text = resp.text or ""
         if resp.status_code == 404 and (
@@ -212,6 +247,7 @@ def create_profile(payload: Dict[str, Any], workspace_id: str = "") -> Dict[str,
     )
     if resp.status_code not in (200, 201):
         raise RuntimeError(resp.text)
+    invalidate_profile_cache()
     rows = resp.json() or []
     return _normalize_profile(rows[0] if rows else profile)
 
@@ -238,5 +274,6 @@ def update_profile(profile_id: str, payload: Dict[str, Any], workspace_id: str =
     )
     if resp.status_code not in (200, 204):
         raise RuntimeError(resp.text)
+    invalidate_profile_cache()
     rows = resp.json() if resp.content else []
     return _normalize_profile(rows[0] if rows else {"id": safe_id, **fields, "workspace_id": workspace_id})
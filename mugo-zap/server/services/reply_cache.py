@@ -0,0 +1,127 @@
+import os
+import copy
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+from services.sales_brain import flatten_state, get_next_question, normalize_text
+
+REPLY_CACHE_ENABLED = (os.getenv("REPLY_CACHE_ENABLED") or "1").strip().lower() in {"1", "true", "yes", "on"}
+REPLY_CACHE_TTL_SECONDS = float((os.getenv("REPLY_CACHE_TTL_SECONDS") or "900").strip() or 900)
+REPLY_CACHE_MAX_ENTRIES = int((os.getenv("REPLY_CACHE_MAX_ENTRIES") or "512").strip() or 512)
+REPLY_CACHE_MAX_CHARS = int((os.getenv("REPLY_CACHE_MAX_CHARS") or "40").strip() or 40)
+REPLY_CACHE_MAX_WORDS = 4
+
+# só o que é genérico da resposta; memória e campos do lead nunca passam de um lead para outro
+CACHED_KEYS = (
+    "reply",
+    "intent",
+    "next_action",
+    "lead_temperature",
+    "lead_theme",
+    "suggested_tags",
+    "handoff",
+    "handoff_reason",
+    "meeting_suggested",
+    "briefing_ready",
+)
+# só o que escolhe a resposta: serviço, etapa, próxima pergunta e quais campos obrigatórios já
+# foram respondidos (sim/não, nunca o valor); valores do lead deixariam a chave única por lead
+FINGERPRINT_KEYS = ("funnel_stage", "last_question_category", "handoff", "handoff_done", "briefing_ready")
+FINGERPRINT_SLOT_FIELDS = (
+    "main_goal",
+    "site_scope",
+    "lead_source",
+    "current_tools",
+    "current_status",
+    "current_problem",
+    "urgency",
+    "budget_signal",
+)
+
+_LOCK = threading.Lock()
+_ENTRIES: "OrderedDict[str, tuple[float, Dict[str, Any]]]" = OrderedDict()
+_STATS: Dict[str, int] = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0, "skipped": 0}
+
+
+def state_fingerprint(state: Optional[Dict[str, Any]], next_question: Optional[Dict[str, Any]] = None) -> str:
+    state = state or {}
+    flat = flatten_state(state)
+    next_question = next_question if next_question is not None else get_next_question(flat)
+    service = flat.get("service_interest") or flat.get("selected_service") or ""
+    values = [str(service), str(next_question.get("category") or "")]
+    values.extend(str(state.get(key) or flat.get(key) or "") for key in FINGERPRINT_KEYS)
+    values.append("".join("1" if flat.get(key) not in (None, "", [], {}) else "0" for key in FINGERPRINT_SLOT_FIELDS))
+    return hashlib.sha1("|".join(values).encode("utf-8")).hexdigest()[:16]
+
+
+def cache_key(text: str, state: Optional[Dict[str, Any]], next_question: Optional[Dict[str, Any]] = None) -> str:
+    if not REPLY_CACHE_ENABLED:
+        return ""
+    norm = normalize_text(text)
+    if not norm or len(norm) > REPLY_CACHE_MAX_CHARS or len(norm.split()) > REPLY_CACHE_MAX_WORDS:
+        return ""
+    return f"{norm}#{state_fingerprint(state, next_question)}"
+
+
+def get(key: str) -> Optional[Dict[str, Any]]:
+    if not key:
+        return None
+    with _LOCK:
+        entry = _ENTRIES.get(key)
+        if entry is None:
+            _STATS["misses"] += 1
+            return None
+        if entry[0] <= time.monotonic():
+            _ENTRIES.pop(key, None)
+            _STATS["expired"] += 1
+            _STATS["misses"] += 1
+            return None
+        _ENTRIES.move_to_end(key)
+        _STATS["hits"] += 1
+        return copy.deepcopy(entry[1])
+
+
+def put(key: str, result: Optional[Dict[str, Any]], personal_terms: Iterable[str] = ()) -> bool:
+    result = result or {}
+    if not key or result.get("fallback") or not (result.get("reply") or "").strip():
+        return False
+
+    reply_norm = normalize_text(result.get("reply") or "")
+    for term in personal_terms or ():
+        term = normalize_text(term)
+        if len(term) >= 3 and term in reply_norm:
+            # resposta citou algo do lead (nome, empresa); não serve para outros
+            with _LOCK:
+                _STATS["skipped"] += 1
+            return False
+
+    value = copy.deepcopy({k: result.get(k) for k in CACHED_KEYS if k in result})
+    with _LOCK:
+        _ENTRIES[key] = (time.monotonic() + REPLY_CACHE_TTL_SECONDS, value)
+        _ENTRIES.move_to_end(key)
+        _STATS["stores"] += 1
+        while len(_ENTRIES) > REPLY_CACHE_MAX_ENTRIES:
+            _ENTRIES.popitem(last=False)
+            _STATS["evictions"] += 1
+    return True
+
+
+def clear() -> None:
+    with _LOCK:
+        _ENTRIES.clear()
+
+
+def reply_cache_stats() -> Dict[str, Any]:
+    with _LOCK:
+        lookups = _STATS["hits"] + _STATS["misses"]
+        return {
+            **_STATS,
+            "enabled": REPLY_CACHE_ENABLED,
+            "entries": len(_ENTRIES),
+            "hit_rate": round(_STATS["hits"] / lookups, 4) if lookups else 0.0,
+            "ttl_seconds": REPLY_CACHE_TTL_SECONDS,
+            "max_entries": REPLY_CACHE_MAX_ENTRIES,
+        }
@@ -1,9 +1,15 @@
 from __future__ import annotations
 
+import ast
 import re
 import unicodedata
+from collections import Counter
 from difflib import SequenceMatcher
-from typing import Any, Dict, List
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, List
+
+from services import intent_model, keyword_matcher, log
 
 
 FIELD_KEYS = [
@@ -45,6 +51,7 @@ FIELD_KEYS = [
     "pain",
     "process",
 ]
+_FIELD_KEY_SET = frozenset(FIELD_KEYS)
 
 
 SERVICE_LABELS = {
@@ -247,6 +254,57 @@ def extract_conversation_facts(messages: list | None) -> Dict[str, Any]:
     return facts
 
 
+FACTS_FIRST_WINS = ("produto_servico", "service_interest", "dor_principal", "estrutura_atual")
+FACTS_OVERRIDING_OBJECTIVES = {"vender mais", "estrutura digital + comunicação"}
+
+
+def fold_conversation_facts(
+    accumulated: Dict[str, Any] | None,
+    text: str,
+    message_facts: Dict[str, Any] | None = None,
+) -> Dict[str, Any]:
+    # acumula os fatos mensagem a mensagem com a mesma precedência de extract_conversation_facts sobre o histórico inteiro;
+    # custo O(mensagem nova) e cada fato guarda de qual mensagem veio
+    acc = dict(accumulated) if isinstance(accumulated, dict) else {}
+    facts = dict(acc.get("facts") or {})
+    provenance = dict(acc.get("provenance") or {})
+    norm = normalize_text(text)
+    if not norm or norm == acc.get("last_norm"):
+        return acc
+    new = message_facts if message_facts is not None else extract_conversation_facts([{"direction": "in", "text": text}])
+    index = int(acc.get("message_count") or 0) + 1
+    before = dict(facts)
+
+    for key in FACTS_FIRST_WINS:
+        if new.get(key) and not facts.get(key):
+            facts[key] = new[key]
+    related = list(facts.get("related_needs") or [])
+    for item in new.get("related_needs") or []:
+        _append_unique(related, item)
+    facts["related_needs"] = related
+    for source in re.split(r",| e |\+|/", str(new.get("canal") or "")):
+        if source.strip():
+            facts["canal"] = _append_source(facts.get("canal"), source.strip())
+    objective = new.get("objetivo")
+    if objective and (objective in FACTS_OVERRIDING_OBJECTIVES or not facts.get("objetivo")):
+        facts["objetivo"] = objective
+    urgency = new.get("urgencia")
+    if urgency and (urgency == "alta" or not facts.get("urgencia")):
+        facts["urgencia"] = urgency
+    facts["pedido_humano"] = bool(facts.get("pedido_humano") or new.get("pedido_humano"))
+
+    for key, value in facts.items():
+        if value not in (None, "", [], False) and value != before.get(key):
+            provenance[key] = {"message": index, "text": str(text)[:160]}
+    return {
+        "facts": facts,
+        "provenance": provenance,
+        "terms": sorted(set(acc.get("terms") or []) | keyword_matcher.scan(norm)),
+        "message_count": index,
+        "last_norm": norm,
+    }
+
+
 def _consultative_interpretation_from_state(merged: Dict[str, Any], facts: Dict[str, Any] | None = None) -> str:
     facts = facts or {}
     product = merged.get("produto_servico") or facts.get("produto_servico")
@@ -327,6 +385,14 @@ INTENT_BY_SERVICE = {
     "humano": "humano",
 }
 
+SEMANTIC_INTENT_BY_SERVICE = {
+    "site": "site_landing",
+    "automacao_whatsapp": "whatsapp_automation",
+    "inteligencia_artificial": "ai_business",
+    "trafego_pago": "traffic",
+    "branding": "branding",
+}
+
 MENU_TEXT_PATTERNS = {
     "site": [
         "service_site",
@@ -403,16 +469,73 @@ MENU_TEXT_PATTERNS = {
 }
 
 
+NORMALIZE_CACHE_SIZE = 4096
+NORMALIZE_CACHE_MAX_CHARS = 600
+_NON_WORD_RE = re.compile(r"[^\w\s/]")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def _normalize_uncached(value: str) -> str:
+    value = value.strip().lower()
+    if not value.isascii():
+        value = unicodedata.normalize("NFD", value)
+        value = "".join(ch for ch in value if unicodedata.category(ch) != "Mn")
+    value = _NON_WORD_RE.sub(" ", value)
+    return _SPACES_RE.sub(" ", value).strip()
+
+
+_normalize_cached = lru_cache(maxsize=NORMALIZE_CACHE_SIZE)(_normalize_uncached)
+
+
 def normalize_text(text: str) -> str:
-    value = str(text or "").strip().lower()
-    value = unicodedata.normalize("NFD", value)
-    value = "".join(ch for ch in value if unicodedata.category(ch) != "Mn")
-    value = re.sub(r"[^\w\s/]", " ", value)
-    return re.sub(r"\s+", " ", value).strip()
+    # o mesmo texto (mensagem, última pergunta, catálogo de perguntas) passa aqui várias vezes por turno
+    value = text if isinstance(text, str) else str(text or "")
+    if len(value) > NORMALIZE_CACHE_MAX_CHARS:
+        return _normalize_uncached(value)
+    return _normalize_cached(value)
+
+
+def analyze_turn(text: str, state: Dict[str, Any] | None = None) -> Dict[str, Any]:
+    # contexto do turno: cada string normalizada uma vez e reaproveitada pelas heurísticas e validações
+    state = flatten_state(state or {})
+    norm = normalize_text(text)
+    last_question = str(state.get("last_question_asked") or "")
+    recent = state.get("recent_bot_questions") or []
+    return {
+        "text": text,
+        "norm": norm,
+        "words": frozenset(norm.split()),
+        "last_question_norm": normalize_text(last_question),
+        "last_category": state.get("last_question_category") or question_category(last_question),
+        "recent_questions_norm": [normalize_text(item) for item in recent] if isinstance(recent, list) else [],
+    }
 
 
 def _has_any(text: str, terms: List[str]) -> bool:
-    return any(term in text for term in terms)
+    # lista nova (montada em runtime, [*X, "y"], deploy só com .pyc) é registrada no primeiro uso
+    return keyword_matcher.has_any(text, terms)
+
+
+@lru_cache(maxsize=1)
+def _module_tree() -> ast.AST | None:
+    try:
+        return ast.parse(Path(__file__).read_text(encoding="utf-8"))
+    except Exception as e:
+        log.warning("SALES_BRAIN_SOURCE_PARSE_ERROR", error=repr(e))
+        return None
+
+
+def _inline_vocabularies() -> List[List[str]]:
+    # toda lista literal de strings do módulo (inline em _has_any ou em variável local);
+    # só aquecimento: registradas no import para o autômato não recompilar em runtime
+    vocabularies: List[List[str]] = []
+    tree = _module_tree()
+    if tree is None:
+        return vocabularies
+    for node in ast.walk(tree):
+        if isinstance(node, ast.List) and node.elts and all(isinstance(item, ast.Constant) and isinstance(item.value, str) for item in node.elts):
+            vocabularies.append([item.value for item in node.elts])
+    return vocabularies
 
 
 def _has_deadline_urgency(text: str) -> bool:
@@ -439,7 +562,7 @@ def _can_update_known_field(state: Dict[str, Any], key: str, value: Any, text: s
         return True
     if _explicit_field_change(text) or detect_explicit_service_switch(text):
         return True
-    print(f"SALES_BRAIN_FIELD_LOCKED field={key} current={current!r} incoming={value!r} text={str(text or '')[:160]!r}")
+    log.debug("SALES_BRAIN_FIELD_LOCKED", field=key, current=current, incoming=value, text=str(text or "")[:160])
     return False
 
 
@@ -460,9 +583,10 @@ def _match_menu_service(value: str) -> tuple[str, str]:
     for service, patterns in MENU_TEXT_PATTERNS.items():
         if norm in patterns:
             return service, "high"
+    found = keyword_matcher.scan(norm)
     for service, patterns in MENU_TEXT_PATTERNS.items():
         for pattern in patterns:
-            if len(pattern) >= 4 and (pattern in norm or norm in pattern):
+            if len(pattern) >= 4 and (pattern in found or norm in pattern):
                 return service, "medium"
     return "", "low"
 
@@ -941,6 +1065,10 @@ def _semantic_intent(text: str, state: Dict[str, Any]) -> tuple[str, float]:
         return "traffic", 0.74
     if _has_any(norm, ["crm", "funil", "relacionamento"]):
         return "crm", 0.72
+    service, probability = intent_model.predict(norm)
+    if SEMANTIC_INTENT_BY_SERVICE.get(service) and probability >= intent_model.INTENT_MODEL_MIN_CONFIDENCE:
+        # classificador local treinado com o histórico; fica abaixo das regras explícitas
+        return SEMANTIC_INTENT_BY_SERVICE[service], round(min(0.74, probability), 2)
     return "unknown", 0.3
 
 
@@ -956,13 +1084,18 @@ def _question_was_answered(stage: str, extracted_fields: Dict[str, Any]) -> bool
     return any(value not in (None, "", "indefinido") for value in extracted_fields.values())
 
 
-def interpret_user_message(user_message: str, conversation_context: Dict[str, Any] | None = None) -> Dict[str, Any]:
+def interpret_user_message(
+    user_message: str,
+    conversation_context: Dict[str, Any] | None = None,
+    turn: Dict[str, Any] | None = None,
+) -> Dict[str, Any]:
     state = flatten_state(conversation_context or {})
-    norm = normalize_text(user_message)
+    turn = turn or analyze_turn(user_message, state)
+    norm = turn["norm"]
     intent, intent_confidence = _semantic_intent(norm, state)
     site_scope, scope_confidence, scope_reason = _semantic_site_scope(norm, state)
     problem = _semantic_current_problem(norm)
-    stage = state.get("last_question_category") or question_category(state.get("last_question_asked") or "")
+    stage = turn["last_category"]
     if stage == "site_scope" and problem == "estrutura precisa ser melhorada":
         problem = ""
     channel = ""
@@ -1114,13 +1247,16 @@ def normalize_inbound_choice(
         if source == "text" and not _is_pure_menu_number(value):
             continue
         if source == "text" and locked_service and not detect_explicit_service_switch(value) and not _is_pure_menu_number(value):
-            print(
-                f"SALES_BRAIN_SERVICE_LOCKED service={locked_service} "
-                f"ignored_contextual_menu_candidate={service} source=text text={value[:160]!r}"
+            log.debug(
+                "SALES_BRAIN_SERVICE_LOCKED",
+                service=locked_service,
+                ignored_contextual_menu_candidate=service,
+                source="text",
+                text=value[:160],
             )
             continue
         if source == "text" and locked_service and service != locked_service and not detect_explicit_service_switch(value):
-            print(f"SALES_BRAIN_SERVICE_LOCKED service={locked_service} ignored_candidate={service} source=text text={value[:160]!r}")
+            log.debug("SALES_BRAIN_SERVICE_LOCKED", service=locked_service, ignored_candidate=service, source="text", text=value[:160])
             continue
         best_service = service
         best_confidence = "high" if source in {"list_id", "button_id"} and confidence != "low" else confidence
@@ -1130,7 +1266,13 @@ def normalize_inbound_choice(
     if locked_service and best_service and best_service != locked_service and not detect_explicit_service_switch(raw_text):
         source_is_visual_click = best_source in {"list_id", "button_id", "list_title", "button_title", "list_description"}
         if not source_is_visual_click:
-            print(f"SALES_BRAIN_SERVICE_LOCKED service={locked_service} ignored_candidate={best_service} source={best_source} text={raw_text[:160]!r}")
+            log.debug(
+                "SALES_BRAIN_SERVICE_LOCKED",
+                service=locked_service,
+                ignored_candidate=best_service,
+                source=best_source,
+                text=raw_text[:160],
+            )
             best_service = ""
             best_confidence = "low"
             best_source = ""
@@ -1147,15 +1289,18 @@ def normalize_inbound_choice(
     }
 
 
+def _is_blank(value: Any) -> bool:
+    # mesmo critério de `value in (None, "", [], {})` sem alocar lista/dict a cada teste
+    return value is None or (not value and isinstance(value, (str, list, dict)))
+
+
 def flatten_state(state: Dict[str, Any] | None) -> Dict[str, Any]:
     src = state or {}
     fields = src.get("lead_fields") if isinstance(src.get("lead_fields"), dict) else {}
-    flat = {}
-    for key in FIELD_KEYS:
-        value = src.get(key)
-        if value in (None, "", [], {}) and key in fields:
-            value = fields.get(key)
-        flat[key] = value
+    flat = {key: src.get(key) for key in FIELD_KEYS}
+    for key, value in fields.items():
+        if key in _FIELD_KEY_SET and _is_blank(flat[key]):
+            flat[key] = value
     flat["lead_fields"] = dict(fields)
     flat["selected_service"] = src.get("selected_service") or fields.get("service_interest") or flat.get("service_interest")
     flat["selected_service_id"] = src.get("selected_service_id") or ""
@@ -1169,6 +1314,8 @@ def flatten_state(state: Dict[str, Any] | None) -> Dict[str, Any]:
     flat["conversation_synthesis"] = synthesis if isinstance(synthesis, dict) else {}
     understanding = src.get("conversation_understanding") or fields.get("conversation_understanding") or flat["conversation_synthesis"]
     flat["conversation_understanding"] = understanding if isinstance(understanding, dict) else {}
+    accumulated = src.get("conversation_facts") or {}
+    flat["conversation_facts"] = accumulated if isinstance(accumulated, dict) else {}
     return flat
 
 
@@ -1202,13 +1349,15 @@ def service_choice_update(choice_id: str) -> Dict[str, Any]:
 
 
 def extract_signal_from_message(text: str, current_state: Dict[str, Any]) -> Dict[str, Any]:
-    norm = normalize_text(text)
     state = flatten_state(current_state)
+    turn = analyze_turn(text, state)
+    norm = turn["norm"]
     last_category = state.get("last_question_category") or ""
     service = state.get("service_interest") or state.get("selected_service") or ""
     updates: Dict[str, Any] = {}
     conversation_facts = extract_conversation_facts([{"direction": "in", "text": text}])
-    interpretation = interpret_user_message(text, state)
+    accumulated_facts = fold_conversation_facts(state.get("conversation_facts"), text, conversation_facts)
+    interpretation = interpret_user_message(text, state, turn)
     semantic_updates = _updates_from_interpretation(
         interpretation.get("extracted_fields") or {},
         interpretation.get("intent") or "unknown",
@@ -1222,17 +1371,21 @@ def extract_signal_from_message(text: str, current_state: Dict[str, Any]) -> Dic
     if choice_updates:
         choice_service = choice_updates.get("service_interest") or ""
         if service and last_category and not detect_explicit_service_switch(text) and not _is_pure_menu_number(text):
-            print(
-                f"SALES_BRAIN_SERVICE_LOCKED service={service} "
-                f"ignored_contextual_choice={choice_service} category={last_category} text={text[:160]!r}"
+            log.debug(
+                "SALES_BRAIN_SERVICE_LOCKED",
+                service=service,
+                ignored_contextual_choice=choice_service,
+                category=last_category,
+                text=text[:160],
             )
         elif service and choice_service and choice_service != service and not detect_explicit_service_switch(text):
-            print(f"SALES_BRAIN_SERVICE_LOCKED service={service} ignored_candidate={choice_service} source=text text={text[:160]!r}")
+            log.debug("SALES_BRAIN_SERVICE_LOCKED", service=service, ignored_candidate=choice_service, source="text", text=text[:160])
         else:
             updates.update(choice_updates)
             understanding = _merge_conversation_synthesis(state, updates, text)
             updates["conversation_synthesis"] = understanding
             updates["conversation_understanding"] = understanding
+            updates["conversation_facts"] = accumulated_facts
             return updates
 
     if conversation_facts.get("pedido_humano") or _has_any(norm, ["humano", "pessoa", "atendente", "julia", "falar com alguem", "quero falar", "falar com a equipe"]):
@@ -1320,11 +1473,11 @@ def extract_signal_from_message(text: str, current_state: Dict[str, Any]) -> Dic
     elif service and candidate_service and candidate_service != service:
         if _explicit_service_switch(norm):
             updates.update({"service_interest": candidate_service, "intent": candidate_service, "funnel_stage": "qualificacao"})
-            print(f"SALES_BRAIN_SERVICE_SWITCH from={service} to={candidate_service} text={text[:160]!r}")
+            log.debug("SALES_BRAIN_SERVICE_SWITCH", from_service=service, to_service=candidate_service, text=text[:160])
         else:
-            print(f"SALES_BRAIN_SERVICE_LOCKED service={service} ignored_candidate={candidate_service} text={text[:160]!r}")
+            log.debug("SALES_BRAIN_SERVICE_LOCKED", service=service, ignored_candidate=candidate_service, text=text[:160])
     elif service and candidate_service:
-        print(f"SALES_BRAIN_SERVICE_LOCKED service={service} contextual_candidate={candidate_service} text={text[:160]!r}")
+        log.debug("SALES_BRAIN_SERVICE_LOCKED", service=service, contextual_candidate=candidate_service, text=text[:160])
 
     service = updates.get("service_interest") or service
 
@@ -1334,11 +1487,23 @@ def extract_signal_from_message(text: str, current_state: Dict[str, Any]) -> Dic
         if multi_answer == "two":
             updates["main_goal"] = "posicionamento e conteúdo/redes sociais"
             updates["funnel_stage"] = "qualificacao"
-            print(f"CONTEXTUAL_SHORT_ANSWER_PARSED category=main_goal service=branding value={updates['main_goal']!r} text={text[:160]!r}")
+            log.debug(
+                "CONTEXTUAL_SHORT_ANSWER_PARSED",
+                category="main_goal",
+                service="branding",
+                value=updates["main_goal"],
+                text=text[:160],
+            )
         elif multi_answer == "all":
             updates["main_goal"] = "posicionamento, conteúdo/redes sociais e identidade visual"
             updates["funnel_stage"] = "qualificacao"
-            print(f"CONTEXTUAL_SHORT_ANSWER_PARSED category=main_goal service=branding value={updates['main_goal']!r} text={text[:160]!r}")
+            log.debug(
+                "CONTEXTUAL_SHORT_ANSWER_PARSED",
+                category="main_goal",
+                service="branding",
+                value=updates["main_goal"],
+                text=text[:160],
+            )
         elif _has_any(norm, ["conteudo", "redes", "social media"]):
             updates["main_goal"] = "conteúdo/redes sociais"
             updates["funnel_stage"] = "qualificacao"
@@ -1367,19 +1532,31 @@ def extract_signal_from_message(text: str, current_state: Dict[str, Any]) -> Dic
     if last_category == "main_goal" and service == "trafego_pago" and multi_answer == "all":
         updates["main_goal"] = "gerar leads, vender no site e fortalecer marca"
         updates["funnel_stage"] = "qualificacao"
-        print(f"CONTEXTUAL_SHORT_ANSWER_PARSED category=main_goal service=trafego_pago value={updates['main_goal']!r} text={text[:160]!r}")
+        log.debug(
+            "CONTEXTUAL_SHORT_ANSWER_PARSED",
+            category="main_goal",
+            service="trafego_pago",
+            value=updates["main_goal"],
+            text=text[:160],
+        )
 
     if service == "site" or last_category == "site_scope":
         if service == "site" and last_category == "site_scope" and _has_any(norm, ["whatsapp", "whats", "zap"]):
             updates["desired_result"] = "usar WhatsApp como canal de conversão"
             updates["current_problem"] = updates.get("current_problem") or "página precisa levar as pessoas para o WhatsApp"
-            print(f"SALES_BRAIN_CONTEXT_SIGNAL category=site_scope field=desired_result value='usar WhatsApp como canal de conversão' text={text[:160]!r}")
+            log.debug(
+                "SALES_BRAIN_CONTEXT_SIGNAL",
+                category="site_scope",
+                field="desired_result",
+                value="usar WhatsApp como canal de conversão",
+                text=text[:160],
+            )
         if _has_any(norm, ["do zero", "nova", "novo", "nova pagina", "criar", "criar do zero", "comecar", "fazer uma nova"]):
             updates["site_scope"] = updates.get("site_scope") or "criar do zero"
-            print(f"SALES_BRAIN_CONTEXT_SIGNAL category=site_scope field=site_scope value='criar do zero' text={text[:160]!r}")
+            log.debug("SALES_BRAIN_CONTEXT_SIGNAL", category="site_scope", field="site_scope", value="criar do zero", text=text[:160])
         elif _is_existing_site_scope(norm) and (had_site_context or normalize_text(norm) not in {"site", "meu site", "o site", "pagina", "minha pagina"}):
             updates["site_scope"] = updates.get("site_scope") or SITE_EXISTING_SCOPE
-            print(f"SALES_BRAIN_CONTEXT_SIGNAL category=site_scope field=site_scope value={SITE_EXISTING_SCOPE!r} text={text[:160]!r}")
+            log.debug("SALES_BRAIN_CONTEXT_SIGNAL", category="site_scope", field="site_scope", value=SITE_EXISTING_SCOPE, text=text[:160])
 
     if service == "trafego_pago" or last_category == "current_status":
         if _has_any(norm, ["ja anuncio", "ja anunciam", "ja anunciamos", "rodo anuncio", "tenho campanha", "anuncio hoje", "anunciamos", "campanha ativa"]):
@@ -1401,7 +1578,7 @@ def extract_signal_from_message(text: str, current_state: Dict[str, Any]) -> Dic
         elif _has_any(norm, ["processo", "operacao", "operação", "manual", "retrabalho"]):
             updates["main_goal"] = "processos internos"
         updates["funnel_stage"] = "qualificacao"
-        print(f"SALES_BRAIN_CONTEXT_SIGNAL category={last_category} field=current_problem text={text[:160]!r}")
+        log.debug("SALES_BRAIN_CONTEXT_SIGNAL", category=last_category, field="current_problem", text=text[:160])
     elif not updates.get("main_goal") and _has_any(norm, ["vendas", "vender", "vender mais", "mais clientes", "leads", "gerar leads", "converter mais"]):
         updates["main_goal"] = "vendas/leads"
         updates["desired_result"] = "vender mais / gerar mais oportunidades"
@@ -1421,7 +1598,7 @@ def extract_signal_from_message(text: str, current_state: Dict[str, Any]) -> Dic
     if last_category == "lead_source" and multi_answer == "all":
         source = "WhatsApp, Instagram e site"
         source_changed = True
-        print(f"CONTEXTUAL_SHORT_ANSWER_PARSED category=lead_source value={source!r} text={text[:160]!r}")
+        log.debug("CONTEXTUAL_SHORT_ANSWER_PARSED", category="lead_source", value=source, text=text[:160])
     elif last_category == "lead_source" and _has_any(norm, ["whatsapp e instagram", "whats e insta", "zap e insta"]):
         source = "WhatsApp e Instagram"
         source_changed = True
@@ -1446,11 +1623,11 @@ def extract_signal_from_message(text: str, current_state: Dict[str, Any]) -> Dic
     if source and source_changed:
         updates["lead_source"] = source
         if last_category == "lead_source":
-            print(f"SALES_BRAIN_CONTEXT_SIGNAL category=lead_source field=lead_source value={source!r} text={text[:160]!r}")
+            log.debug("SALES_BRAIN_CONTEXT_SIGNAL", category="lead_source", field="lead_source", value=source, text=text[:160])
 
     if last_category == "current_tools" and _has_any(norm, ["whatsapp", "whats", "zap"]) and not updates.get("current_tools"):
         updates["current_tools"] = "WhatsApp"
-        print(f"SALES_BRAIN_CONTEXT_SIGNAL category=current_tools field=current_tools value='WhatsApp' text={text[:160]!r}")
+        log.debug("SALES_BRAIN_CONTEXT_SIGNAL", category="current_tools", field="current_tools", value="WhatsApp", text=text[:160])
 
     if _has_any(norm, ["manual", "na mao", "sem crm", "planilha", "caderno"]):
         updates["current_tools"] = "manual"
@@ -1458,22 +1635,34 @@ def extract_signal_from_message(text: str, current_state: Dict[str, Any]) -> Dic
             updates["current_problem"] = "processo manual"
         updates["funnel_stage"] = "qualificacao"
         if last_category == "current_tools":
-            print(f"SALES_BRAIN_CONTEXT_SIGNAL category=current_tools field=current_tools value='manual' text={text[:160]!r}")
+            log.debug("SALES_BRAIN_CONTEXT_SIGNAL", category="current_tools", field="current_tools", value="manual", text=text[:160])
     else:
         for tool in ["hubspot", "pipedrive", "rd station", "kommo", "crm"]:
             if tool in norm:
                 updates["current_tools"] = tool.upper() if tool == "crm" else tool
                 if last_category == "current_tools":
-                    print(f"SALES_BRAIN_CONTEXT_SIGNAL category=current_tools field=current_tools value={updates['current_tools']!r} text={text[:160]!r}")
+                    log.debug(
+                        "SALES_BRAIN_CONTEXT_SIGNAL",
+                        category="current_tools",
+                        field="current_tools",
+                        value=updates["current_tools"],
+                        text=text[:160],
+                    )
                 break
 
     if service == "branding" and last_category == "current_status":
         if _has_any(norm, ["do zero", "comecar do zero", "começar do zero", "nao temos", "ainda nao", "sem identidade"]):
             updates["current_status"] = "começar do zero"
-            print(f"SALES_BRAIN_CONTEXT_SIGNAL category=current_status field=current_status value='começar do zero' text={text[:160]!r}")
+            log.debug("SALES_BRAIN_CONTEXT_SIGNAL", category="current_status", field="current_status", value="começar do zero", text=text[:160])
         elif _has_any(norm, ["ja temos", "já temos", "temos", "presenca ativa", "presença ativa", "ja existe", "redes ativas"]):
             updates["current_status"] = "já tem presença/identidade"
-            print(f"SALES_BRAIN_CONTEXT_SIGNAL category=current_status field=current_status value='já tem presença/identidade' text={text[:160]!r}")
+            log.debug(
+                "SALES_BRAIN_CONTEXT_SIGNAL",
+                category="current_status",
+                field="current_status",
+                value="já tem presença/identidade",
+                text=text[:160],
+            )
 
     if _has_deadline_urgency(norm):
         updates["urgency"] = "alta"
@@ -1519,17 +1708,19 @@ def extract_signal_from_message(text: str, current_state: Dict[str, Any]) -> Dic
     understanding = _merge_conversation_synthesis(state, locked_updates, text)
     locked_updates["conversation_synthesis"] = understanding
     locked_updates["conversation_understanding"] = understanding
+    locked_updates["conversation_facts"] = accumulated_facts
     return locked_updates
 
 
 def merge_state(old_state: Dict[str, Any], updates: Dict[str, Any]) -> Dict[str, Any]:
+    # cópia rasa: valores aninhados não tocados são compartilhados com old_state (state_delta compara por identidade)
     merged = dict(old_state or {})
     fields = dict(merged.get("lead_fields") or {})
     for key, value in (updates or {}).items():
-        if value in (None, "", [], {}):
+        if _is_blank(value):
             continue
         merged[key] = value
-        if key in FIELD_KEYS and key not in {"meeting_suggested", "briefing_ready", "handoff"}:
+        if key in _FIELD_KEY_SET and key not in {"meeting_suggested", "briefing_ready", "handoff"}:
             fields[key] = value
     question = str((updates or {}).get("last_question_asked") or "").strip()
     if question:
@@ -1553,50 +1744,160 @@ def merge_state(old_state: Dict[str, Any], updates: Dict[str, Any]) -> Dict[str,
     return merged
 
 
+def state_delta(before: Dict[str, Any] | None, after: Dict[str, Any] | None) -> Dict[str, Any]:
+    # chaves de topo que mudaram; merge_state compartilha o que não mudou, então identidade resolve quase tudo
+    before = before or {}
+    delta = {}
+    for key, value in (after or {}).items():
+        previous = before.get(key)
+        if value is previous:
+            continue
+        if value != previous or key not in before:
+            delta[key] = value
+    return delta
+
+
+# perguntas fixas do backend: montadas uma vez e registradas aqui; QUESTION_CATEGORIES sai desta
+# lista (não do fonte em disco) e os _progressive_*_question devolvem os dicts prontos
+BACKEND_QUESTIONS: List[Dict[str, str]] = []
+
+
+def _backend_question(category: str, question: str, next_action: str = "ask_question") -> Dict[str, str]:
+    entry = {"category": category, "question": question, "next_action": next_action}
+    BACKEND_QUESTIONS.append(entry)
+    return entry
+
+
+AUTOMATION_GOAL_ASK = _backend_question(
+    "main_goal",
+    "O principal objetivo agora é vender mais, responder mais rápido ou organizar melhor o processo comercial?",
+)
+AUTOMATION_VOLUME_ASK = _backend_question("volume", "Para dimensionar melhor, mais ou menos quantos leads ou conversas entram por semana?")
+AUTOMATION_GARGALO_ASK = _backend_question(
+    "gargalo",
+    "Hoje o maior gargalo está na demora para responder, no acompanhamento dos leads ou na perda de oportunidades?",
+)
+AUTOMATION_CRM_ASK = _backend_question("crm", "Vocês controlam esses leads em algum CRM ou ainda fica tudo no WhatsApp e na memória da equipe?")
+AUTOMATION_RESPONSE_TIME_ASK = _backend_question(
+    "tempo_resposta",
+    "Quando um lead chama hoje, em média ele recebe retorno em minutos, horas ou só quando alguém consegue parar para responder?",
+)
+AUTOMATION_BUDGET_ASK = _backend_question("budget_signal", "Vocês já têm uma faixa de investimento pensada para organizar essa operação?")
+AUTOMATION_MEETING_ASK = _backend_question(
+    "offer_meeting",
+    "Já tenho uma leitura boa do cenário. Posso encaminhar isso para a Julia avaliar o próximo movimento com vocês?",
+    "offer_meeting",
+)
+SITE_SCOPE_RETRY_ASK = _backend_question(
+    "site_scope",
+    "Para eu não te prender numa pergunta travada: hoje existe alguma página no ar ou a ideia é construir uma nova base?",
+)
+SITE_SCOPE_ASK = _backend_question("site_scope", SITE_SCOPE_QUESTION)
+SITE_NEW_GOAL_ASK = _backend_question("main_goal", "Essa página precisa vender um serviço, captar leads ou apresentar melhor a marca?")
+SITE_PROBLEM_ASK = _backend_question("current_problem", SITE_PROBLEM_QUESTION)
+SITE_GOAL_ASK = _backend_question("main_goal", "O foco dessa página é gerar leads, vender mais ou apresentar melhor a marca?")
+SITE_AUDIENCE_ASK = _backend_question("publico", "Essa página fala mais com clientes finais, empresas ou um público mais específico?")
+SITE_DEADLINE_ASK = _backend_question("urgency", "Você tem alguma data ou campanha em mente para colocar essa página no ar?")
+SITE_MEETING_ASK = _backend_question(
+    "offer_meeting",
+    "Já tenho uma boa leitura da página. Posso encaminhar para a Julia avaliar o próximo movimento?",
+    "offer_meeting",
+)
+AI_CHATBOT_GOAL_ASK = _backend_question(
+    "main_goal",
+    "Então o caminho é criar um agente de IA para atendimento. Esse chatbot precisa mais qualificar leads, responder dúvidas ou conduzir vendas?",
+)
+AI_CHATBOT_PROBLEM_ASK = _backend_question(
+    "current_problem",
+    "Boa. Então ele precisa atuar no comercial, não só no suporte. Hoje a maior perda acontece por demora na resposta ou por falta de acompanhamento dos contatos?",
+)
+AI_PROCESS_ASK = _backend_question("main_goal", "Qual processo você imagina melhorar com IA: atendimento, vendas, conteúdo ou operação interna?")
+AI_PAIN_ASK = _backend_question(
+    "current_problem",
+    "Hoje qual parte desse processo mais trava: volume, tempo de resposta, retrabalho ou falta de padrão?",
+)
+AI_TOOLS_ASK = _backend_question("current_tools", "Hoje esse processo acontece manualmente ou já passa por alguma ferramenta?")
+AI_VOLUME_ASK = _backend_question("volume_tarefa", "Esse processo acontece poucas vezes por semana ou em alto volume todos os dias?")
+AI_BUDGET_ASK = _backend_question("budget_signal", "Vocês já têm uma faixa de investimento pensada para automatizar isso?")
+AI_MEETING_ASK = _backend_question(
+    "offer_meeting",
+    "Já dá para desenhar uma hipótese de IA com impacto. Posso encaminhar para a Julia avaliar com vocês?",
+    "offer_meeting",
+)
+TRAFFIC_STATUS_ASK = _backend_question("current_status", "Hoje vocês já anunciam ou querem começar do zero?")
+TRAFFIC_GOAL_ASK = _backend_question("main_goal", "O foco da campanha é gerar leads, vender no site ou fortalecer a marca?")
+TRAFFIC_OFFER_ASK = _backend_question("oferta", "Qual oferta, produto ou serviço você quer colocar no centro dessa campanha?")
+TRAFFIC_BUDGET_ASK = _backend_question("budget_signal", "Vocês já têm uma verba mensal pensada para mídia?")
+TRAFFIC_PERFORMANCE_ASK = _backend_question(
+    "problema_performance",
+    "Hoje o ponto que mais incomoda é custo, conversão, volume de leads ou qualidade das oportunidades?",
+)
+TRAFFIC_MEETING_ASK = _backend_question(
+    "offer_meeting",
+    "Já tenho contexto para avaliar mídia com mais responsabilidade. Posso encaminhar para a Julia?",
+    "offer_meeting",
+)
+BRANDING_CHALLENGE_ASK = _backend_question(
+    "dificuldade_atual",
+    "Hoje o maior desafio está em atrair pessoas certas, transformar interesse em conversa ou manter constância de conteúdo?",
+)
+BRANDING_GOAL_ASK = _backend_question("main_goal", "Você quer fortalecer posicionamento, identidade visual ou conteúdo para redes?")
+BRANDING_STAGE_ASK = _backend_question("estagio_marca", "Essa operação já está vendendo hoje ou ainda está em fase de lançamento?")
+BRANDING_PUBLISHING_ASK = _backend_question("canal_principal", "Hoje vocês já publicam com frequência?")
+BRANDING_IDENTITY_STAGE_ASK = _backend_question(
+    "estagio_marca",
+    "Hoje essa marca já tem nome, identidade visual e redes ativas ou ainda está sendo estruturada do zero?",
+)
+BRANDING_PRODUCT_ASK = _backend_question(
+    "produto_servico",
+    "O que essa marca vende ou quer apresentar melhor: produtos, serviços ou uma nova oferta?",
+)
+BRANDING_CHANNEL_ASK = _backend_question(
+    "canal_principal",
+    "Hoje o principal canal de comunicação é Instagram, WhatsApp, site ou outro ponto de contato?",
+)
+BRANDING_DIFFICULTY_ASK = _backend_question(
+    "dificuldade_atual",
+    "Você quer começar mais pela construção da marca, pela organização do conteúdo ou por uma estratégia para gerar demanda?",
+)
+BRANDING_BUDGET_ASK = _backend_question("budget_signal", "Vocês já têm uma faixa de investimento pensada para essa frente de marca e comunicação?")
+BRANDING_MEETING_ASK = _backend_question(
+    "offer_meeting",
+    "Já tenho uma leitura consistente da marca. Posso encaminhar para a Julia avaliar o próximo movimento?",
+    "offer_meeting",
+)
+GENERAL_MEETING_ASK = _backend_question(
+    "offer_meeting",
+    "Perfeito, já tenho um bom contexto. Posso encaminhar um resumo para a Julia e agilizar o próximo passo?",
+    "offer_meeting",
+)
+HANDOFF_ASK = _backend_question("handoff", "Perfeito. Já tenho contexto suficiente para direcionar você da melhor forma.", "handoff")
+LEAD_SOURCE_ASK = _backend_question("lead_source", "Por qual canal você mais recebe oportunidades comerciais hoje?")
+CURRENT_TOOLS_ASK = _backend_question("current_tools", "O atendimento hoje depende muito de resposta manual ou já tem algum fluxo automatizado?")
+SERVICE_INTEREST_ASK = _backend_question(
+    "service_interest",
+    "Vou seguir por uma leitura mais ampla para não te prender em pergunta solta. Hoje você busca mais clareza estratégica, melhoria de comunicação ou automação do atendimento?",
+)
+SITE_PROBLEM_SHORT_ASK = _backend_question("current_problem", "Me conta em uma frase o que mais precisa melhorar no site hoje?")
+COMMERCIAL_GAP_ASK = _backend_question("current_problem", "Qual gargalo comercial está mais claro para você hoje?")
+
+
 def _progressive_automation_question(state: Dict[str, Any]) -> Dict[str, Any]:
     state = flatten_state(state)
     memory = _read_memory(state)
     if not memory.get("objetivo"):
-        return {
-            "category": "main_goal",
-            "question": "O principal objetivo agora é vender mais, responder mais rápido ou organizar melhor o processo comercial?",
-            "next_action": "ask_question",
-        }
+        return AUTOMATION_GOAL_ASK
     if not memory.get("volume"):
-        return {
-            "category": "volume",
-            "question": "Para dimensionar melhor, mais ou menos quantos leads ou conversas entram por semana?",
-            "next_action": "ask_question",
-        }
+        return AUTOMATION_VOLUME_ASK
     if not memory.get("gargalo"):
-        return {
-            "category": "gargalo",
-            "question": "Hoje o maior gargalo está na demora para responder, no acompanhamento dos leads ou na perda de oportunidades?",
-            "next_action": "ask_question",
-        }
+        return AUTOMATION_GARGALO_ASK
     if not memory.get("crm"):
-        return {
-            "category": "crm",
-            "question": "Vocês controlam esses leads em algum CRM ou ainda fica tudo no WhatsApp e na memória da equipe?",
-            "next_action": "ask_question",
-        }
+        return AUTOMATION_CRM_ASK
     if not memory.get("tempo_resposta"):
-        return {
-            "category": "tempo_resposta",
-            "question": "Quando um lead chama hoje, em média ele recebe retorno em minutos, horas ou só quando alguém consegue parar para responder?",
-            "next_action": "ask_question",
-        }
+        return AUTOMATION_RESPONSE_TIME_ASK
     if not memory.get("orcamento"):
-        return {
-            "category": "budget_signal",
-            "question": "Vocês já têm uma faixa de investimento pensada para organizar essa operação?",
-            "next_action": "ask_question",
-        }
-    return {
-        "category": "offer_meeting",
-        "question": "Já tenho uma leitura boa do cenário. Posso encaminhar isso para a Julia avaliar o próximo movimento com vocês?",
-        "next_action": "offer_meeting",
-    }
+        return AUTOMATION_BUDGET_ASK
+    return AUTOMATION_MEETING_ASK
 
 
 def _progressive_site_question(state: Dict[str, Any]) -> Dict[str, Any]:
@@ -1604,64 +1905,56 @@ def _progressive_site_question(state: Dict[str, Any]) -> Dict[str, Any]:
     memory = _discovery_from_known_fields(state)["site"]
     if not memory.get("site_scope"):
         if (state.get("last_question_category") or "") == "site_scope":
-            return {"category": "site_scope", "question": "Para eu não te prender numa pergunta travada: hoje existe alguma página no ar ou a ideia é construir uma nova base?", "next_action": "ask_question"}
-        return {"category": "site_scope", "question": SITE_SCOPE_QUESTION, "next_action": "ask_question"}
+            return SITE_SCOPE_RETRY_ASK
+        return SITE_SCOPE_ASK
     if memory.get("site_scope") == "criar do zero":
         if not memory.get("objetivo_pagina"):
-            return {"category": "main_goal", "question": "Essa página precisa vender um serviço, captar leads ou apresentar melhor a marca?", "next_action": "ask_question"}
+            return SITE_NEW_GOAL_ASK
     elif not memory.get("problema_site"):
-        return {"category": "current_problem", "question": SITE_PROBLEM_QUESTION, "next_action": "ask_question"}
+        return SITE_PROBLEM_ASK
     if not memory.get("objetivo_pagina"):
-        return {"category": "main_goal", "question": "O foco dessa página é gerar leads, vender mais ou apresentar melhor a marca?", "next_action": "ask_question"}
+        return SITE_GOAL_ASK
     if not memory.get("publico"):
-        return {"category": "publico", "question": "Essa página fala mais com clientes finais, empresas ou um público mais específico?", "next_action": "ask_question"}
+        return SITE_AUDIENCE_ASK
     if not memory.get("prazo"):
-        return {"category": "urgency", "question": "Você tem alguma data ou campanha em mente para colocar essa página no ar?", "next_action": "ask_question"}
-    return {"category": "offer_meeting", "question": "Já tenho uma boa leitura da página. Posso encaminhar para a Julia avaliar o próximo movimento?", "next_action": "offer_meeting"}
+        return SITE_DEADLINE_ASK
+    return SITE_MEETING_ASK
 
 
 def _progressive_ai_question(state: Dict[str, Any]) -> Dict[str, Any]:
     state = flatten_state(state)
     memory = _discovery_from_known_fields(state)["inteligencia_artificial"]
     if state.get("solution") == "chatbot com IA" and not (state.get("objective") or state.get("main_goal")):
-        return {
-            "category": "main_goal",
-            "question": "Então o caminho é criar um agente de IA para atendimento. Esse chatbot precisa mais qualificar leads, responder dúvidas ou conduzir vendas?",
-            "next_action": "ask_question",
-        }
+        return AI_CHATBOT_GOAL_ASK
     if state.get("solution") == "chatbot com IA" and (state.get("objective") or state.get("main_goal")) and not (state.get("pain") or state.get("current_problem")):
-        return {
-            "category": "current_problem",
-            "question": "Boa. Então ele precisa atuar no comercial, não só no suporte. Hoje a maior perda acontece por demora na resposta ou por falta de acompanhamento dos contatos?",
-            "next_action": "ask_question",
-        }
+        return AI_CHATBOT_PROBLEM_ASK
     if not memory.get("processo"):
-        return {"category": "main_goal", "question": "Qual processo você imagina melhorar com IA: atendimento, vendas, conteúdo ou operação interna?", "next_action": "ask_question"}
+        return AI_PROCESS_ASK
     if not memory.get("dor_operacional"):
-        return {"category": "current_problem", "question": "Hoje qual parte desse processo mais trava: volume, tempo de resposta, retrabalho ou falta de padrão?", "next_action": "ask_question"}
+        return AI_PAIN_ASK
     if not memory.get("ferramenta_atual"):
-        return {"category": "current_tools", "question": "Hoje esse processo acontece manualmente ou já passa por alguma ferramenta?", "next_action": "ask_question"}
+        return AI_TOOLS_ASK
     if not memory.get("volume_tarefa"):
-        return {"category": "volume_tarefa", "question": "Esse processo acontece poucas vezes por semana ou em alto volume todos os dias?", "next_action": "ask_question"}
+        return AI_VOLUME_ASK
     if not memory.get("orcamento"):
-        return {"category": "budget_signal", "question": "Vocês já têm uma faixa de investimento pensada para automatizar isso?", "next_action": "ask_question"}
-    return {"category": "offer_meeting", "question": "Já dá para desenhar uma hipótese de IA com impacto. Posso encaminhar para a Julia avaliar com vocês?", "next_action": "offer_meeting"}
+        return AI_BUDGET_ASK
+    return AI_MEETING_ASK
 
 
 def _progressive_traffic_question(state: Dict[str, Any]) -> Dict[str, Any]:
     state = flatten_state(state)
     memory = _discovery_from_known_fields(state)["trafego_pago"]
     if not memory.get("estrutura_atual"):
-        return {"category": "current_status", "question": "Hoje vocês já anunciam ou querem começar do zero?", "next_action": "ask_question"}
+        return TRAFFIC_STATUS_ASK
     if not memory.get("objetivo_campanha"):
-        return {"category": "main_goal", "question": "O foco da campanha é gerar leads, vender no site ou fortalecer a marca?", "next_action": "ask_question"}
+        return TRAFFIC_GOAL_ASK
     if not memory.get("oferta"):
-        return {"category": "oferta", "question": "Qual oferta, produto ou serviço você quer colocar no centro dessa campanha?", "next_action": "ask_question"}
+        return TRAFFIC_OFFER_ASK
     if not memory.get("verba"):
-        return {"category": "budget_signal", "question": "Vocês já têm uma verba mensal pensada para mídia?", "next_action": "ask_question"}
+        return TRAFFIC_BUDGET_ASK
     if not memory.get("problema_performance") and memory.get("estrutura_atual") == "já anuncia":
-        return {"category": "problema_performance", "question": "Hoje o ponto que mais incomoda é custo, conversão, volume de leads ou qualidade das oportunidades?", "next_action": "ask_question"}
-    return {"category": "offer_meeting", "question": "Já tenho contexto para avaliar mídia com mais responsabilidade. Posso encaminhar para a Julia?", "next_action": "offer_meeting"}
+        return TRAFFIC_PERFORMANCE_ASK
+    return TRAFFIC_MEETING_ASK
 
 
 def _progressive_branding_question(state: Dict[str, Any]) -> Dict[str, Any]:
@@ -1671,46 +1964,41 @@ def _progressive_branding_question(state: Dict[str, Any]) -> Dict[str, Any]:
     focus = normalize_text(memory.get("foco_marca") or "")
     if not (memory.get("foco_marca") or memory.get("objetivo_comunicacao")):
         if memory.get("canal_principal") == "Instagram":
-            return {"category": "dificuldade_atual", "question": "Hoje o maior desafio está em atrair pessoas certas, transformar interesse em conversa ou manter constância de conteúdo?", "next_action": "ask_question"}
-        return {"category": "main_goal", "question": "Você quer fortalecer posicionamento, identidade visual ou conteúdo para redes?", "next_action": "ask_question"}
+            return BRANDING_CHALLENGE_ASK
+        return BRANDING_GOAL_ASK
     if "divulgar produtos" in objective and memory.get("produto_servico"):
-        return {"category": "estagio_marca", "question": "Essa operação já está vendendo hoje ou ainda está em fase de lançamento?", "next_action": "ask_question"}
+        return BRANDING_STAGE_ASK
     if memory.get("produto_servico") and not memory.get("estagio_marca"):
-        return {"category": "estagio_marca", "question": "Essa operação já está vendendo hoje ou ainda está em fase de lançamento?", "next_action": "ask_question"}
+        return BRANDING_STAGE_ASK
     if "crescimento" in objective and not memory.get("canal_principal"):
-        return {"category": "canal_principal", "question": "Hoje vocês já publicam com frequência?", "next_action": "ask_question"}
+        return BRANDING_PUBLISHING_ASK
     if ("identidade" in focus or "construcao" in focus or "construção" in focus) and not memory.get("estagio_marca"):
-        return {"category": "estagio_marca", "question": "Hoje essa marca já tem nome, identidade visual e redes ativas ou ainda está sendo estruturada do zero?", "next_action": "ask_question"}
+        return BRANDING_IDENTITY_STAGE_ASK
     if not memory.get("produto_servico"):
-        return {"category": "produto_servico", "question": "O que essa marca vende ou quer apresentar melhor: produtos, serviços ou uma nova oferta?", "next_action": "ask_question"}
+        return BRANDING_PRODUCT_ASK
     if not memory.get("canal_principal"):
-        return {"category": "canal_principal", "question": "Hoje o principal canal de comunicação é Instagram, WhatsApp, site ou outro ponto de contato?", "next_action": "ask_question"}
+        return BRANDING_CHANNEL_ASK
     if not memory.get("dificuldade_atual"):
-        return {"category": "dificuldade_atual", "question": "Você quer começar mais pela construção da marca, pela organização do conteúdo ou por uma estratégia para gerar demanda?", "next_action": "ask_question"}
+        return BRANDING_DIFFICULTY_ASK
     if not memory.get("orcamento"):
-        return {"category": "budget_signal", "question": "Vocês já têm uma faixa de investimento pensada para essa frente de marca e comunicação?", "next_action": "ask_question"}
-    return {"category": "offer_meeting", "question": "Já tenho uma leitura consistente da marca. Posso encaminhar para a Julia avaliar o próximo movimento?", "next_action": "offer_meeting"}
+        return BRANDING_BUDGET_ASK
+    return BRANDING_MEETING_ASK
 
 
 def get_next_question(state: Dict[str, Any]) -> Dict[str, Any]:
     state = flatten_state(state)
     service = state.get("service_interest") or state.get("selected_service") or ""
-    offer = {
-        "category": "offer_meeting",
-        "question": "Perfeito, já tenho um bom contexto. Posso encaminhar um resumo para a Julia e agilizar o próximo passo?",
-        "next_action": "offer_meeting",
-    }
     if state.get("handoff") or service == "humano":
-        return {"category": "handoff", "question": "Perfeito. Já tenho contexto suficiente para direcionar você da melhor forma.", "next_action": "handoff"}
+        return HANDOFF_ASK
     if should_handoff_now(state, []):
-        return {"category": "handoff", "question": "Perfeito. Já tenho contexto suficiente para direcionar você da melhor forma.", "next_action": "handoff"}
+        return HANDOFF_ASK
     if service == "site":
         return _progressive_site_question(state)
     if service == "automacao_whatsapp":
         if not state.get("lead_source"):
-            return {"category": "lead_source", "question": "Por qual canal você mais recebe oportunidades comerciais hoje?", "next_action": "ask_question"}
+            return LEAD_SOURCE_ASK
         if not (state.get("current_tools") or state.get("current_problem")):
-            return {"category": "current_tools", "question": "O atendimento hoje depende muito de resposta manual ou já tem algum fluxo automatizado?", "next_action": "ask_question"}
+            return CURRENT_TOOLS_ASK
         return _progressive_automation_question(state)
     if service == "inteligencia_artificial":
         return _progressive_ai_question(state)
@@ -1718,15 +2006,11 @@ def get_next_question(state: Dict[str, Any]) -> Dict[str, Any]:
         return _progressive_traffic_question(state)
     if service == "branding":
         return _progressive_branding_question(state)
-    return {
-        "category": "service_interest",
-        "question": "Vou seguir por uma leitura mais ampla para não te prender em pergunta solta. Hoje você busca mais clareza estratégica, melhoria de comunicação ou automação do atendimento?",
-        "next_action": "ask_question",
-    }
+    return SERVICE_INTEREST_ASK
 
 
-def question_category(text: str) -> str:
-    norm = normalize_text(text)
+@lru_cache(maxsize=1024)
+def _question_category_norm(norm: str) -> str:
     if (
         "prioridade e pagina" in norm
         or ("pagina" in norm and "whatsapp" in norm and "marca" in norm)
@@ -1783,6 +2067,32 @@ def question_category(text: str) -> str:
     return ""
 
 
+def question_category(text: str) -> str:
+    norm = normalize_text(text)
+    category = QUESTION_CATEGORIES.get(norm)
+    if category is not None:
+        return category
+    return _question_category_norm(norm)
+
+
+# só isto: categoria pré-calculada das perguntas fixas do backend (BACKEND_QUESTIONS e
+# SERVICE_CHOICES), que ficam fora do LRU de _question_category_norm; texto do LLM continua passando por ele
+QUESTION_CATEGORIES: Dict[str, str] = {}
+
+
+def _backend_questions() -> List[str]:
+    found: List[str] = [choice[3] for choice in SERVICE_CHOICES.values()]
+    found.extend(entry["question"] for entry in BACKEND_QUESTIONS)
+    return found
+
+
+def _build_question_catalogue() -> None:
+    for question in _backend_questions():
+        norm = normalize_text(question)
+        if norm and norm not in QUESTION_CATEGORIES:
+            QUESTION_CATEGORIES[norm] = _question_category_norm(norm)
+
+
 def is_forbidden_generic_reply(reply: str, state: Dict[str, Any] | None = None) -> bool:
     current = flatten_state(state or {})
     if not current.get("service_interest"):
@@ -1802,13 +2112,31 @@ def is_forbidden_generic_question(reply: str, state: Dict[str, Any] | None = Non
 
 
 def is_duplicate_question(reply: str, last_question: str) -> bool:
-    a = normalize_text(reply)
-    b = normalize_text(last_question)
+    return _is_duplicate_norm(normalize_text(reply), normalize_text(last_question))
+
+
+DUPLICATE_QUESTION_RATIO = 0.86
+
+
+@lru_cache(maxsize=2048)
+def _question_fingerprint(norm: str) -> Counter:
+    return Counter(norm)
+
+
+def _is_duplicate_norm(a: str, b: str) -> bool:
     if not a or not b:
         return False
     if a == b or a in b or b in a:
         return True
-    return SequenceMatcher(None, a, b).ratio() >= 0.86
+    total = len(a) + len(b)
+    # limites superiores exatos do ratio (tamanho e multiconjunto de caracteres, como quick_ratio);
+    # o SequenceMatcher só roda quando os dois passam
+    if 2.0 * min(len(a), len(b)) / total < DUPLICATE_QUESTION_RATIO:
+        return False
+    shared = sum((_question_fingerprint(a) & _question_fingerprint(b)).values())
+    if 2.0 * shared / total < DUPLICATE_QUESTION_RATIO:
+        return False
+    return SequenceMatcher(None, a, b).ratio() >= DUPLICATE_QUESTION_RATIO
 
 
 def _category_answered(state: Dict[str, Any], category: str) -> bool:
@@ -1855,17 +2183,16 @@ def _non_repeating_recovery_question(state: Dict[str, Any]) -> Dict[str, Any]:
     last_category = state.get("last_question_category") or question_category(state.get("last_question_asked") or "")
     if service == "site":
         if last_category == "site_scope" and not state.get("current_problem"):
-            return {"category": "current_problem", "question": "Me conta em uma frase o que mais precisa melhorar no site hoje?", "next_action": "ask_question"}
+            return SITE_PROBLEM_SHORT_ASK
         if not state.get("current_problem"):
-            return {"category": "current_problem", "question": SITE_PROBLEM_QUESTION, "next_action": "ask_question"}
+            return SITE_PROBLEM_ASK
     if service == "branding":
         return _progressive_branding_question(state)
-    return {"category": "current_problem", "question": "Qual gargalo comercial está mais claro para você hoje?", "next_action": "ask_question"}
+    return COMMERCIAL_GAP_ASK
 
 
-def _matches_recent_question(reply: str, state: Dict[str, Any]) -> bool:
-    recent = flatten_state(state).get("recent_bot_questions") or []
-    return any(is_duplicate_question(reply, question) for question in recent[-3:])
+def _matches_recent_question(reply_norm: str, turn: Dict[str, Any]) -> bool:
+    return any(_is_duplicate_norm(reply_norm, question) for question in turn["recent_questions_norm"][-3:])
 
 
 ONE_TIME_QUESTIONS = [
@@ -1876,21 +2203,25 @@ ONE_TIME_QUESTIONS = [
 ]
 
 
-def _is_one_time_question_repeated(reply: str, state: Dict[str, Any]) -> bool:
-    norm = normalize_text(reply)
-    if not any(item in norm for item in ONE_TIME_QUESTIONS):
+def _is_one_time_question_repeated(reply_norm: str, turn: Dict[str, Any]) -> bool:
+    if not any(item in reply_norm for item in ONE_TIME_QUESTIONS):
         return False
-    recent = flatten_state(state).get("recent_bot_questions") or []
-    return any(any(item in normalize_text(question) for item in ONE_TIME_QUESTIONS) for question in recent)
+    return any(any(item in question for item in ONE_TIME_QUESTIONS) for question in turn["recent_questions_norm"])
 
 
 def validate_reply(reply: str, state: Dict[str, Any]) -> Dict[str, Any]:
     state = flatten_state(state)
+    turn = analyze_turn(reply, state)
+    reply_norm = turn["norm"]
     next_q = get_next_question(state)
-    category = question_category(reply)
+    category = _question_category_norm(reply_norm)
     blocked = False
     reason = ""
-    if is_duplicate_question(reply, state.get("last_question_asked") or "") or _matches_recent_question(reply, state) or _is_one_time_question_repeated(reply, state):
+    if (
+        _is_duplicate_norm(reply_norm, turn["last_question_norm"])
+        or _matches_recent_question(reply_norm, turn)
+        or _is_one_time_question_repeated(reply_norm, turn)
+    ):
         blocked = True
         reason = "duplicate_last_question"
     elif is_forbidden_generic_reply(reply, state):
@@ -1904,17 +2235,11 @@ def validate_reply(reply: str, state: Dict[str, Any]) -> Dict[str, Any]:
         reason = "known_service_interest"
     if blocked:
         if should_handoff_now(state, []):
-            return {
-                "category": "handoff",
-                "question": "Perfeito. Já tenho contexto suficiente para direcionar você da melhor forma.",
-                "reply": "Perfeito. Já tenho contexto suficiente para direcionar você da melhor forma.",
-                "next_action": "handoff",
-                "blocked": True,
-                "reason": reason,
-            }
+            return {**HANDOFF_ASK, "reply": HANDOFF_ASK["question"], "blocked": True, "reason": reason}
         if reason == "forbidden_generic_reply" and state.get("service_interest") == "site":
             next_q = _non_repeating_recovery_question(state)
-        if is_duplicate_question(next_q.get("question") or "", state.get("last_question_asked") or "") or _matches_recent_question(next_q.get("question") or "", state):
+        next_norm = normalize_text(next_q.get("question") or "")
+        if _is_duplicate_norm(next_norm, turn["last_question_norm"]) or _matches_recent_question(next_norm, turn):
             next_q = _non_repeating_recovery_question(state)
         return {**next_q, "reply": next_q["question"], "blocked": True, "reason": reason}
     return {**next_q, "reply": reply, "blocked": False, "reason": ""}
@@ -2161,9 +2486,9 @@ def has_core_context_for_handoff(state: Dict[str, Any]) -> bool:
 def should_handoff_now(conversation_memory: Dict[str, Any] | None, messages: list | None = None) -> bool:
     state = flatten_state(conversation_memory or {})
     inbound_texts = _message_texts(messages, direction="in") or _message_texts(messages)
-    joined = normalize_text(" | ".join(inbound_texts))
+    joined = _history_terms(state, inbound_texts)
 
-    if bool(state.get("handoff")) or _has_any(joined, ["humano", "atendente", "falar com alguem", "falar com alguém", "falar com a equipe", "julia", "pessoa"]):
+    if bool(state.get("handoff")) or _terms_any(joined, HISTORY_TERMS["human"]):
         return True
 
     if int(state.get("question_count") or 0) >= 4:
@@ -2174,25 +2499,25 @@ def should_handoff_now(conversation_memory: Dict[str, Any] | None, messages: lis
 
     solution = state.get("solution")
     service = state.get("primary_track") or state.get("service_interest") or state.get("intent")
-    if not service and _has_any(joined, ["chatbot", "chat bot", "inteligencia artificial", "inteligência artificial", "agente de ia"]):
+    if not service and _terms_any(joined, HISTORY_TERMS["ai"]):
         service = "ia_no_negocio"
 
     objective = state.get("objective") or state.get("desired_result") or state.get("main_goal")
-    if not objective and _has_any(joined, ["vendas", "vender", "vender mais", "mais vendas", "gerar leads"]):
+    if not objective and _terms_any(joined, HISTORY_TERMS["sales_goal"]):
         objective = "vender mais"
 
     pain = state.get("pain") or state.get("current_problem")
     if normalize_text(pain) in {"atendimento", "vendas", "processo manual"} and not solution:
         pain = ""
-    if not pain and _has_any(joined, ["falta de automacao", "falta da automacao", "sem automacao", "sem automação", "manual", "demora", "perda de leads"]):
+    if not pain and _terms_any(joined, HISTORY_TERMS["manual_pain"]):
         pain = "falta de automação no atendimento"
 
     process = state.get("process") or state.get("lead_source") or state.get("current_tools")
-    if not process and _has_any(joined, ["atendimento", "whatsapp", "vendas", "comercial", "chatbot"]):
+    if not process and _terms_any(joined, HISTORY_TERMS["process"]):
         process = "atendimento/vendas"
 
     urgency = state.get("urgency")
-    if not urgency and _has_any(joined, ["urgente", "para ontem", "pra ontem", "o quanto antes", "ate dia", "até dia"]):
+    if not urgency and _terms_any(joined, HISTORY_TERMS["urgency"]):
         urgency = "alta"
 
     score = sum(bool(item) for item in [service, objective, pain, process, urgency])
@@ -2226,15 +2551,17 @@ def has_enough_briefing_for_handoff(state: Dict[str, Any]) -> bool:
         return True
     service = state.get("service_interest")
     if not service or not state.get("main_goal"):
-        print(f"BRIEFING_COMPLETENESS_CHECK service={service or '-'} enough=false reason=missing_service_or_goal")
+        log.debug("BRIEFING_COMPLETENESS_CHECK", service=service or "-", enough="false", reason="missing_service_or_goal")
         return False
     has_context = bool(state.get("current_problem") or state.get("current_status") or state.get("current_tools") or state.get("site_scope"))
     has_decision_signal = bool(state.get("urgency") or state.get("budget_signal") or state.get("handoff_reason") == "lead_perguntou_se_conseguimos")
     enough = bool(has_context and has_decision_signal)
-    print(
-        "BRIEFING_COMPLETENESS_CHECK "
-        f"service={service} enough={str(enough).lower()} has_context={str(has_context).lower()} "
-        f"has_decision_signal={str(has_decision_signal).lower()}"
+    log.debug(
+        "BRIEFING_COMPLETENESS_CHECK",
+        service=service,
+        enough=str(enough).lower(),
+        has_context=str(has_context).lower(),
+        has_decision_signal=str(has_decision_signal).lower(),
     )
     return enough
 
@@ -2250,9 +2577,62 @@ def _service_label(value: Any) -> str:
     return SERVICE_LABELS.get(raw, raw.replace("_", " "))
 
 
-def _contains_any_text(texts: List[str], needles: List[str]) -> bool:
-    joined = normalize_text(" | ".join(texts))
-    return any(needle in joined for needle in needles)
+# vocabulários consultados sobre os termos já varridos do histórico (_history_terms); registrados
+# explicitamente no import porque a varredura só emite termos que já estão no autômato
+HISTORY_TERMS: Dict[str, List[str]] = {
+    "human": ["humano", "atendente", "falar com alguem", "falar com alguém", "falar com a equipe", "julia", "pessoa"],
+    "ai": ["chatbot", "chat bot", "inteligencia artificial", "inteligência artificial", "agente de ia"],
+    "chatbot": ["chatbot", "chat bot", "agente de ia"],
+    "sales_goal": ["vendas", "vender", "vender mais", "mais vendas", "gerar leads"],
+    "sell_more": ["vendas", "vender", "vender mais", "mais vendas"],
+    "manual_pain": ["falta de automacao", "falta da automacao", "sem automacao", "sem automação", "manual", "demora", "perda de leads"],
+    "missing_automation": ["falta de automacao", "falta da automacao", "sem automacao", "sem automação", "manual"],
+    "process": ["atendimento", "whatsapp", "vendas", "comercial", "chatbot"],
+    "urgency": ["urgente", "para ontem", "pra ontem", "o quanto antes", "ate dia", "até dia"],
+    "high_urgency": ["para ontem", "urgente", "o quanto antes", "ate dia", "até dia"],
+    "all_fronts": ["tudo", "todas as frentes", "todas as frente", "me ajudem", "me ajuda"],
+}
+RELATED_NEED_TERMS: Dict[str, List[str]] = {
+    "automacao_whatsapp": ["whatsapp", "whats", "zap", "atendimento", "crm", "lead"],
+    "site": ["site", "landing", "pagina", "ecommerce", "loja virtual"],
+    "trafego_pago": ["campanha", "trafego", "tráfego", "anuncio", "anúncio", "ads", "performance"],
+    "branding": ["comunicacao", "comunicação", "posicionamento", "marca", "conteudo", "conteúdo", "instagram"],
+    "inteligencia_artificial": [" ia ", "inteligencia artificial", "inteligência artificial", "chatbot", "automacao"],
+}
+
+
+def _accumulator_covers(accumulated: Dict[str, Any], inbound_texts: List[str]) -> bool:
+    # o acumulador só substitui a varredura se terminou nesta janela (a mais recente pode ainda não ter sido
+    # dobrada) e dobrou pelo menos tantas mensagens quanto ela tem; estado antigo ou janela maior => varre
+    if not isinstance(accumulated.get("terms"), list):
+        return False
+    norms = [normalize_text(text) for text in inbound_texts]
+    distinct = [norm for index, norm in enumerate(norms) if norm and (index == 0 or norm != norms[index - 1])]
+    if not distinct:
+        return False
+    last_norm = accumulated.get("last_norm")
+    if last_norm == distinct[-1]:
+        pending = 0
+    elif len(distinct) > 1 and last_norm == distinct[-2]:
+        pending = 1
+    else:
+        return False
+    return int(accumulated.get("message_count") or 0) >= len(distinct) - pending
+
+
+def _history_terms(state: Dict[str, Any], inbound_texts: List[str]) -> FrozenSet[str]:
+    # chamadas só com a mensagem atual continuam olhando só para ela
+    accumulated = state.get("conversation_facts") or {}
+    if len(inbound_texts) > 1 and isinstance(accumulated, dict) and _accumulator_covers(accumulated, inbound_texts):
+        latest = keyword_matcher.scan(normalize_text(inbound_texts[-1]))
+        return frozenset(accumulated["terms"]) | latest
+    return keyword_matcher.scan(normalize_text(" | ".join(inbound_texts)))
+
+
+def _terms_any(found: FrozenSet[str], terms: List[str]) -> bool:
+    # as listas de HISTORY_TERMS/RELATED_NEED_TERMS entram no autômato no import (sem depender da AST);
+    # register() garante uma lista nova a partir da próxima varredura
+    return not keyword_matcher.register(terms).isdisjoint(found)
 
 
 def _safe_analysis_text(value: Any) -> str:
@@ -2262,7 +2642,7 @@ def _safe_analysis_text(value: Any) -> str:
         return ""
     if norm in {"outro", "humano", "indefinido"}:
         return ""
-    if norm in RAW_LOW_SIGNAL_PHRASES or any(phrase in norm for phrase in RAW_LOW_SIGNAL_PHRASES):
+    if norm in RAW_LOW_SIGNAL_PHRASES or _has_any(norm, RAW_LOW_SIGNAL_PHRASES):
         return ""
     return text
 
@@ -2287,17 +2667,10 @@ def _infer_related_needs(state: Dict[str, Any], messages: list | None) -> List[s
     state = flatten_state(state)
     inbound = _message_texts(messages, direction="in") or _message_texts(messages)
     related: List[str] = []
-    joined = normalize_text(" | ".join(inbound))
-    checks = [
-        ("automacao_whatsapp", ["whatsapp", "whats", "zap", "atendimento", "crm", "lead"]),
-        ("site", ["site", "landing", "pagina", "ecommerce", "loja virtual"]),
-        ("trafego_pago", ["campanha", "trafego", "tráfego", "anuncio", "anúncio", "ads", "performance"]),
-        ("branding", ["comunicacao", "comunicação", "posicionamento", "marca", "conteudo", "conteúdo", "instagram"]),
-        ("inteligencia_artificial", [" ia ", "inteligencia artificial", "inteligência artificial", "chatbot", "automacao"]),
-    ]
+    joined = _history_terms(state, inbound)
     primary = state.get("primary_track") or state.get("service_interest") or state.get("intent")
-    for service, needles in checks:
-        if service != primary and any(needle in joined for needle in needles):
+    for service, needles in RELATED_NEED_TERMS.items():
+        if service != primary and _terms_any(joined, needles):
             related.append(service)
     existing = state.get("related_needs")
     if isinstance(existing, list):
@@ -2314,14 +2687,14 @@ def build_internal_briefing(conversation_memory: Dict[str, Any] | None, messages
     objective = state.get("objective")
     pain = state.get("pain")
     process = state.get("process")
-    joined = normalize_text(" | ".join(inbound_texts))
-    if solution == "chatbot com IA" or _has_any(joined, ["chatbot", "chat bot", "agente de ia"]):
+    joined = _history_terms(state, inbound_texts)
+    if solution == "chatbot com IA" or _terms_any(joined, HISTORY_TERMS["chatbot"]):
         primary_track = "ia_no_negocio"
         solution = solution or "chatbot com IA"
         process = process or "atendimento/vendas"
-        if not objective and _has_any(joined, ["vendas", "vender", "vender mais", "mais vendas"]):
+        if not objective and _terms_any(joined, HISTORY_TERMS["sell_more"]):
             objective = "vender mais"
-        if not pain and _has_any(joined, ["falta de automacao", "falta da automacao", "sem automacao", "sem automação", "manual"]):
+        if not pain and _terms_any(joined, HISTORY_TERMS["missing_automation"]):
             pain = "falta de automação no atendimento"
     if normalize_text(primary_track) in {"outro", "humano"}:
         primary_track = "ia_no_negocio" if solution == "chatbot com IA" else ""
@@ -2333,8 +2706,8 @@ def build_internal_briefing(conversation_memory: Dict[str, Any] | None, messages
     tools = process or state.get("current_tools")
     urgency = state.get("urgency")
     budget = state.get("budget_signal")
-    asks_for_all = _contains_any_text(inbound_texts, ["tudo", "todas as frentes", "todas as frente", "me ajudem", "me ajuda"])
-    high_urgency = urgency == "alta" or _contains_any_text(inbound_texts, ["para ontem", "urgente", "o quanto antes", "ate dia", "até dia"])
+    asks_for_all = _terms_any(joined, HISTORY_TERMS["all_fronts"])
+    high_urgency = urgency == "alta" or _terms_any(joined, HISTORY_TERMS["high_urgency"])
     multi_front = bool(len(related_needs) >= 2 or asks_for_all)
 
     if asks_for_all and not problem:
@@ -2456,3 +2829,17 @@ def build_internal_briefing(conversation_memory: Dict[str, Any] | None, messages
 
 def build_briefing(state: Dict[str, Any], recent_messages: list) -> Dict[str, Any]:
     return build_internal_briefing(state, recent_messages)
+
+
+keyword_matcher.register_many(
+    [
+        RAW_LOW_SIGNAL_PHRASES,
+        *MENU_TEXT_PATTERNS.values(),
+        *HISTORY_TERMS.values(),
+        *RELATED_NEED_TERMS.values(),
+        *_inline_vocabularies(),
+    ]
+)
+_build_question_catalogue()
+# a AST só serve para os registros de import; não fica em memória
+_module_tree.cache_clear()
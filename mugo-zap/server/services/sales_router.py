@@ -0,0 +1,126 @@
+import os
+import threading
+from typing import Any, Dict, Optional
+
+SALES_FAST_PATH_ENABLED = (os.getenv("SALES_FAST_PATH_ENABLED") or "1").strip().lower() in {"1", "true", "yes", "on"}
+SALES_FAST_PATH_MAX_CHARS = int((os.getenv("SALES_FAST_PATH_MAX_CHARS") or "160").strip() or 160)
+
+# perguntas de múltipla escolha aceitam confiança menor; perguntas abertas quase sempre vão para o modelo
+DEFAULT_THRESHOLDS: Dict[str, float] = {
+    "site_scope": 0.72,
+    "main_goal": 0.72,
+    "current_problem": 0.72,
+    "lead_source": 0.72,
+    "urgency": 0.72,
+    "budget_signal": 0.72,
+    "estagio_marca": 0.75,
+    "volume": 0.75,
+    "volume_tarefa": 0.75,
+    "tempo_resposta": 0.75,
+    "problema_performance": 0.75,
+    "service_interest": 0.85,
+    "produto_servico": 0.9,
+    "publico": 0.9,
+    "oferta": 0.9,
+    "dificuldade_atual": 0.9,
+    "gargalo": 0.9,
+    "default": 0.9,
+}
+
+ROUTE_FAST = "fast"
+ROUTE_LLM = "llm"
+ROUTE_CACHE = "cache"
+
+_LOCK = threading.Lock()
+_STATS: Dict[str, Dict[str, Any]] = {}
+
+
+def _parse_thresholds(raw: str) -> Dict[str, float]:
+    # SALES_FAST_PATH_THRESHOLDS="site_scope=0.8,urgency=0.7,default=0.95"
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    for item in (raw or "").split(","):
+        key, _, value = item.partition("=")
+        key = key.strip()
+        if not key or not value.strip():
+            continue
+        try:
+            thresholds[key] = float(value)
+        except ValueError:
+            print(f"SALES_ROUTER:invalid_threshold item={item!r}")
+    return thresholds
+
+
+THRESHOLDS = _parse_thresholds((os.getenv("SALES_FAST_PATH_THRESHOLDS") or "").strip())
+
+
+def threshold_for(category: str) -> float:
+    return THRESHOLDS.get(category or "", THRESHOLDS["default"])
+
+
+def decide_route(
+    *,
+    user_text: str,
+    category: str,
+    interpretation: Optional[Dict[str, Any]],
+    extracted_signals: Optional[Dict[str, Any]],
+    deterministic_reply: str,
+    state_after: Optional[Dict[str, Any]],
+) -> Dict[str, Any]:
+    interpretation = interpretation or {}
+    confidence = float(interpretation.get("confidence") or 0.0)
+    threshold = threshold_for(category)
+    decision = {"route": ROUTE_LLM, "reason": "", "category": category or "-", "confidence": confidence, "threshold": threshold}
+
+    text = (user_text or "").strip()
+    if not SALES_FAST_PATH_ENABLED:
+        decision["reason"] = "disabled"
+    elif (state_after or {}).get("handoff"):
+        # a resposta de handoff é sempre o template; o modelo não mudaria o texto
+        decision.update({"route": ROUTE_FAST, "reason": "handoff_template"})
+    elif not (deterministic_reply or "").strip():
+        decision["reason"] = "no_deterministic_reply"
+    elif "?" in text:
+        decision["reason"] = "lead_question"
+    elif len(text) > SALES_FAST_PATH_MAX_CHARS:
+        decision["reason"] = "long_message"
+    elif not category:
+        decision["reason"] = "no_open_question"
+    elif not extracted_signals or not interpretation.get("stage_answered"):
+        decision["reason"] = "stage_not_answered"
+    elif confidence < threshold:
+        decision["reason"] = "below_threshold"
+    else:
+        decision.update({"route": ROUTE_FAST, "reason": "confident"})
+    return decision
+
+
+def record_route(decision: Dict[str, Any], elapsed_ms: float) -> None:
+    route = decision.get("route") or ROUTE_LLM
+    with _LOCK:
+        stats = _STATS.get(route)
+        if stats is None:
+            stats = _STATS[route] = {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "reasons": {}}
+        stats["count"] += 1
+        stats["total_ms"] += elapsed_ms
+        stats["max_ms"] = max(stats["max_ms"], elapsed_ms)
+        reason = decision.get("reason") or "-"
+        stats["reasons"][reason] = stats["reasons"].get(reason, 0) + 1
+
+
+def route_stats() -> Dict[str, Any]:
+    with _LOCK:
+        total = sum(stats["count"] for stats in _STATS.values())
+        return {
+            "enabled": SALES_FAST_PATH_ENABLED,
+            "thresholds": dict(THRESHOLDS),
+            "fast_share": round(_STATS.get(ROUTE_FAST, {}).get("count", 0) / total, 4) if total else 0.0,
+            "routes": {
+                route: {
+                    "count": stats["count"],
+                    "avg_ms": int(stats["total_ms"] / stats["count"]) if stats["count"] else 0,
+                    "max_ms": int(stats["max_ms"]),
+                    "reasons": dict(stats["reasons"]),
+                }
+                for route, stats in _STATS.items()
+            },
+        }
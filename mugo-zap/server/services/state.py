@@ -1,10 +1,17 @@
 import os
 import json
 import re
-from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional
+import time
+import threading
+import urllib.parse
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
 
 import httpx
+from services import dashboard, message_archive
+from services.coalesce import coalesced_get, forget_results
+from services import log
+from services.tracing import traced
 from services.workspace import DEFAULT_WORKSPACE_ID, resolve_workspace_id
 
 SUPABASE_URL = (os.getenv("SUPABASE_URL") or "").strip().rstrip("/")
@@ -36,9 +43,19 @@ FLOW_TABLE = (
     or "whatsapp_flow_state"
 ).strip()
 
+CONVERSATION_SNAPSHOT_TTL_SECONDS = float((os.getenv("CONVERSATION_SNAPSHOT_TTL_SECONDS") or "5").strip() or 5)
+CONVERSATION_SNAPSHOT_LIMIT = int((os.getenv("CONVERSATION_SNAPSHOT_LIMIT") or "500").strip() or 500)
+
 _TIMEOUT = httpx.Timeout(connect=6.0, read=12.0, write=12.0, pool=12.0)
 _CLIENT = httpx.Client(timeout=_TIMEOUT, headers={"Content-Type": "application/json"})
 
+_SNAPSHOTS: Dict[str, Dict[str, Any]] = {}
+_SNAPSHOT_VERSIONS: Dict[str, int] = {}
+_SNAPSHOT_LOCKS: Dict[str, threading.Lock] = {}
+_SNAPSHOT_LOCKS_GUARD = threading.Lock()
+# troca/descarte de snapshot e contador de versão andam juntos (rebuild, patch e invalidação)
+_SNAPSHOT_STORE_LOCK = threading.Lock()
+
 
 def _now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
@@ -121,10 +138,11 @@ def _normalize_tags(v: Any) -> List[str]:
 
 
 def _get(url: str) -> httpx.Response:
-    return _CLIENT.get(url, headers=_headers())
+    return coalesced_get(_CLIENT, url, _headers())
 
 
 def _post(url: str, payload: dict, prefer: str = "return=representation") -> httpx.Response:
+    forget_results(url)
     return _CLIENT.post(
         url,
         headers=_headers({"Prefer": prefer}),
@@ -133,6 +151,7 @@ def _post(url: str, payload: dict, prefer: str = "return=representation") -> htt
 
 
 def _patch(url: str, payload: dict, prefer: str = "return=representation") -> httpx.Response:
+    forget_results(url)
     return _CLIENT.patch(
         url,
         headers=_headers({"Prefer": prefer}),
@@ -284,9 +303,9 @@ def sync_conversation_row(
         if resp.status_code not in (200, 201):
             legacy_payload = {k: v for k, v in payload.items() if k != "workspace_id"}
             _post(legacy_url, legacy_payload, prefer="resolution=merge-duplicates,return=minimal")
-        print("CONVERSATION_SYNC_OK:", wa_id)
+        log.debug("CONVERSATION_SYNC_OK", wa_id=wa_id)
     except Exception as e:
-        print("CONVERSATION_SYNC_ERROR:", wa_id, str(e))
+        log.error("CONVERSATION_SYNC_ERROR", wa_id=wa_id, error=str(e))
 
 
 def _mirror_conversation_payload(payload: Dict[str, Any]) -> None:
@@ -353,6 +372,7 @@ def _build_message_only_conversation(
     }
 
 
+@traced("user_upsert")
 def upsert_user(wa_id: str, name: str = "", telefone: str = "", workspace_id: str = "", **extra) -> Dict[str, Any]:
     wa_id = normalize_wa_id(wa_id)
     telefone = normalize_wa_id(telefone)
@@ -469,9 +489,11 @@ def upsert_user(wa_id: str, name: str = "", telefone: str = "", workspace_id: st
             r = _post(legacy_url, legacy_payload, prefer="resolution=merge-duplicates,return=representation")
         if r.status_code in (200, 201):
             rows = r.json() or []
+            patch_conversation_snapshot(workspace_id, (rows[0] or {}) if rows else payload)
             if rows:
                 row = rows[0] or {}
                 row["tags"] = _normalize_tags(row.get("tags"))
+                dashboard.observe_conversation(workspace_id, row, is_new=is_new_panel_conversation)
                 sync_conversation_row(
                     wa_id=wa_id,
                     text=row.get("last_text") or "",
@@ -615,6 +637,7 @@ def update_lead_intelligence(wa_id: str, score: int, temperature: str, theme: st
             r = _patch(legacy_url, payload, prefer="return=representation")
         if r.status_code in (200, 201):
             rows = r.json() or []
+            patch_conversation_snapshot(workspace_id, (rows[0] or {}) if rows else {**payload, "wa_id": wa_id})
             item = (rows[0] if rows else payload)
             if isinstance(item, dict):
                 item["tags"] = _normalize_tags(item.get("tags"))
@@ -626,6 +649,7 @@ def update_lead_intelligence(wa_id: str, score: int, temperature: str, theme: st
         return {"ok": False, "error": str(e)}
 
 
+@traced("log_message")
 def log_message(
     wa_id: str,
     direction: str,
@@ -661,6 +685,8 @@ def log_message(
         if _looks_like_missing_workspace(r.status_code, r.text):
             r = _post(url, legacy_payload, prefer="return=representation")
         ok = r.status_code in (200, 201)
+        if ok and direction in {"in", "out"}:
+            dashboard.record_event(workspace_id, f"messages_{direction}")
 
         user_patch: Dict[str, Any] = {
             "last_text": text,
@@ -707,7 +733,29 @@ def log_message(
         return {"ok": False, "error": str(e)}
 
 
-def get_recent_messages(wa_id: str, limit: int = 40, workspace_id: str = "") -> List[Dict[str, Any]]:
+def _message_dedupe_key(row: Dict[str, Any]) -> str:
+    meta = row.get("meta") if isinstance(row.get("meta"), dict) else {}
+    return (
+        str(row.get("id") or "").strip()
+        or str(meta.get("message_id") or "").strip()
+        or f"{row.get('wa_id') or ''}:{row.get('direction') or ''}:{row.get('created_at') or ''}:{row.get('text') or ''}"
+    )
+
+
+def _with_archive(rows: List[Dict[str, Any]], wa_id: str, limit: int, before: str, workspace_id: str) -> List[Dict[str, Any]]:
+    if len(rows) >= limit or not message_archive.has_archived_messages(workspace_id, wa_id):
+        return rows[-limit:]
+
+    oldest = str(rows[0].get("created_at") or "") if rows else before
+    archived = message_archive.read_archived_messages(workspace_id, wa_id, before=oldest, limit=limit - len(rows))
+    known = {_message_dedupe_key(row) for row in rows}
+    merged = [row for row in archived if _message_dedupe_key(row) not in known] + rows
+    print(f"MESSAGES_ARCHIVE_FALLBACK wa_id={wa_id} workspace_id={workspace_id} hot={len(rows)} archived={len(merged) - len(rows)}")
+    return merged[-limit:]
+
+
+@traced("history_load")
+def get_recent_messages(wa_id: str, limit: int = 40, workspace_id: str = "", before: str = "") -> List[Dict[str, Any]]:
     wa_id = normalize_wa_id(wa_id)
     workspace_id = _resolve_workspace_id(workspace_id)
     if not wa_id:
@@ -715,7 +763,9 @@ def get_recent_messages(wa_id: str, limit: int = 40, workspace_id: str = "") ->
 
     limit = max(1, min(int(limit or 40), 100))
     fetch_limit = min(200, max(limit * 3, 60))
+    before = (before or "").strip()
     select_fields = "id,workspace_id,wa_id,direction,text,created_at,meta"
+    before_filter = f"&created_at=lt.{urllib.parse.quote(before)}" if before else ""
     rows_by_key: Dict[str, Dict[str, Any]] = {}
 
     try:
@@ -723,6 +773,7 @@ def get_recent_messages(wa_id: str, limit: int = 40, workspace_id: str = "") ->
             f"{SUPABASE_URL}/rest/v1/{MESSAGES_TABLE}"
             f"?workspace_id=eq.{workspace_id}"
             f"&wa_id=eq.{wa_id}"
+            f"{before_filter}"
             f"&select={select_fields}"
             f"&order=created_at.desc"
             f"&limit={fetch_limit}"
@@ -732,6 +783,7 @@ def get_recent_messages(wa_id: str, limit: int = 40, workspace_id: str = "") ->
             legacy_url = (
                 f"{SUPABASE_URL}/rest/v1/{MESSAGES_TABLE}"
                 f"?wa_id=eq.{wa_id}"
+                f"{before_filter}"
                 f"&select={select_fields}"
                 f"&order=created_at.desc"
                 f"&limit={fetch_limit}"
@@ -745,25 +797,22 @@ def get_recent_messages(wa_id: str, limit: int = 40, workspace_id: str = "") ->
                         str(row.get("id") or ""),
                     )
                 )
-                return rows[-limit:]
+                return _with_archive(rows, wa_id, limit, before, workspace_id)
 
         if r.status_code == 200:
             for row in (r.json() or []):
                 meta = _safe_json(row.get("meta"), {})
-                dedupe_key = (
-                    str(row.get("id") or "").strip()
-                    or str(meta.get("message_id") or "").strip()
-                    or f"{row.get('wa_id') or ''}:{row.get('direction') or ''}:{row.get('created_at') or ''}:{row.get('text') or ''}"
-                )
-                rows_by_key[dedupe_key] = {
+                row = {
                     **row,
                     "meta": meta if isinstance(meta, dict) else {},
                 }
+                rows_by_key[_message_dedupe_key(row)] = row
 
             legacy_null_url = (
                 f"{SUPABASE_URL}/rest/v1/{MESSAGES_TABLE}"
                 f"?workspace_id=is.null"
                 f"&wa_id=eq.{wa_id}"
+                f"{before_filter}"
                 f"&select={select_fields}"
                 f"&order=created_at.desc"
                 f"&limit={fetch_limit}"
@@ -772,15 +821,11 @@ def get_recent_messages(wa_id: str, limit: int = 40, workspace_id: str = "") ->
             if legacy_null.status_code == 200:
                 for row in (legacy_null.json() or []):
                     meta = _safe_json(row.get("meta"), {})
-                    dedupe_key = (
-                        str(row.get("id") or "").strip()
-                        or str(meta.get("message_id") or "").strip()
-                        or f"{row.get('wa_id') or ''}:{row.get('direction') or ''}:{row.get('created_at') or ''}:{row.get('text') or ''}"
-                    )
-                    rows_by_key[dedupe_key] = {
+                    row = {
                         **row,
                         "meta": meta if isinstance(meta, dict) else {},
                     }
+                    rows_by_key[_message_dedupe_key(row)] = row
 
             rows = list(rows_by_key.values())
             rows.sort(
@@ -790,13 +835,87 @@ def get_recent_messages(wa_id: str, limit: int = 40, workspace_id: str = "") ->
                     str(row.get("id") or ""),
                 )
             )
-            return rows[-limit:]
+            return _with_archive(rows, wa_id, limit, before, workspace_id)
     except Exception:
         pass
 
     return []
 
 
+def archive_old_messages(
+    workspace_id: str = "",
+    older_than_days: Optional[int] = None,
+    batch_size: int = 500,
+    max_batches: int = 20,
+) -> Dict[str, Any]:
+    workspace_id = _resolve_workspace_id(workspace_id)
+    days = max(1, int(older_than_days or message_archive.MESSAGE_HOT_DAYS))
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+    archived = 0
+    deleted = 0
+    errors: List[str] = []
+
+    for _ in range(max(1, int(max_batches))):
+        url = (
+            f"{SUPABASE_URL}/rest/v1/{MESSAGES_TABLE}"
+            f"?workspace_id=eq.{workspace_id}"
+            f"&created_at=lt.{urllib.parse.quote(cutoff)}"
+            f"&select=*&order=created_at.asc&limit={int(batch_size)}"
+        )
+        r = _CLIENT.get(url, headers=_headers())
+        if r.status_code != 200:
+            errors.append(f"fetch {r.status_code}: {r.text[:300]}")
+            break
+        rows = [row for row in (r.json() or []) if row.get("id") is not None]
+        if not rows:
+            break
+
+        for row in rows:
+            row["meta"] = _safe_json(row.get("meta"), {})
+        try:
+            stored = message_archive.archive_rows(workspace_id, rows)
+        except Exception as e:
+            stored = 0
+            errors.append(f"archive {repr(e)[:300]}")
+        # só apaga o que o arquivo compartilhado confirmou; o lote fica quente e volta na próxima rodada
+        if stored != len(rows):
+            if not errors:
+                errors.append(f"archive stored={stored} expected={len(rows)}")
+            break
+        archived += stored
+
+        ids = ",".join(str(row["id"]) for row in rows)
+        forget_results(f"{SUPABASE_URL}/rest/v1/{MESSAGES_TABLE}")
+        d = _CLIENT.delete(
+            f"{SUPABASE_URL}/rest/v1/{MESSAGES_TABLE}?workspace_id=eq.{workspace_id}&id=in.({ids})",
+            headers=_headers({"Prefer": "return=minimal"}),
+        )
+        if d.status_code not in (200, 204):
+            errors.append(f"delete {d.status_code}: {d.text[:300]}")
+            break
+        deleted += len(rows)
+        if len(rows) < int(batch_size):
+            break
+
+    print(f"MESSAGES_ARCHIVE_RUN workspace_id={workspace_id} cutoff={cutoff} archived={archived} deleted={deleted} errors={len(errors)}")
+    return {
+        "workspace_id": workspace_id,
+        "cutoff": cutoff,
+        "archived": archived,
+        "deleted": deleted,
+        "errors": errors,
+    }
+
+
+def _conversation_sort_key(item: Dict[str, Any]) -> tuple:
+    return (
+        item.get("last_message_at") or "",
+        item.get("last_at") or "",
+        item.get("updated_at") or "",
+        item.get("created_at") or "",
+    )
+
+
 def list_conversations(limit: int = 200, workspace_id: str = "") -> List[Dict[str, Any]]:
     limit = int(limit or 200)
     workspace_id = _resolve_workspace_id(workspace_id)
@@ -857,8 +976,8 @@ def list_conversations(limit: int = 200, workspace_id: str = "") -> List[Dict[st
     except Exception:
         conv_rows = []
 
-    print(f"list_conversations:users total={len(users_rows)}")
-    print(f"list_conversations:conversations total={len(conv_rows)}")
+    log.debug("LIST_CONVERSATIONS", part="users", total=len(users_rows))
+    log.debug("LIST_CONVERSATIONS", part="conversations", total=len(conv_rows))
 
     last_by: Dict[str, Dict[str, Any]] = {}
     totals_by: Dict[str, int] = {}
@@ -893,7 +1012,7 @@ def list_conversations(limit: int = 200, workspace_id: str = "") -> List[Dict[st
     except Exception:
         pass
 
-    print(f"list_conversations:messages total={len(last_by)}")
+    log.debug("LIST_CONVERSATIONS", part="messages", total=len(last_by))
 
     try:
         task_url = (
@@ -952,11 +1071,11 @@ def list_conversations(limit: int = 200, workspace_id: str = "") -> List[Dict[st
                 "automation_paused": item["automation_paused"],
                 "bot_enabled": item["bot_enabled"],
             })
-            print("DERIVED_PANEL_CONVERSATION:", json.dumps({"wa_id": wa_id, "workspace_id": workspace_id}, ensure_ascii=False))
+            log.debug("DERIVED_PANEL_CONVERSATION", wa_id=wa_id, workspace_id=workspace_id)
             items.append(item)
 
         items.sort(key=lambda x: x.get("last_message_at") or "", reverse=True)
-        print(f"list_conversations:final total={len(items)}")
+        log.debug("LIST_CONVERSATIONS", part="final", total=len(items))
         return items[:limit]
 
     items: List[Dict[str, Any]] = []
@@ -1076,22 +1195,235 @@ def list_conversations(limit: int = 200, workspace_id: str = "") -> List[Dict[st
             "automation_paused": item["automation_paused"],
             "bot_enabled": item["bot_enabled"],
         })
-        print("DERIVED_PANEL_CONVERSATION:", json.dumps({"wa_id": wa_id, "workspace_id": workspace_id}, ensure_ascii=False))
+        log.debug("DERIVED_PANEL_CONVERSATION", wa_id=wa_id, workspace_id=workspace_id)
         items.append(item)
 
-    items.sort(
-        key=lambda x: (
-            x.get("last_message_at") or "",
-            x.get("last_at") or "",
-            x.get("updated_at") or "",
-            x.get("created_at") or "",
-        ),
-        reverse=True,
-    )
-    print(f"list_conversations:final total={len(items)}")
+    items.sort(key=_conversation_sort_key, reverse=True)
+    log.debug("LIST_CONVERSATIONS", part="final", total=len(items))
     return items[:limit]
 
 
+def list_dashboard_rows(limit: int = 5000, workspace_id: str = "") -> List[Dict[str, Any]]:
+    # linhas cruas de whatsapp_users + flow_data do flow state: o mesmo formato que upsert_user devolve ao dashboard
+    workspace_id = _resolve_workspace_id(workspace_id)
+    columns = ",".join(("wa_id", "created_at", *dashboard.ROW_FIELDS))
+    rows: List[Dict[str, Any]] = []
+    for url in (
+        f"{SUPABASE_URL}/rest/v1/{USERS_TABLE}?workspace_id=eq.{workspace_id}&select={columns}&order=last_at.desc.nullslast&limit={limit}",
+        f"{SUPABASE_URL}/rest/v1/{USERS_TABLE}?workspace_id=eq.{workspace_id}&select=*&order=last_at.desc.nullslast&limit={limit}",
+    ):
+        try:
+            r = _get(url)
+            if r.status_code == 200:
+                rows = r.json() or []
+                break
+        except Exception:
+            continue
+
+    flows: Dict[str, Any] = {}
+    try:
+        r = _get(f"{SUPABASE_URL}/rest/v1/{FLOW_TABLE}?workspace_id=eq.{workspace_id}&select=wa_id,flow_data&limit={limit}")
+        if r.status_code == 200:
+            flows = {normalize_wa_id(row.get("wa_id")): row.get("flow_data") for row in (r.json() or [])}
+    except Exception:
+        flows = {}
+
+    for row in rows:
+        flow_data = flows.get(normalize_wa_id(row.get("wa_id")))
+        if flow_data is not None:
+            row["flow_data"] = _safe_json(flow_data, {})
+    return rows
+
+
+def list_message_events(since_iso: str, limit: int = 50000, workspace_id: str = "") -> List[Dict[str, Any]]:
+    # só created_at/direction, paginado (o PostgREST corta em max-rows por resposta)
+    workspace_id = _resolve_workspace_id(workspace_id)
+    since = urllib.parse.quote(since_iso)
+    events: List[Dict[str, Any]] = []
+    page = 1000
+    while len(events) < limit:
+        size = min(page, limit - len(events))
+        url = (
+            f"{SUPABASE_URL}/rest/v1/{MESSAGES_TABLE}?workspace_id=eq.{workspace_id}&created_at=gte.{since}"
+            f"&select=created_at,direction&order=created_at.desc&limit={size}&offset={len(events)}"
+        )
+        try:
+            r = _get(url)
+        except Exception:
+            break
+        if r.status_code != 200:
+            break
+        rows = r.json() or []
+        events.extend(rows)
+        if len(rows) < size:
+            break
+    return events
+
+
+def invalidate_conversation_snapshot(workspace_id: str = "") -> None:
+    keys = [_resolve_workspace_id(workspace_id)] if workspace_id else list(_SNAPSHOTS.keys())
+    with _SNAPSHOT_STORE_LOCK:
+        for key in keys:
+            _SNAPSHOT_VERSIONS[key] = _SNAPSHOT_VERSIONS.get(key, 0) + 1
+            _SNAPSHOTS.pop(key, None)
+
+
+# colunas que list_conversations devolve já decodificadas
+_SNAPSHOT_JSON_FIELDS = frozenset({"welcome_summary", "briefing_summary", "diagnosis_summary", "respostas_completas", "flow_data"})
+
+
+def _patched_snapshot_item(item: Dict[str, Any], row: Dict[str, Any]) -> Dict[str, Any]:
+    # mesma regra de list_conversations: valor vazio não apaga o que a listagem já tinha
+    patched = dict(item)
+    for key, value in row.items():
+        if key in {"wa_id", "workspace_id"} or key not in item or not _has_value(value):
+            continue
+        if key == "tags":
+            value = _normalize_tags(value)
+        elif key in _SNAPSHOT_JSON_FIELDS:
+            value = _safe_json(value, {})
+        elif isinstance(item.get(key), bool):
+            value = bool(value)
+        patched[key] = value
+    if row.get("assigned_to") or row.get("owner"):
+        patched["assigned_to"] = row.get("assigned_to") or row.get("owner")
+    last_at = str(row.get("last_at") or "")
+    if last_at and last_at >= str(item.get("last_message_at") or ""):
+        patched["last_message"] = row.get("last_text") or row.get("last_message") or patched.get("last_message") or ""
+        patched["last_message_at"] = last_at
+        patched["updated_at"] = last_at
+        if last_at == row.get("last_in_at"):
+            patched["last_message_dir"] = "in"
+        elif last_at == row.get("last_out_at"):
+            patched["last_message_dir"] = "out"
+    return patched
+
+
+def patch_conversation_snapshot(workspace_id: str, row: Optional[Dict[str, Any]]) -> None:
+    # escrita numa conversa já listada atualiza só a linha dela; conversa nova muda a lista e descarta o snapshot
+    workspace_id = _resolve_workspace_id(workspace_id)
+    wa_id = normalize_wa_id((row or {}).get("wa_id"))
+    with _SNAPSHOT_STORE_LOCK:
+        # rebuild em andamento leu o banco antes desta escrita: não pode ser publicado
+        _SNAPSHOT_VERSIONS[workspace_id] = _SNAPSHOT_VERSIONS.get(workspace_id, 0) + 1
+        snapshot = _SNAPSHOTS.get(workspace_id)
+        item = (snapshot["by_wa_id"].get(wa_id) if snapshot and wa_id else None)
+        if item is None:
+            _SNAPSHOTS.pop(workspace_id, None)
+            return
+        enrich = snapshot.get("enrich")
+        patched = _patched_snapshot_item(item, row or {})
+        if enrich:
+            patched = enrich(patched)
+        items = [patched if entry is item else entry for entry in snapshot["items"]]
+        items.sort(key=_conversation_sort_key, reverse=True)
+        _SNAPSHOTS[workspace_id] = _index_snapshot(workspace_id, items, enrich, snapshot.get("owner_of"), snapshot["built_at"])
+    log.debug("CONVERSATION_SNAPSHOT", mode="patched", workspace_id=workspace_id, wa_id=wa_id)
+
+
+def _index_snapshot(
+    workspace_id: str,
+    items: List[Dict[str, Any]],
+    enrich: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]],
+    owner_of: Optional[Callable[[Dict[str, Any]], str]],
+    built_at: float,
+) -> Dict[str, Any]:
+    by_wa_id: Dict[str, Dict[str, Any]] = {}
+    owners: Dict[str, List[int]] = {}
+    unowned: List[int] = []
+    for index, item in enumerate(items):
+        wa_id = normalize_wa_id(item.get("wa_id"))
+        if wa_id and wa_id not in by_wa_id:
+            by_wa_id[wa_id] = item
+        owner = ((owner_of(item) if owner_of else item.get("assigned_to")) or "").strip().lower()
+        if owner:
+            owners.setdefault(owner, []).append(index)
+        else:
+            unowned.append(index)
+
+    return {
+        "workspace_id": workspace_id,
+        "items": items,
+        "by_wa_id": by_wa_id,
+        "owners": owners,
+        "unowned": unowned,
+        "built_at": built_at,
+        # patch_conversation_snapshot reaplica os mesmos callbacks na linha alterada
+        "enrich": enrich,
+        "owner_of": owner_of,
+    }
+
+
+def _snapshot_lock(workspace_id: str) -> threading.Lock:
+    with _SNAPSHOT_LOCKS_GUARD:
+        lock = _SNAPSHOT_LOCKS.get(workspace_id)
+        if lock is None:
+            lock = _SNAPSHOT_LOCKS[workspace_id] = threading.Lock()
+        return lock
+
+
+def _snapshot_is_fresh(snapshot: Optional[Dict[str, Any]]) -> bool:
+    return bool(snapshot) and (time.monotonic() - snapshot["built_at"]) < CONVERSATION_SNAPSHOT_TTL_SECONDS
+
+
+def get_conversation_owner(wa_id: str, workspace_id: str = "") -> Optional[Dict[str, Any]]:
+    # leitura direta (sem snapshot nem coalescing): atribuição feita em outro worker vale na hora
+    wa_id = normalize_wa_id(wa_id)
+    workspace_id = _resolve_workspace_id(workspace_id)
+    if not SUPABASE_URL or not wa_id:
+        return None
+    url = (
+        f"{SUPABASE_URL}/rest/v1/{USERS_TABLE}?workspace_id=eq.{workspace_id}&wa_id=eq.{wa_id}"
+        "&select=assigned_to,human_owner,owner&limit=1"
+    )
+    try:
+        r = _CLIENT.get(url, headers=_headers())
+        if r.status_code == 200:
+            rows = r.json() or []
+            return rows[0] if rows else {}
+    except Exception as e:
+        log.error("CONVERSATION_OWNER_ERROR", wa_id=wa_id, workspace_id=workspace_id, error=repr(e))
+    return None
+
+
+def get_conversation_snapshot(
+    workspace_id: str = "",
+    *,
+    enrich: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+    owner_of: Optional[Callable[[Dict[str, Any]], str]] = None,
+) -> Dict[str, Any]:
+    workspace_id = _resolve_workspace_id(workspace_id)
+    snapshot = _SNAPSHOTS.get(workspace_id)
+    if _snapshot_is_fresh(snapshot):
+        return snapshot
+
+    with _snapshot_lock(workspace_id):
+        snapshot = _SNAPSHOTS.get(workspace_id)
+        if _snapshot_is_fresh(snapshot):
+            log.debug("CONVERSATION_SNAPSHOT", mode="shared", workspace_id=workspace_id, total=len(snapshot["items"]))
+            return snapshot
+
+        version = _SNAPSHOT_VERSIONS.get(workspace_id, 0)
+        started = time.monotonic()
+        items = list_conversations(limit=CONVERSATION_SNAPSHOT_LIMIT, workspace_id=workspace_id) or []
+        if enrich:
+            items = [enrich(item) for item in items]
+
+        snapshot = _index_snapshot(workspace_id, items, enrich, owner_of, time.monotonic())
+        with _SNAPSHOT_STORE_LOCK:
+            if _SNAPSHOT_VERSIONS.get(workspace_id, 0) == version:
+                _SNAPSHOTS[workspace_id] = snapshot
+        log.info(
+            "CONVERSATION_SNAPSHOT",
+            mode="rebuilt",
+            workspace_id=workspace_id,
+            total=len(items),
+            owners=len(snapshot["owners"]),
+            ms=int((time.monotonic() - started) * 1000),
+        )
+        return snapshot
+
+
 def create_task(wa_id: str, title: str, due_at_iso: str, workspace_id: str = "") -> Dict[str, Any]:
     wa_id = normalize_wa_id(wa_id)
     title = (title or "").strip()
@@ -1112,8 +1444,10 @@ def create_task(wa_id: str, title: str, due_at_iso: str, workspace_id: str = "")
         r = _post(url, payload, prefer="return=representation")
         if _looks_like_missing_workspace(r.status_code, r.text):
             r = _post(url, legacy_payload, prefer="return=representation")
+        invalidate_conversation_snapshot(workspace_id)
         if r.status_code in (200, 201):
             rows = r.json() or []
+            dashboard.observe_task(workspace_id, rows[0] if rows else payload)
             return rows[0] if rows else payload
         return {"_error": r.text, **payload}
     except Exception as e:
@@ -1164,6 +1498,9 @@ def done_task(task_id: str, workspace_id: str = "") -> Dict[str, Any]:
         r = _patch(url, payload, prefer="return=representation")
         if _looks_like_missing_workspace(r.status_code, r.text):
             r = _patch(legacy_url, payload, prefer="return=representation")
+        invalidate_conversation_snapshot(workspace_id)
+        if r.status_code in (200, 201, 204):
+            dashboard.observe_task(workspace_id, {**payload, "id": task_id})
         if r.status_code in (200, 201):
             rows = r.json() or []
             return {"ok": True, "item": (rows[0] if rows else payload)}
@@ -1194,6 +1531,9 @@ def update_task(task_id: str, workspace_id: str = "", **fields) -> Dict[str, Any
         r = _patch(url, payload, prefer="return=representation")
         if _looks_like_missing_workspace(r.status_code, r.text):
             r = _patch(legacy_url, payload, prefer="return=representation")
+        invalidate_conversation_snapshot(workspace_id)
+        if r.status_code in (200, 201, 204):
+            dashboard.observe_task(workspace_id, {**payload, "id": task_id})
         if r.status_code in (200, 201):
             rows = r.json() or []
             return {"ok": True, "item": (rows[0] if rows else payload)}
@@ -1204,6 +1544,7 @@ def update_task(task_id: str, workspace_id: str = "", **fields) -> Dict[str, Any
         return {"ok": False, "error": str(e)}
 
 
+@traced("flow_load")
 def get_flow(wa_id: str, workspace_id: str = "") -> Dict[str, Any]:
     wa_id = (wa_id or "").strip()
     workspace_id = _resolve_workspace_id(workspace_id)
@@ -1256,6 +1597,7 @@ def set_flow_state(wa_id: str, state: Optional[str], workspace_id: str = ""):
                 r = _patch(next_url, payload, prefer="return=representation")
                 if r.status_code in (200, 201, 204):
                     break
+        invalidate_conversation_snapshot(workspace_id)
         if r.status_code in (200, 201):
             rows = r.json() or []
             return {"ok": True, "item": (rows[0] if rows else payload)}
@@ -1266,6 +1608,7 @@ def set_flow_state(wa_id: str, state: Optional[str], workspace_id: str = ""):
         return {"ok": False, "error": str(e)}
 
 
+@traced("flow_save")
 def merge_flow_data(wa_id: str, patch: Dict[str, Any], workspace_id: str = ""):
     flow = get_flow(wa_id, workspace_id=workspace_id)
     data = flow.get("data") or {}
@@ -1273,7 +1616,10 @@ def merge_flow_data(wa_id: str, patch: Dict[str, Any], workspace_id: str = ""):
         data = {}
     if patch and isinstance(patch, dict):
         data.update(patch)
-    return upsert_user(wa_id, workspace_id=workspace_id, flow_data=data)
+    result = upsert_user(wa_id, workspace_id=workspace_id, flow_data=data)
+    if isinstance(patch, dict) and "bot_status" in patch:
+        dashboard.observe_conversation(_resolve_workspace_id(workspace_id), {"wa_id": normalize_wa_id(wa_id), "flow_data": data})
+    return result
 
 
 def clear_flow(wa_id: str, workspace_id: str = ""):
@@ -1295,6 +1641,8 @@ def clear_flow(wa_id: str, workspace_id: str = ""):
                 r = _patch(next_url, payload, prefer="return=representation")
                 if r.status_code in (200, 201, 204):
                     break
+        invalidate_conversation_snapshot(workspace_id)
+        dashboard.observe_conversation(workspace_id, {"wa_id": normalize_wa_id(wa_id), "flow_data": {}})
         if r.status_code in (200, 201):
             rows = r.json() or []
             return {"ok": True, "item": (rows[0] if rows else payload)}
@@ -0,0 +1,241 @@
+import os
+import json
+import time
+import random
+import inspect
+import threading
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from services import log
+
+# tempos por estágio de cada mensagem inbound (um trace por cid) agregados em histogramas por estágio e workspace.
+# o estágio soma o tempo inclusivo de todas as chamadas dele na mensagem; fora de um trace nada é medido
+
+TRACE_BUCKETS_SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TRACE_MAX_SPANS = 200
+TRACE_SLOW_MS = int((os.getenv("TRACE_SLOW_MS") or "0").strip() or 0)
+TRACE_SLOW_SAMPLE_RATE = float((os.getenv("TRACE_SLOW_SAMPLE_RATE") or "1").strip() or 1)
+TRACE_SLOW_FILE = Path(
+    (os.getenv("TRACE_SLOW_FILE") or "").strip()
+    or (Path(__file__).resolve().parents[1] / "data" / "slow_traces.jsonl")
+)
+TRACE_SLOW_MAX_MB = float((os.getenv("TRACE_SLOW_MAX_MB") or "20").strip() or 20)
+
+_CURRENT: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar("trace", default=None)
+_LOCK = threading.Lock()
+_FILE_LOCK = threading.Lock()
+_HISTOGRAMS: Dict[Tuple[str, str], List[Any]] = {}
+_STATS: Dict[str, int] = {"traces": 0, "slow_traces": 0, "slow_written": 0, "slow_write_errors": 0}
+
+
+def _observe(stage: str, workspace_id: str, seconds: float) -> None:
+    key = (stage, workspace_id or "default")
+    with _LOCK:
+        entry = _HISTOGRAMS.get(key)
+        if entry is None:
+            entry = _HISTOGRAMS[key] = [[0] * len(TRACE_BUCKETS_SECONDS), 0.0, 0]
+        for index, bound in enumerate(TRACE_BUCKETS_SECONDS):
+            if seconds <= bound:
+                entry[0][index] += 1
+                break
+        entry[1] += seconds
+        entry[2] += 1
+
+
+def _close_span(trace: Dict[str, Any], stage: str, started: float) -> None:
+    finished = time.perf_counter()
+    trace["active"].discard(stage)
+    totals = trace["stages"].setdefault(stage, [0.0, 0])
+    totals[0] += finished - started
+    totals[1] += 1
+    if len(trace["spans"]) < TRACE_MAX_SPANS:
+        trace["spans"].append((stage, round((started - trace["started"]) * 1000, 1), round((finished - started) * 1000, 1)))
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    trace = _CURRENT.get()
+    # mesmo estágio aninhado (ex.: upsert_user dentro de upsert_user) conta só o de fora
+    if trace is None or stage in trace["active"]:
+        yield
+        return
+    trace["active"].add(stage)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _close_span(trace, stage, started)
+
+
+def traced(stage: str) -> Callable:
+    def decorator(fn: Callable) -> Callable:
+        if inspect.iscoroutinefunction(fn):
+            @wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                trace = _CURRENT.get()
+                if trace is None or stage in trace["active"]:
+                    return await fn(*args, **kwargs)
+                trace["active"].add(stage)
+                started = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    _close_span(trace, stage, started)
+
+            return async_wrapper
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            trace = _CURRENT.get()
+            if trace is None or stage in trace["active"]:
+                return fn(*args, **kwargs)
+            trace["active"].add(stage)
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _close_span(trace, stage, started)
+
+        return wrapper
+
+    return decorator
+
+
+def set_workspace(workspace_id: str) -> None:
+    trace = _CURRENT.get()
+    if trace is not None and workspace_id:
+        trace["workspace_id"] = workspace_id
+
+
+def _write_slow_trace(record: Dict[str, Any]) -> None:
+    try:
+        with _FILE_LOCK:
+            TRACE_SLOW_FILE.parent.mkdir(parents=True, exist_ok=True)
+            if TRACE_SLOW_FILE.exists() and TRACE_SLOW_FILE.stat().st_size > TRACE_SLOW_MAX_MB * 1024 * 1024:
+                TRACE_SLOW_FILE.replace(TRACE_SLOW_FILE.with_suffix(".jsonl.1"))
+            with TRACE_SLOW_FILE.open("a", encoding="utf-8") as handle:
+                handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+        _STATS["slow_written"] += 1
+    except OSError as exc:
+        _STATS["slow_write_errors"] += 1
+        print(f"TRACE_SLOW_WRITE_ERROR path={TRACE_SLOW_FILE} error={exc!r}")
+
+
+def _finish(trace: Dict[str, Any], root: str) -> None:
+    total = time.perf_counter() - trace["started"]
+    workspace_id = trace["workspace_id"]
+    _observe(root, workspace_id, total)
+    for stage, (seconds, _) in trace["stages"].items():
+        _observe(stage, workspace_id, seconds)
+    _STATS["traces"] += 1
+
+    if not TRACE_SLOW_MS or total * 1000 < TRACE_SLOW_MS:
+        return
+    _STATS["slow_traces"] += 1
+    stages = {stage: {"ms": round(seconds * 1000, 1), "calls": calls} for stage, (seconds, calls) in trace["stages"].items()}
+    slowest = max(stages.items(), key=lambda item: item[1]["ms"], default=("-", {"ms": 0}))
+    log.warning(
+        "SLOW_TRACE",
+        cid=trace["cid"],
+        workspace_id=workspace_id,
+        total_ms=int(total * 1000),
+        slowest=f"{slowest[0]}:{slowest[1]['ms']}ms",
+    )
+    if random.random() < TRACE_SLOW_SAMPLE_RATE:
+        _write_slow_trace(
+            {
+                "cid": trace["cid"],
+                "workspace_id": workspace_id,
+                "root": root,
+                "at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "total_ms": round(total * 1000, 1),
+                "stages": stages,
+                "spans": [{"stage": stage, "start_ms": start, "ms": ms} for stage, start, ms in trace["spans"]],
+            }
+        )
+
+
+@contextmanager
+def trace(cid: str, workspace_id: str = "", root: str = "webhook_total") -> Iterator[Dict[str, Any]]:
+    outer = _CURRENT.get()
+    if outer is not None:
+        yield outer
+        return
+    current = {
+        "cid": cid,
+        "workspace_id": workspace_id,
+        "started": time.perf_counter(),
+        "stages": {},
+        "active": set(),
+        "spans": [],
+    }
+    token = _CURRENT.set(current)
+    try:
+        yield current
+    finally:
+        _CURRENT.reset(token)
+        _finish(current, root)
+
+
+def _labels(**labels: str) -> str:
+    escaped = (
+        f'{name}="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+def render_counter(name: str, help_text: str, label: str, values: Dict[str, Any]) -> str:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+    for key, value in sorted(values.items()):
+        lines.append(f"{name}{_labels(**{label: key})} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def render_histogram(name: str, help_text: str, buckets: Tuple[float, ...], series: Dict[Tuple, Tuple[List[int], float, int]]) -> str:
+    # series: tupla de pares (label, valor) -> (contagem por bucket, soma, total)
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for labels, (counts, total, count) in sorted(series.items()):
+        base = dict(labels)
+        cumulative = 0
+        for bound, observed in zip(buckets, counts):
+            cumulative += observed
+            lines.append(f"{name}_bucket{_labels(**base, le=repr(bound))} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(**base, le='+Inf')} {count}")
+        suffix = _labels(**base) if base else ""
+        lines.append(f"{name}_sum{suffix} {total:.6f}")
+        lines.append(f"{name}_count{suffix} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def render_prometheus() -> str:
+    with _LOCK:
+        series = {
+            (("stage", stage), ("workspace", workspace_id)): (list(entry[0]), entry[1], entry[2])
+            for (stage, workspace_id), entry in _HISTOGRAMS.items()
+        }
+    return render_histogram(
+        "mugo_stage_duration_seconds",
+        "Tempo por estágio do pipeline inbound (inclusivo, somado por mensagem).",
+        TRACE_BUCKETS_SECONDS,
+        series,
+    ) + render_counter("mugo_traces_total", "Traces finalizados e traces lentos.", "kind", dict(_STATS))
+
+
+def tracing_stats() -> Dict[str, Any]:
+    with _LOCK:
+        stages = {}
+        for (stage, _), (_, total, count) in _HISTOGRAMS.items():
+            entry = stages.setdefault(stage, {"count": 0, "sum_ms": 0.0})
+            entry["count"] += count
+            entry["sum_ms"] += total * 1000
+    return {
+        **_STATS,
+        "slow_ms": TRACE_SLOW_MS,
+        "slow_file": str(TRACE_SLOW_FILE),
+        "stages": {stage: {**info, "sum_ms": round(info["sum_ms"], 1)} for stage, info in sorted(stages.items())},
+    }
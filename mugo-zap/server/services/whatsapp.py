@@ -4,6 +4,7 @@ import json
 from typing import Any, Dict, List, Union
 
 import requests
+from services.tracing import traced
 
 
 def _clean_number(n: str) -> str:
@@ -25,7 +26,8 @@ PHONE_NUMBER_ID = (
 ).strip()
 
 GRAPH_API_VERSION = (os.getenv("WHATSAPP_GRAPH_VERSION") or "v20.0").strip()
-BASE_URL = f"https://graph.facebook.com/{GRAPH_API_VERSION}/{PHONE_NUMBER_ID}/messages"
+GRAPH_API_BASE_URL = (os.getenv("WHATSAPP_GRAPH_BASE_URL") or "https://graph.facebook.com").strip().rstrip("/")
+BASE_URL = f"{GRAPH_API_BASE_URL}/{GRAPH_API_VERSION}/{PHONE_NUMBER_ID}/messages"
 
 
 def _short(value: Any, limit: int = 500) -> str:
@@ -233,6 +235,7 @@ def _normalize_payload(to_wa_id: str, payload: Union[str, Dict[str, Any]]) -> Di
     return _build_text_payload(to_wa_id, text)
 
 
+@traced("send")
 def send_message_detailed(to_wa_id: str, payload: Union[str, Dict[str, Any]], *, raise_for_status: bool = True) -> Dict[str, Any]:
     to_wa_id = _clean_number(to_wa_id)
 
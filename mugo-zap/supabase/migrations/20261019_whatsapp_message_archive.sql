@@ -0,0 +1,19 @@
+begin;
+
+create table if not exists public.whatsapp_message_archive (
+  chunk_id text primary key,
+  workspace_id text not null default 'workspace-mugo-default',
+  wa_id text not null,
+  month text not null,
+  first_at timestamptz,
+  last_at timestamptz,
+  message_count integer not null default 0,
+  message_ids text[] not null default '{}',
+  payload text not null,
+  created_at timestamptz not null default timezone('utc', now())
+);
+
+create index if not exists whatsapp_message_archive_wa_id_idx
+  on public.whatsapp_message_archive (workspace_id, wa_id, last_at desc);
+
+commit;